@@ -1,37 +1,175 @@
+import asyncio
+import hashlib
+import json
 import os
-from openai import OpenAI
+import random
+from typing import Dict, List, Optional
+
+import httpx
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
-
-completion = client.chat.completions.create(
-    extra_headers={
-        "HTTP-Referer": "",  # Optional
-        "X-Title": "",       # Optional
-    },
-    model="google/gemma-3-27b-it",
-    messages=[
-        {
-            "role": "system",
-            "content": "You have an extremely important job. You will be passed in assignments (CONVERTED TO TEXT AND USUALLY FOR SCHOOL) and YOUR TASK is to accurately estimate how long the assigment will take a student in minutes. YOUR OUTPUT FORMAT SHOULD JUST BE A NUMBER (in minutes) of how long the assigment would take. If the media provided does not look like an assignment output 'ASSIGNMENT NOT DETECTED'. You may recieve custom instructions about the assingment such as, the student has to only do even problems which may effect your time estimation "
-        },
-        {
-            "role": "user",
-            "content": (
-                "ASSIGNMENT:\n"
-                "English 10-H Group Analytical Report- Chapters 1-9 of The Catcher in the Rye Each group must submit one polished analytical document (approximately 1.5–2 pages, Times New Roman, size 12, double-spaced). Be sure all names (first and last) are included on the document. Required Structure I. Narrator Overview Begin with a concise paragraph answering: Who Holden appears to be What situation he is in Why he is telling this story now (what you think his motivation is of telling this story and at this time) This paragraph must include direct textual evidence for each point you make. This evidence can come from anywhere in the first nine chapters. II. What Holden Tells Us vs. What the Text Reveals Choose a passage from any of the first nine chapters, then create either a two-column chart or paragraph-based analysis that discusses: What Holden explicitly claims in this passage What the language and structure imply instead In other words, explain what he is telling us indirectly and how he does so. Focus on a passage that includes at least 2 of the following: Family School Authority figures Peers III. Style and Its Consequences Then, write an analytical paragraph addressing: How diction, syntax, and tone shape reader perception (with examples from the text) How the informal voice both builds trust and invites skepticism (again, with examples) Why a more “formal” narrator would change the novel entirely IV. Reader Responsibility Then, write a final reflective section answering: What must a careful reader do to avoid being trapped inside Holden’s perspective? This should address: Bias Limited perspective Emotional manipulation The difference between empathy and endorsement Assessment Criteria Your work will be evaluated on: Depth of inference Use of textual evidence Ability to separate narrator from author Rhetorical awareness of voice and style Quality of collaboration and synthesis \n"
-                "CUSTOM INSTRUCTIONS:\n"
-                "Only have to do the first question."
+# Any server speaking the OpenAI chat-completions protocol works here,
+# including a local stub for testing.
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_CONCURRENCY_PER_MODEL = int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when a completion could not be obtained from the upstream API."""
+
+
+class LLMClient:
+    """
+    Async chat-completions client sharing one HTTP connection pool.
+
+    Calls are limited by a global and a per-model semaphore, retried with
+    jittered exponential backoff on 429/5xx and network errors, and identical
+    requests that are already in flight share a single upstream call.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OPENROUTER_BASE_URL,
+        api_key: Optional[str] = None,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_concurrency_per_model: int = LLM_MAX_CONCURRENCY_PER_MODEL,
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url
+        self.api_key = api_key if api_key is not None else os.getenv("OPENROUTER_API_KEY")
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_model = max_concurrency_per_model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._model_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+        self.retries = 0
+
+    def _get_http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "HTTP-Referer": "",  # Optional
+                    "X-Title": "",       # Optional
+                },
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                timeout=self.timeout,
+                transport=self._transport,
             )
+        return self._http
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_semaphores:
+            self._model_semaphores[model] = asyncio.Semaphore(self.max_concurrency_per_model)
+        return self._model_semaphores[model]
+
+    async def chat(self, model: str, messages: List[dict], timeout: Optional[float] = None, **params) -> str:
+        """Returns the content of the first choice of a chat completion."""
+        body = {"model": model, "messages": messages, **params}
+        key = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._complete(body, timeout or self.timeout))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield so one caller going away does not cancel the shared call
+        return await asyncio.shield(task)
+
+    async def _complete(self, body: dict, timeout: float) -> str:
+        attempt = 0
+        while True:
+            retry_after = None
+            # Slots are held for each attempt only, so calls backing off do not starve the rest
+            async with self._semaphore, self._model_semaphore(body["model"]):
+                try:
+                    response = await self._get_http().post("/chat/completions", json=body, timeout=timeout)
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        return response.json()["choices"][0]["message"]["content"]
+                    error = LLMError(f"Upstream returned {response.status_code}")
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                except httpx.HTTPStatusError as exc:
+                    raise LLMError(f"Upstream returned {exc.response.status_code}") from exc
+                except (httpx.TimeoutException, httpx.TransportError) as exc:
+                    error = LLMError(f"Upstream request failed: {exc!r}")
+                except (ValueError, KeyError, IndexError) as exc:
+                    raise LLMError("Malformed completion response") from exc
+
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            self.retries += 1
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            await asyncio.sleep(max(delay, retry_after or 0))
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "retries": self.retries,
         }
 
-    ]
-)
 
-# Correct way to access the text response
-print(completion.choices[0].message.content)
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return min(float(value), LLM_BACKOFF_MAX) if value is not None else None
+    except ValueError:
+        return None
+
+
+client = LLMClient()
+
+
+if __name__ == "__main__":
+    # Quick manual check against the configured endpoint
+    async def main():
+        content = await client.chat(
+            model="google/gemma-3-27b-it",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You have an extremely important job. You will be passed in assignments (CONVERTED TO TEXT AND USUALLY FOR SCHOOL) and YOUR TASK is to accurately estimate how long the assigment will take a student in minutes. YOUR OUTPUT FORMAT SHOULD JUST BE A NUMBER (in minutes) of how long the assigment would take. If the media provided does not look like an assignment output 'ASSIGNMENT NOT DETECTED'. You may recieve custom instructions about the assingment such as, the student has to only do even problems which may effect your time estimation "
+                },
+                {
+                    "role": "user",
+                    "content": (
+                        "ASSIGNMENT:\n"
+                        "English 10-H Group Analytical Report- Chapters 1-9 of The Catcher in the Rye Each group must submit one polished analytical document (approximately 1.5–2 pages, Times New Roman, size 12, double-spaced). Be sure all names (first and last) are included on the document. Required Structure I. Narrator Overview Begin with a concise paragraph answering: Who Holden appears to be What situation he is in Why he is telling this story now (what you think his motivation is of telling this story and at this time) This paragraph must include direct textual evidence for each point you make. This evidence can come from anywhere in the first nine chapters. II. What Holden Tells Us vs. What the Text Reveals Choose a passage from any of the first nine chapters, then create either a two-column chart or paragraph-based analysis that discusses: What Holden explicitly claims in this passage What the language and structure imply instead In other words, explain what he is telling us indirectly and how he does so. Focus on a passage that includes at least 2 of the following: Family School Authority figures Peers III. Style and Its Consequences Then, write an analytical paragraph addressing: How diction, syntax, and tone shape reader perception (with examples from the text) How the informal voice both builds trust and invites skepticism (again, with examples) Why a more “formal” narrator would change the novel entirely IV. Reader Responsibility Then, write a final reflective section answering: What must a careful reader do to avoid being trapped inside Holden’s perspective? This should address: Bias Limited perspective Emotional manipulation The difference between empathy and endorsement Assessment Criteria Your work will be evaluated on: Depth of inference Use of textual evidence Ability to separate narrator from author Rhetorical awareness of voice and style Quality of collaboration and synthesis \n"
+                        "CUSTOM INSTRUCTIONS:\n"
+                        "Only have to do the first question."
+                    )
+                }
+            ]
+        )
+        print(content)
+        await client.aclose()
+
+    asyncio.run(main())
@@ -0,0 +1,217 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# Seconds a request may wait for its user's bucket or the global budget before it is shed.
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+# Requests queued per resource past which new ones are shed immediately.
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# OCR cost is counted in letter pages at 200 dpi. Pages processed at once across
+# the process; defaults to two per OCR worker, enough to keep every worker busy.
+ADMISSION_OCR_BUDGET = float(os.getenv("ADMISSION_OCR_BUDGET", "0")) or 2.0 * (int(os.getenv("OCR_WORKERS", "0")) or os.cpu_count() or 1)
+# Pages per second each user's OCR bucket refills at, and how many it holds. A rate of 0 disables per-user limits.
+ADMISSION_OCR_USER_RATE = float(os.getenv("ADMISSION_OCR_USER_RATE", "0.5"))
+ADMISSION_OCR_USER_BURST = float(os.getenv("ADMISSION_OCR_USER_BURST", "60"))
+# Prompt tokens sent to the model at once across the process.
+ADMISSION_LLM_BUDGET = float(os.getenv("ADMISSION_LLM_BUDGET", "200000"))
+# Prompt tokens per second each user's LLM bucket refills at, and how many it holds.
+ADMISSION_LLM_USER_RATE = float(os.getenv("ADMISSION_LLM_USER_RATE", "500"))
+ADMISSION_LLM_USER_BURST = float(os.getenv("ADMISSION_LLM_USER_BURST", "60000"))
+
+# Buckets of users idle long enough to have refilled are dropped past this many
+_MAX_BUCKETS = 10000
+# Weight of the newest observation in the seconds-per-unit moving average
+_SMOOTHING = 0.2
+
+
+class Shed(Exception):
+    """Raised when a request is refused instead of queued; `retry_after` is in seconds."""
+
+    def __init__(self, resource: str, reason: str, retry_after: float):
+        super().__init__(f"{resource} is over capacity ({reason})")
+        self.resource = resource
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Limiter:
+    """
+    Admission control for one expensive resource, with costs in its own unit.
+
+    A request first draws its cost from its user's token bucket, which refills
+    at `user_rate` up to `user_burst`, and then waits until the cost fits in
+    the global `budget` of work running at once. Waiting is FIFO and brief:
+    a request that would wait longer than `max_wait`, by the bucket's refill
+    time or by the queue ahead of it draining, is shed with Shed instead.
+
+    The queue's drain time is predicted from the observed seconds each unit of
+    cost holds the budget, so Retry-After tracks the live queue depth.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        budget: float,
+        user_rate: float,
+        user_burst: float,
+        seconds_per_unit: float,
+        max_wait: float = ADMISSION_MAX_WAIT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+    ):
+        self.name = name
+        self.budget = float(budget)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.seconds_per_unit = seconds_per_unit
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.in_flight = 0.0
+        self.queued_cost = 0.0
+        self._waiters: Deque[Tuple[float, asyncio.Future]] = deque()
+        # owner id -> (tokens, monotonic time they were counted)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    # --- Per-user buckets ---
+    def _tokens(self, owner_id: str, now: float) -> float:
+        tokens, updated = self._buckets.get(owner_id, (self.user_burst, now))
+        return min(self.user_burst, tokens + (now - updated) * self.user_rate)
+
+    def _reserve(self, owner_id: Optional[str], cost: float, shed: bool) -> Tuple[float, float]:
+        """Takes `cost` from the user's bucket, possibly into debt. Returns the amount taken and the seconds to wait."""
+        if owner_id is None or self.user_rate <= 0:
+            return 0.0, 0.0
+        now = time.monotonic()
+        tokens = self._tokens(owner_id, now)
+        # A request larger than the whole bucket still gets through once the bucket is full
+        taken = min(cost, self.user_burst)
+        wait = max(0.0, taken - tokens) / self.user_rate
+        if shed and wait > self.max_wait:
+            raise self._shed(owner_id, "user", wait)
+        if len(self._buckets) >= _MAX_BUCKETS:
+            self._prune(now)
+        self._buckets[owner_id] = (tokens - taken, now)
+        return taken, wait
+
+    def _refund(self, owner_id: Optional[str], amount: float):
+        if amount:
+            now = time.monotonic()
+            self._buckets[owner_id] = (min(self.user_burst, self._tokens(owner_id, now) + amount), now)
+
+    def _prune(self, now: float):
+        for owner_id in [o for o in self._buckets if self._tokens(o, now) >= self.user_burst]:
+            del self._buckets[owner_id]
+
+    # --- Global budget ---
+    def expected_wait(self, cost: float) -> float:
+        """Seconds until `cost` more would fit, if the queue drains at the observed rate."""
+        backlog = self.in_flight + self.queued_cost + cost - self.budget
+        return max(0.0, backlog) * self.seconds_per_unit / self.budget
+
+    def _wake(self):
+        while self._waiters:
+            cost, future = self._waiters[0]
+            if self.in_flight + cost > self.budget:
+                return
+            self._waiters.popleft()
+            self.queued_cost -= cost
+            if not future.done():
+                self.in_flight += cost
+                future.set_result(None)
+
+    async def _acquire(self, owner_id: Optional[str], cost: float, timeout: Optional[float]):
+        if not self._waiters and self.in_flight + cost <= self.budget:
+            self.in_flight += cost
+            return
+        if timeout is not None:
+            expected = self.expected_wait(cost)
+            if len(self._waiters) >= self.max_queue or expected > timeout:
+                raise self._shed(owner_id, "queue", expected)
+
+        entry = (cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(entry)
+        self.queued_cost += cost
+        future = entry[1]
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException as error:
+            if future.done() and not future.cancelled():
+                # Admitted just as the wait ended
+                self._release(cost, None)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                self.queued_cost -= cost
+                # Whoever queued behind this request may fit now
+                self._wake()
+            if isinstance(error, asyncio.TimeoutError):
+                raise self._shed(owner_id, "timeout", self.expected_wait(cost))
+            raise
+
+    def _release(self, cost: float, seconds: Optional[float]):
+        self.in_flight -= cost
+        if seconds is not None and cost > 0:
+            self.seconds_per_unit += _SMOOTHING * (seconds / cost - self.seconds_per_unit)
+        self._wake()
+
+    # --- Admission ---
+    def _shed(self, owner_id: Optional[str], reason: str, retry_after: float) -> Shed:
+        metrics.admission_shed_total.inc(resource=self.name, reason=reason)
+        return Shed(self.name, reason, retry_after)
+
+    @asynccontextmanager
+    async def admit(self, owner_id: Optional[str], cost: float, shed: bool = True):
+        """
+        Holds `cost` of the global budget, charged to `owner_id`'s bucket,
+        while the block runs. Without an owner only the global budget applies.
+        With `shed=False` the request waits as long as it takes instead, for
+        background work that has already been accepted.
+
+        Raises:
+            Shed: The user's bucket or the queue would take too long.
+        """
+        # Capped so a request larger than the budget can still run on its own
+        cost = min(max(float(cost), 0.0), self.budget)
+        started = time.monotonic()
+        taken, wait = self._reserve(owner_id, cost, shed)
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            await self._acquire(owner_id, cost, max(0.0, self.max_wait - wait) if shed else None)
+        except BaseException:
+            self._refund(owner_id, taken)
+            raise
+        admitted = time.monotonic()
+        metrics.admission_wait_seconds.observe(admitted - started, resource=self.name)
+        metrics.admission_cost_total.inc(cost, resource=self.name)
+        try:
+            yield
+        finally:
+            self._release(cost, time.monotonic() - admitted)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "budget": self.budget,
+            "queued": len(self._waiters),
+            "queued_cost": self.queued_cost,
+            "seconds_per_unit": self.seconds_per_unit,
+            "tracked_users": len(self._buckets),
+        }
+
+
+# Starting guesses for the drain rate, replaced by measurements as requests finish
+ocr = Limiter("ocr", ADMISSION_OCR_BUDGET, ADMISSION_OCR_USER_RATE, ADMISSION_OCR_USER_BURST, seconds_per_unit=2.0)
+llm = Limiter("llm", ADMISSION_LLM_BUDGET, ADMISSION_LLM_USER_RATE, ADMISSION_LLM_USER_BURST, seconds_per_unit=0.001)
+
+
+def stats() -> dict:
+    return {"ocr": ocr.stats(), "llm": llm.stats()}
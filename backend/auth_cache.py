@@ -0,0 +1,86 @@
+import hashlib
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+import models
+from cache import LRUCache
+
+load_dotenv()
+
+# Upper bounds on how long a verified token or a loaded user is trusted
+# without going back to jwt.decode / the database.
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "300"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+tokens = LRUCache("auth_tokens", max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_TOKEN_CACHE_TTL)
+users = LRUCache("auth_users", max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_USER_CACHE_TTL)
+
+# Session.info key collecting the users a transaction changed or deleted
+_PENDING = "auth_cache_users"
+
+
+def _token_key(token: str, secret: str) -> str:
+    # The secret is part of the key, so a payload verified under a replaced secret is never served
+    return hashlib.sha256(f"{secret}\x00{token}".encode()).hexdigest()
+
+
+def get_token_payload(token: str, secret: str) -> Optional[dict]:
+    return tokens.get(_token_key(token, secret))
+
+
+def set_token_payload(token: str, payload: dict, secret: str):
+    """Caches a payload verified with `secret`, never past the token's own expiry."""
+    ttl = AUTH_TOKEN_CACHE_TTL
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = min(ttl, float(exp) - time.time())
+    if ttl > 0:
+        tokens.set(_token_key(token, secret), payload, ttl=ttl)
+
+
+def invalidate_token(token: str, secret: str):
+    """Forgets a verified token, so the next request with it is verified again."""
+    tokens.delete(_token_key(token, secret))
+
+
+def get_user(user_id: str) -> Optional[models.User]:
+    return users.get(user_id)
+
+
+def set_user(user: models.User):
+    users.set(user.id, user)
+
+
+def invalidate_user(user_id: str):
+    """Call after any write to a user row so the next request reloads it."""
+    users.delete(user_id)
+
+
+# --- Invalidation on user writes ---
+# ORM updates and deletes of users invalidate them when they happen, so requests
+# in between reload the row, and again once the transaction commits, so a
+# request that cached the old row before the commit does not keep it.
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_written(mapper, connection, target):
+    invalidate_user(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for user_id in session.info.pop(_PENDING, ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,113 @@
+import hashlib
+import io
+from typing import List
+
+from PIL import Image, ImageDraw, ImageFont
+
+ASSIGNMENT_LINES = [
+    "AP Biology - Unit 4 Problem Set",
+    "Due Friday. Show all work.",
+    "1. Describe the stages of mitosis and draw each one.",
+    "2. Explain how cyclins regulate the cell cycle.",
+    "3. Compare mitosis and meiosis in a short table.",
+    "4. Read pages 210-232 and answer questions 1-12.",
+    "5. Write a one page summary of the lab results.",
+]
+
+
+def assignment_text(pages: int = 1) -> str:
+    return "\n".join(
+        f"Page {page}\n" + "\n".join(ASSIGNMENT_LINES) for page in range(1, pages + 1)
+    )
+
+
+def page_image(page: int = 1, dpi: int = 150) -> Image.Image:
+    """A letter-sized page with 12pt black text on white."""
+    image = Image.new("L", (round(8.5 * dpi), round(11 * dpi)), color=255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=round(12 / 72 * dpi))
+    y = dpi
+    for line in [f"Page {page}"] + ASSIGNMENT_LINES:
+        draw.text((dpi, y), line, fill=0, font=font)
+        y += round(0.3 * dpi)
+    return image
+
+
+def phone_photo(page: int = 1, megapixels: float = 12, skew_degrees: float = 3.0, seed: int = 0) -> Image.Image:
+    """
+    The page as a phone would capture it: about `megapixels` in size, slightly
+    rotated, unevenly lit and noisy.
+    """
+    dpi = round((megapixels * 1e6 / (8.5 * 11)) ** 0.5)
+    image = page_image(page, dpi).rotate(skew_degrees, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+    # Light falls off from left to right, as under a desk lamp
+    shade = Image.linear_gradient("L").rotate(90).resize(image.size).point(lambda v: 150 + v * 105 // 255)
+    image = Image.composite(image, shade, image.point(lambda v: 255 if v < 128 else 0))
+    noise = Image.effect_noise(image.size, 12 + seed % 3)
+    return Image.blend(image, noise, 0.12).convert("RGB")
+
+
+def png(page: int = 1) -> bytes:
+    buffer = io.BytesIO()
+    page_image(page).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def scanned_pdf(pages: int = 3) -> bytes:
+    """A PDF of page images only, so every page has to be OCRed."""
+    images = [page_image(page).convert("RGB") for page in range(1, pages + 1)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:], resolution=150)
+    return buffer.getvalue()
+
+
+def _pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def text_pdf(pages: int = 3) -> bytes:
+    """A PDF with an embedded text layer, so no page needs OCR."""
+    objects: List[bytes] = []
+    page_ids = [3 + 2 * i for i in range(pages)]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    font_id = 3 + 2 * pages
+    for page in range(1, pages + 1):
+        lines = [f"Page {page}"] + ASSIGNMENT_LINES
+        stream = "BT /F1 12 Tf 72 720 Td 16 TL " + " ".join(
+            f"({_pdf_string(line)}) '" for line in lines
+        ) + " ET"
+        content_id = 3 + 2 * (page - 1) + 1
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def unique(file_bytes: bytes, n: int) -> bytes:
+    """
+    Returns a variant of `file_bytes` that hashes differently but decodes to
+    the same document, so each request misses the OCR cache. PNG and PDF
+    readers both ignore bytes after the end marker.
+    """
+    return file_bytes + f"\n%bench-{n}\n".encode()
+
+
+def digest(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()[:12]
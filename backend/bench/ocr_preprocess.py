@@ -0,0 +1,119 @@
+"""
+Compares OCR with and without image preprocessing over fixture pages.
+
+For each fixture the page is OCRed raw and preprocessed; time, pixel count
+and accuracy against the known text are reported, and the run fails if
+preprocessing costs more accuracy than --tolerance allows. Needs the
+tesseract binary unless --preprocess-only is given.
+
+    python -m bench.ocr_preprocess --output ocr_preprocess.json
+"""
+import argparse
+import difflib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+from PIL import Image
+
+import ocr
+import preprocess
+from bench import fixtures
+
+
+def _cases() -> List[Tuple[str, str, Callable[[], Image.Image]]]:
+    """(name, input type, image factory); the input type picks the Tesseract settings."""
+    return [
+        ("clean_scan_150dpi", "pdf", lambda: fixtures.page_image(1, dpi=150)),
+        ("clean_scan_300dpi", "pdf", lambda: fixtures.page_image(1, dpi=300)),
+        ("photo_12mp_straight", "image", lambda: fixtures.phone_photo(1, skew_degrees=0)),
+        ("photo_12mp_skew_2", "image", lambda: fixtures.phone_photo(1, skew_degrees=2)),
+        ("photo_12mp_skew_-4", "image", lambda: fixtures.phone_photo(1, skew_degrees=-4, seed=1)),
+        ("photo_24mp_skew_3", "image", lambda: fixtures.phone_photo(1, megapixels=24, skew_degrees=3, seed=2)),
+    ]
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def accuracy(text: str, expected: str) -> float:
+    """Share of the expected words recovered in order (1.0 is a perfect read)."""
+    return difflib.SequenceMatcher(None, _words(expected), _words(text), autojunk=False).ratio()
+
+
+def _save(image: Image.Image, directory: str) -> str:
+    path = os.path.join(directory, "page.png")
+    image.save(path, format="PNG")
+    return path
+
+
+def run_case(name: str, kind: str, image: Image.Image, options: ocr.PreprocessOptions, ocr_enabled: bool) -> dict:
+    config = ocr.OCR_TESSERACT_CONFIG_PDF if kind == "pdf" else ocr.OCR_TESSERACT_CONFIG_IMAGE
+    started = time.perf_counter()
+    cleaned, dpi = preprocess.preprocess(image, preprocess.estimate_dpi(image), options) if options.steps else (image, None)
+    result = {
+        "case": name,
+        "preprocess": ",".join(options.steps) or "none",
+        "input_pixels": image.width * image.height,
+        "ocr_pixels": cleaned.width * cleaned.height,
+        "preprocess_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    if ocr_enabled:
+        with tempfile.TemporaryDirectory() as directory:
+            text, timings = ocr._ocr_image(_save(image, directory), options, config)
+        result["tesseract_ms"] = round(timings["tesseract"] * 1000, 1)
+        result["total_ms"] = round(sum(timings.values()) * 1000, 1)
+        result["accuracy"] = round(accuracy(text, fixtures.assignment_text(1)), 4)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Largest accuracy drop allowed for any case, as a fraction")
+    parser.add_argument("--preprocess-only", action="store_true", help="Time preprocessing without running Tesseract")
+    parser.add_argument("--output", default="ocr_preprocess_results.json")
+    args = parser.parse_args(argv)
+
+    ocr_enabled = not args.preprocess_only
+    if ocr_enabled:
+        import pytesseract
+
+        try:
+            pytesseract.get_tesseract_version()
+        except pytesseract.TesseractNotFoundError:
+            sys.exit("tesseract is not installed; rerun with --preprocess-only to time preprocessing alone")
+
+    baseline = ocr.PreprocessOptions(steps=())
+    tuned = ocr.PreprocessOptions()
+    results, failures = [], []
+    for name, kind, make in _cases():
+        image = make()
+        raw = run_case(name, kind, image, baseline, ocr_enabled)
+        cleaned = run_case(name, kind, image, tuned, ocr_enabled)
+        results += [raw, cleaned]
+        line = (f"{name:<22} pixels {raw['input_pixels'] / 1e6:5.1f}M -> {cleaned['ocr_pixels'] / 1e6:5.2f}M"
+                f"  preprocess {cleaned['preprocess_ms']:7.1f} ms")
+        if ocr_enabled:
+            speedup = raw["total_ms"] / cleaned["total_ms"] if cleaned["total_ms"] else 0.0
+            drop = raw["accuracy"] - cleaned["accuracy"]
+            line += (f"  ocr {raw['total_ms']:8.1f} -> {cleaned['total_ms']:8.1f} ms ({speedup:4.1f}x)"
+                     f"  accuracy {raw['accuracy']:.3f} -> {cleaned['accuracy']:.3f}")
+            if drop > args.tolerance:
+                failures.append(f"{name}: accuracy dropped by {drop:.3f}")
+        print(line, flush=True)
+
+    with open(args.output, "w") as f:
+        json.dump({"tolerance": args.tolerance, "options": str(tuned), "results": results}, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}")
+    if failures:
+        sys.exit("Accuracy outside tolerance:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Benchmarks Syncora's hot paths against local stand-ins for OCR and the LLM.
+
+Seeds a throwaway database with synthetic users and event histories, then
+drives `main.app` either in-process (ASGI transport) or over HTTP (uvicorn on
+a local port) at several concurrency levels, and writes throughput and
+p50/p95/p99 latency per endpoint to a JSON file.
+
+Run from the backend directory:
+
+    python -m bench.run --mode inprocess --concurrency 1 8 32
+    python -m bench.run --mode http --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench import fixtures
+
+SCENARIOS = ("events", "ocr", "estimate", "upload")
+JWT_SECRET = "bench-secret"
+EPOCH = datetime(2026, 1, 1)
+
+
+# --- Environment ---
+def configure_environment(args) -> str:
+    """Points the app at a throwaway database and the stub LLM; must run before `main` is imported."""
+    workdir = tempfile.mkdtemp(prefix="syncora-bench-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir}/bench.db"
+    os.environ["JOB_UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ["APP_JWT_SECRET"] = JWT_SECRET
+    os.environ["OPENROUTER_API_KEY"] = "bench"
+    return workdir
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_in_thread(app, port: int):
+    """Runs `app` with uvicorn on a background thread and waits until it accepts requests."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def stub_ocr(latency: float):
+    """Replaces Tesseract with a fixed delay; the text depends on the upload so caches behave as with real OCR."""
+    import ocr
+
+    def reference(path: str) -> str:
+        with open(path, "rb") as f:
+            return fixtures.digest(f.read())
+
+    async def ocr_image(self, path: str) -> str:
+        await asyncio.sleep(latency)
+        return f"{fixtures.assignment_text(1)}\nref {reference(path)}"
+
+    async def ocr_pdf(self, path: str) -> str:
+        await asyncio.sleep(latency * 3)
+        return f"{fixtures.assignment_text(3)}\nref {reference(path)}"
+
+    ocr.OCREngine.ocr_image = ocr_image
+    ocr.OCREngine.ocr_pdf = ocr_pdf
+
+
+# --- Synthetic data ---
+async def seed(users: int, events_per_user: int, seed_value: int) -> Dict[str, str]:
+    """Creates the schema and `users` users with `events_per_user` events each; returns user id -> bearer token."""
+    from jose import jwt
+    from sqlalchemy import insert, select
+
+    import models
+    import schemas
+    from database import Base, engine
+    from migrations import run_migrations
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
+
+    rng = random.Random(seed_value)
+    tokens = {}
+    async with engine.begin() as conn:
+        # Users left over from a previous run against the same database keep their events
+        existing = set(await conn.scalars(select(models.User.id).where(models.User.id.like("user_bench%"))))
+        for n in range(users):
+            user_id = f"user_bench{n}"
+            tokens[user_id] = jwt.encode(
+                {"user_id": user_id, "exp": datetime.utcnow() + timedelta(days=1)}, JWT_SECRET, algorithm="HS256"
+            )
+            if user_id in existing:
+                continue
+            await conn.execute(insert(models.User), [{"id": user_id, "email": f"bench{n}@example.com", "google_sub": f"bench{n}"}])
+            rows = []
+            for _ in range(events_per_user):
+                start = EPOCH + timedelta(days=rng.randrange(365), hours=rng.randrange(8, 21))
+                rows.append({
+                    "title": rng.choice(("Class", "Practice", "Study", "Meeting")),
+                    "start_datetime": start,
+                    "end_datetime": start + timedelta(minutes=rng.choice((30, 60, 90))),
+                    "event_type": rng.choice(list(schemas.EventType)),
+                    "owner_id": user_id,
+                })
+            for i in range(0, len(rows), 5000):
+                await conn.execute(insert(models.Event), rows[i:i + 5000])
+    await engine.dispose()
+    return tokens
+
+
+# --- Scenarios ---
+FILES = (
+    ("page.png", "image/png", fixtures.png),
+    ("scanned.pdf", "application/pdf", fixtures.scanned_pdf),
+    ("typed.pdf", "application/pdf", fixtures.text_pdf),
+)
+
+
+class Workload:
+    """Builds the n-th request of each scenario deterministically."""
+
+    def __init__(self, tokens: Dict[str, str], unique_uploads: bool, seed_value: int):
+        self.tokens = list(tokens.values())
+        self.unique_uploads = unique_uploads
+        self.files = [(name, content_type, make()) for name, content_type, make in FILES]
+        self.rng = random.Random(seed_value)
+        self.counter = 0
+
+    def _auth(self, n: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[n % len(self.tokens)]}"}
+
+    def _file(self, n: int) -> dict:
+        name, content_type, data = self.files[n % len(self.files)]
+        self.counter += 1
+        if self.unique_uploads:
+            data = fixtures.unique(data, self.counter)
+        return {"file": (name, data, content_type)}
+
+    def request(self, scenario: str, n: int) -> dict:
+        if scenario == "events":
+            start = EPOCH + timedelta(days=self.rng.randrange(335))
+            return {"method": "GET", "url": "/events", "headers": self._auth(n), "params": {
+                "start": start.isoformat(), "end": (start + timedelta(days=30)).isoformat(), "limit": 200,
+            }}
+        if scenario == "ocr":
+            return {"method": "POST", "url": "/OCR", "headers": self._auth(n), "files": self._file(n)}
+        if scenario == "estimate":
+            return {"method": "POST", "url": "/EstimateTime", "headers": self._auth(n), "files": self._file(n)}
+        if scenario == "upload":
+            return {"method": "POST", "url": "/assignments/upload", "headers": self._auth(n),
+                    "data": {"title": f"Bench {n}", "subject": "Biology"}, "files": self._file(n)}
+        raise ValueError(f"Unknown scenario {scenario!r}")
+
+
+# --- Measurement ---
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+async def run_level(client: httpx.AsyncClient, workload: Workload, scenario: str,
+                    concurrency: int, requests: int, warmup: int) -> dict:
+    for n in range(warmup):
+        await client.request(**workload.request(scenario, n))
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    next_index = iter(range(requests))
+
+    async def worker():
+        for n in next_index:
+            started = time.perf_counter()
+            try:
+                response = await client.request(**workload.request(scenario, n))
+                status = response.status_code
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            latencies.append(time.perf_counter() - started)
+            if not isinstance(status, int) or status >= 400:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+async def run_all(client: httpx.AsyncClient, workload: Workload, args, mode: str) -> List[dict]:
+    results = []
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            result = await run_level(client, workload, scenario, concurrency, args.requests, args.warmup)
+            result["mode"] = mode
+            results.append(result)
+            print(format_row(result), flush=True)
+    return results
+
+
+async def run_inprocess(args, workload: Workload, stub_app) -> List[dict]:
+    import LLM
+    import main
+
+    LLM.client = LLM.LLMClient(base_url="http://llm-stub", transport=httpx.ASGITransport(app=stub_app))
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            return await run_all(client, workload, args, "inprocess")
+
+
+async def run_http(args, workload: Workload, base_url: str) -> List[dict]:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        return await run_all(client, workload, args, "http")
+
+
+# --- Reporting ---
+def format_row(result: dict) -> str:
+    errors = sum(result["errors"].values())
+    return (
+        f"{result['mode']:<9} {result['scenario']:<9} c={result['concurrency']:<4} "
+        f"{result['throughput_rps']:>8.1f} req/s  p50 {result['p50_ms']:>8.1f} ms  "
+        f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  errors {errors}"
+    )
+
+
+def rejected_runs(results: List[dict]) -> List[dict]:
+    """
+    Results where most requests failed with a 4xx other than 429. Those
+    measured a rejection path (say, a missing token) instead of the
+    workload, so their numbers mean nothing; shedding with 429 is expected.
+    """
+    rejected = []
+    for result in results:
+        client_errors = sum(
+            count for status, count in result["errors"].items()
+            if status.isdigit() and 400 <= int(status) < 500 and int(status) != 429
+        )
+        if result["requests"] and client_errors * 2 > result["requests"]:
+            rejected.append(result)
+    return rejected
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: List[dict], baseline_path: str):
+    """Prints the change of each metric against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = {
+            (r["mode"], r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]
+        }
+    print(f"\nChange against {baseline_path} (negative latency change is better):")
+    for result in current:
+        before = baseline.get((result["mode"], result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        deltas = []
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = before[metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            deltas.append(f"{metric} {change:+6.1f}%")
+        print(f"{result['mode']:<9} {result['scenario']:<9} c={result['concurrency']:<4} " + "  ".join(deltas))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=("inprocess", "http", "both"), default="inprocess")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one (http mode)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--events-per-user", type=int, default=5000)
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="Mean stub completion latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--real-ocr", action="store_true", help="Run Tesseract instead of the OCR stand-in")
+    parser.add_argument("--ocr-latency", type=float, default=0.05, help="Stand-in OCR delay per image in seconds")
+    parser.add_argument("--warm-cache", action="store_true", help="Reuse identical uploads so repeated requests hit the caches")
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file in a temporary directory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results file of a previous run to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    from bench.stub_llm import create_app
+
+    stub_app = create_app(args.llm_latency, args.llm_jitter, error_rate=args.llm_error_rate, seed=args.seed)
+    if not args.real_ocr:
+        stub_ocr(args.ocr_latency)
+
+    started = time.perf_counter()
+    tokens = asyncio.run(seed(args.users, args.events_per_user, args.seed))
+    print(f"Seeded {args.users} users x {args.events_per_user} events in {time.perf_counter() - started:.1f}s", flush=True)
+
+    # Shared by both modes so uploads stay unique across them
+    workload = Workload(tokens, not args.warm_cache, args.seed)
+    results = []
+    if args.mode in ("inprocess", "both"):
+        results += asyncio.run(run_inprocess(args, workload, stub_app))
+    if args.mode in ("http", "both"):
+        servers = []
+        base_url = args.url
+        if base_url is None:
+            import LLM
+            import main as app_main
+
+            stub_port, app_port = free_port(), free_port()
+            servers.append(serve_in_thread(stub_app, stub_port))
+            LLM.client = LLM.LLMClient(base_url=f"http://127.0.0.1:{stub_port}")
+            servers.append(serve_in_thread(app_main.app, app_port))
+            base_url = f"http://127.0.0.1:{app_port}"
+        try:
+            results += asyncio.run(run_http(args, workload, base_url))
+        finally:
+            for server, thread in reversed(servers):
+                server.should_exit = True
+                thread.join(timeout=10)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+    rejected = rejected_runs(results)
+    if rejected:
+        for result in rejected:
+            print(f"Most requests were rejected, not served: {format_row(result)} {result['errors']}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
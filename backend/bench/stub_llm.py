@@ -0,0 +1,60 @@
+"""
+Stand-in for the OpenRouter chat-completions endpoint.
+
+Answers every completion with a fixed number of minutes after a configurable
+delay, so estimates can be benchmarked without network access or tokens.
+
+    python -m bench.stub_llm --port 8001 --latency 0.4 --jitter 0.1
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def create_app(latency: float = 0.4, jitter: float = 0.1, minutes: int = 45,
+               error_rate: float = 0.0, seed: int = 0) -> Starlette:
+    """
+    `latency` is the mean delay in seconds, spread uniformly by +-`jitter`.
+    A fraction `error_rate` of calls answers 503 to exercise the client's retries.
+    """
+    rng = random.Random(seed)
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(max(0.0, latency + rng.uniform(-jitter, jitter)))
+        if error_rate and rng.random() < error_rate:
+            return JSONResponse({"error": {"message": "stub overloaded"}}, status_code=503)
+        return JSONResponse({
+            "id": f"stub-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": str(minutes)},
+                "finish_reason": "stop",
+            }],
+        })
+
+    return Starlette(routes=[Route("/chat/completions", chat_completions, methods=["POST"])])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.4)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.latency, args.jitter, error_rate=args.error_rate),
+        host=args.host, port=args.port, log_level="warning",
+    )
@@ -0,0 +1,239 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+
+import models
+from database import SessionLocal
+
+load_dotenv()
+
+# Seconds a persistent entry's last-access time may lag behind before a hit rewrites it.
+# Eviction order is only as precise as this, in exchange for hits that do not write.
+CACHE_TOUCH_INTERVAL = float(os.getenv("CACHE_TOUCH_INTERVAL", "3600"))
+
+# Every named cache registers itself here so its counters can be reported
+registry: Dict[str, Any] = {}
+
+
+def stats() -> Dict[str, dict]:
+    """Returns the counters of every registered cache."""
+    return {name: cache.stats() for name, cache in registry.items()}
+
+
+class LRUCache:
+    """
+    In-process LRU cache bounded by entry count and, optionally, by total size.
+    Entries can also expire after `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = lambda value: len(value),
+        register: bool = True,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if register:
+            registry[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= datetime.utcnow():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl) if ttl is not None else None
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # Too large to ever fit
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PersistentCache:
+    """
+    String cache stored in the `cache_entries` table, one namespace per cache.
+    Once a namespace holds more than `max_rows` entries the least recently
+    used ones are deleted, in batches that leave room for the next few
+    writes. A hit only records its access time when the stored one is older
+    than CACHE_TOUCH_INTERVAL, so most hits are plain reads.
+
+    Rows are not counted on every write: the count is estimated from this
+    process's writes and only taken again every `batch` writes or once the
+    estimate passes `max_rows`. Writes from other processes can therefore
+    overshoot `max_rows` by up to `batch` rows each before they are evicted.
+    """
+
+    def __init__(self, namespace: str, max_rows: int = 10000, ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.batch = max(1, max_rows // 20)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Estimated rows in the namespace, None until first counted
+        self._rows: Optional[int] = None
+        self._writes_since_count = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        async with SessionLocal() as db:
+            entry = await db.get(models.CacheEntry, (self.namespace, key))
+            now = datetime.utcnow()
+            if entry is None or (entry.expires_at is not None and entry.expires_at <= now):
+                self.misses += 1
+                return None
+            if entry.accessed_at <= now - timedelta(seconds=CACHE_TOUCH_INTERVAL):
+                entry.accessed_at = now
+                await db.commit()
+            self.hits += 1
+            return entry.value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = datetime.utcnow()
+        async with SessionLocal() as db:
+            await db.merge(models.CacheEntry(
+                namespace=self.namespace,
+                key=key,
+                value=value,
+                size=len(value),
+                accessed_at=now,
+                expires_at=now + timedelta(seconds=ttl) if ttl is not None else None,
+            ))
+            await db.commit()
+            self._writes_since_count += 1
+            # Overwriting a key is counted as a new row too; the next count corrects it
+            if self._rows is not None:
+                self._rows += 1
+            if self._rows is None or self._rows > self.max_rows or self._writes_since_count >= self.batch:
+                await self._prune(db)
+
+    async def _prune(self, db):
+        count = await db.scalar(
+            select(func.count()).select_from(models.CacheEntry)
+            .where(models.CacheEntry.namespace == self.namespace)
+        )
+        self._rows = count
+        self._writes_since_count = 0
+        if count <= self.max_rows:
+            return
+        overflow = count - self.max_rows + self.batch - 1
+        oldest = select(models.CacheEntry.key).where(
+            models.CacheEntry.namespace == self.namespace
+        ).order_by(models.CacheEntry.accessed_at).limit(overflow)
+        await db.execute(delete(models.CacheEntry).where(
+            models.CacheEntry.namespace == self.namespace,
+            models.CacheEntry.key.in_(oldest),
+        ))
+        await db.commit()
+        self._rows = count - overflow
+        self.evictions += overflow
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class TieredCache:
+    """
+    Two-level cache for string values: an in-process LRU in front of a
+    PersistentCache. Disk hits are promoted into memory.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        max_rows: int = 10000,
+        ttl: Optional[float] = None,
+    ):
+        self.name = name
+        self.memory = LRUCache(name, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, register=False)
+        self.disk = PersistentCache(name, max_rows=max_rows, ttl=ttl)
+        registry[name] = self
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = await self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        await self.disk.set(key, value)
+
+    def stats(self) -> dict:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
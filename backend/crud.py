@@ -1,15 +1,304 @@
-from sqlalchemy.orm import Session
+import base64
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple, Union
 
+from pydantic import ValidationError
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import feed
 import models
+import recurrence
 import schemas
+from cache import LRUCache
+
+
+EVENT = "event"
+ASSIGNMENT = "assignment"
+UPSERT = "upsert"
+DELETE = "delete"
+
+
+async def record_changes(db: AsyncSession, owner_id: str, entity: str, entity_ids: List[int], op: str = UPSERT):
+    """
+    Appends rows to the change log without committing, so the log entry is
+    written in the same transaction as the change itself. Older entries for
+    the same rows are dropped. The owner's change feed is notified on commit.
+    """
+    if not entity_ids:
+        return
+    feed.changed(db, owner_id)
+    await db.execute(delete(models.Change).where(
+        models.Change.entity == entity, models.Change.entity_id.in_(entity_ids)
+    ))
+    await db.execute(insert(models.Change), [
+        {"owner_id": owner_id, "entity": entity, "entity_id": entity_id, "op": op}
+        for entity_id in entity_ids
+    ])
+
+
+async def collection_version(db: AsyncSession, owner_id: str, entity: Optional[str] = None) -> int:
+    """Sequence number of the latest change to a user's collection (any collection if `entity` is None), 0 if none."""
+    query = select(func.max(models.Change.seq)).where(models.Change.owner_id == owner_id)
+    if entity is not None:
+        query = query.where(models.Change.entity == entity)
+    return (await db.scalar(query)) or 0
+
+
+async def sync_changes(db: AsyncSession, owner_id: str, cursor: int) -> dict:
+    """
+    Returns the user's events and assignments changed after `cursor`, the ids
+    of those deleted since, and the cursor to send next time. A cursor of 0,
+    or one past the end of the change log, returns a full snapshot marked
+    with `reset`: the client must replace its local state rather than merge.
+    """
+    latest = (await db.scalar(select(func.max(models.Change.seq)).where(models.Change.owner_id == owner_id))) or 0
+    result = {"cursor": latest, "reset": False, "events": [], "assignments": [], "deleted_events": [], "deleted_assignments": []}
+    tables = {EVENT: models.Event, ASSIGNMENT: models.Assignment}
+
+    # A cursor the log has not reached yet was issued by another database, e.g. one since restored from a backup
+    if cursor <= 0 or cursor > latest:
+        result["reset"] = True
+        for entity, model in tables.items():
+            result[f"{entity}s"] = (await db.scalars(select(model).where(model.owner_id == owner_id))).all()
+        return result
+
+    changes = (await db.execute(
+        select(models.Change.entity, models.Change.entity_id, models.Change.op)
+        .where(models.Change.owner_id == owner_id, models.Change.seq > cursor, models.Change.seq <= latest)
+    )).all()
+    for entity, model in tables.items():
+        upserted = [entity_id for kind, entity_id, op in changes if kind == entity and op == UPSERT]
+        result[f"deleted_{entity}s"] = [entity_id for kind, entity_id, op in changes if kind == entity and op == DELETE]
+        if upserted:
+            result[f"{entity}s"] = (await db.scalars(
+                select(model).where(model.owner_id == owner_id, model.id.in_(upserted))
+            )).all()
+    return result
+
+
+def encode_cursor(event: models.Event) -> str:
+    raw = f"{event.start_datetime.isoformat()}|{event.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError if the cursor is malformed."""
+    start, event_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(start), int(event_id)
+
+
+async def list_events(
+    db: AsyncSession,
+    owner_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+) -> List[Union[models.Event, schemas.Event]]:
+    """
+    Lists a user's events ordered by (start_datetime, id).
+
+    With both `start` and `end`, recurring series are expanded into their
+    occurrences in the window and merged in; each occurrence carries the
+    series' id and its `original_start`. Otherwise series are listed as stored.
+
+    Args:
+        db: The SQLAlchemy database session.
+        owner_id: The user whose events to list.
+        start: Only events ending after this time.
+        end: Only events starting before this time.
+        limit: Maximum number of events to return.
+        after: Keyset cursor; only events sorting after this (start_datetime, id).
+
+    Returns:
+        The matching events, with expanded occurrences as schemas.Event.
+    """
+    expand = start is not None and end is not None
+    query = select(models.Event).where(models.Event.owner_id == owner_id)
+    if expand:
+        query = query.where(models.Event.rrule.is_(None))
+    if start is not None:
+        query = query.where(
+            models.Event.end_datetime > start,
+            models.Event.start_datetime >= start - timedelta(days=schemas.EVENTS_MAX_SPAN_DAYS),
+        )
+    if end is not None:
+        query = query.where(models.Event.start_datetime < end)
+    if after is not None:
+        after_start, after_id = after
+        query = query.where(or_(
+            models.Event.start_datetime > after_start,
+            and_(models.Event.start_datetime == after_start, models.Event.id > after_id),
+        ))
+    query = query.order_by(models.Event.start_datetime, models.Event.id)
+    if limit is not None:
+        query = query.limit(limit)
+    events = (await db.scalars(query)).all()
+    if not expand:
+        return events
+
+    occurrences = [
+        occurrence
+        for series in await db.scalars(select(models.Event).where(
+            models.Event.owner_id == owner_id,
+            models.Event.rrule.is_not(None),
+            models.Event.start_datetime < end,
+        ))
+        for occurrence in series_occurrences(series, start, end)
+        if after is None or (occurrence.start_datetime, occurrence.id) > after
+    ]
+    if not occurrences:
+        return events
+    merged = sorted([*events, *occurrences], key=lambda event: (event.start_datetime, event.id))
+    return merged[:limit] if limit is not None else merged
+
+
+# --- Recurring events ---
+# Series whose recent window expansions are kept in memory.
+RECURRENCE_CACHE_SERIES = int(os.getenv("RECURRENCE_CACHE_SERIES", "4096"))
+# Windows kept per series; a calendar view usually flips between a few weeks or months.
+RECURRENCE_CACHE_WINDOWS = int(os.getenv("RECURRENCE_CACHE_WINDOWS", "8"))
+
+# Per series: (signature, {(start, end): occurrences}) for its most recent windows
+expansions = LRUCache("recurrence", max_entries=RECURRENCE_CACHE_SERIES)
+
+
+def expand_series(series: models.Event, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """
+    Returns the (start, end) of a series' occurrences overlapping [start, end),
+    cached per window. The series' times, rule and exceptions are part of the
+    entry, so an edit made by another worker process is never served stale.
+    """
+    signature = (series.start_datetime, series.end_datetime, series.rrule, tuple(series.exdates or ()))
+    entry = expansions.get(series.id)
+    if entry is None or entry[0] != signature:
+        entry = (signature, OrderedDict())
+        expansions.set(series.id, entry)
+    windows = entry[1]
+    if (start, end) in windows:
+        windows.move_to_end((start, end))
+        return windows[(start, end)]
+    result = list(recurrence.occurrences(
+        series.start_datetime, series.end_datetime, recurrence.parse_rule(series.rrule), start, end, series.exdates or ()
+    ))
+    windows[(start, end)] = result
+    if len(windows) > RECURRENCE_CACHE_WINDOWS:
+        windows.popitem(last=False)
+    return result
 
 
-def get_event(db: Session, event_id: int):
+def invalidate_series(event_id: int):
+    """Drops the cached expansions of a series after it is edited or deleted."""
+    expansions.delete(event_id)
+
+
+def series_occurrences(series: models.Event, start: datetime, end: datetime) -> List[schemas.Event]:
+    occurrences = expand_series(series, start, end)
+    if not occurrences:
+        return []
+    template = schemas.Event.model_validate(series)
+    return [
+        template.model_copy(update={
+            "start_datetime": occurrence_start, "end_datetime": occurrence_end,
+            "series_id": series.id, "original_start": occurrence_start,
+        })
+        for occurrence_start, occurrence_end in occurrences
+    ]
+
+
+# Fields an edited occurrence inherits from its series
+_OCCURRENCE_FIELDS = ("title", "event_type", "subject", "priority", "description", "estimated_minutes", "status")
+
+
+async def edit_occurrence(
+    db: AsyncSession,
+    series: models.Event,
+    original_start: datetime,
+    update_data: Optional[schemas.EventUpdate] = None,
+) -> Optional[models.Event]:
+    """
+    Detaches one occurrence from a recurring series by adding it to the
+    series' exdates. With `update_data` the occurrence is replaced by an event
+    of its own (created from the series, or the existing one updated);
+    without, it is cancelled and any replacement is deleted.
+
+    Args:
+        db: The SQLAlchemy database session.
+        series: The recurring event.
+        original_start: Start of the occurrence as generated by the rule.
+        update_data: Fields that differ from the series, or None to cancel.
+
+    Returns:
+        The event replacing the occurrence, or None if it was cancelled.
+
+    Raises:
+        ValueError: If `original_start` is not an occurrence of the series,
+            the update tries to make the occurrence recur, or it would make
+            the occurrence longer than EVENTS_MAX_SPAN_DAYS.
+    """
+    if not recurrence.is_occurrence(series.start_datetime, recurrence.parse_rule(series.rrule), original_start):
+        raise ValueError("No occurrence of the series starts at that time")
+    fields = update_data.model_dump(exclude_unset=True) if update_data is not None else None
+    if fields and (fields.get("rrule") or fields.get("exdates")):
+        raise ValueError("A single occurrence cannot recur")
+
+    override = await db.scalar(select(models.Event).where(
+        models.Event.series_id == series.id, models.Event.original_start == original_start
+    ))
+    if fields is None:
+        if override is not None:
+            await db.delete(override)
+            await record_changes(db, series.owner_id, EVENT, [override.id], op=DELETE)
+            override = None
+    else:
+        if override is None:
+            override = models.Event(
+                **{name: getattr(series, name) for name in _OCCURRENCE_FIELDS},
+                start_datetime=original_start,
+                end_datetime=original_start + (series.end_datetime - series.start_datetime),
+                owner_id=series.owner_id,
+                series_id=series.id,
+                original_start=original_start,
+            )
+            db.add(override)
+        schemas.check_span(
+            fields.get("start_datetime", override.start_datetime), fields.get("end_datetime", override.end_datetime)
+        )
+        for key, value in fields.items():
+            if key not in ("rrule", "exdates"):
+                setattr(override, key, value)
+        await db.flush()
+        await record_changes(db, series.owner_id, EVENT, [override.id])
+
+    series.exdates = sorted(set(series.exdates or ()) | {original_start})
+    await record_changes(db, series.owner_id, EVENT, [series.id])
+    await db.commit()
+    invalidate_series(series.id)
+    if override is not None:
+        await db.refresh(override)
+    return override
+
+
+async def delete_series_occurrences(db: AsyncSession, owner_id: str, series_ids: List[int]) -> List[int]:
+    """Deletes the edited occurrences of series being deleted, without committing."""
+    for series_id in series_ids:
+        invalidate_series(series_id)
+    deleted = (await db.scalars(
+        delete(models.Event).where(models.Event.series_id.in_(series_ids)).returning(models.Event.id)
+    )).all()
+    await record_changes(db, owner_id, EVENT, deleted, op=DELETE)
+    return deleted
+
+
+async def get_event(db: AsyncSession, event_id: int):
     """Fetches a single event by its ID."""
-    return db.query(models.Event).filter(models.Event.id == event_id).first()
+    return await db.get(models.Event, event_id)
 
 
-def update_event(db: Session, db_event: models.Event, update_data: schemas.EventUpdate) -> models.Event:
+async def update_event(db: AsyncSession, db_event: models.Event, update_data: schemas.EventUpdate) -> models.Event:
     """
     Updates an event record in the database.
 
@@ -20,14 +309,109 @@ def update_event(db: Session, db_event: models.Event, update_data: schemas.Event
 
     Returns:
         The updated event model instance.
+
+    Raises:
+        ValueError: If the event would last longer than EVENTS_MAX_SPAN_DAYS.
     """
     # Get the update data as a dictionary, excluding any fields that were not set.
     # This allows for partial updates (PATCH behavior).
     update_dict = update_data.model_dump(exclude_unset=True)
+    schemas.check_span(
+        update_dict.get("start_datetime", db_event.start_datetime), update_dict.get("end_datetime", db_event.end_datetime)
+    )
 
     for key, value in update_dict.items():
         setattr(db_event, key, value)
 
-    db.commit()
-    db.refresh(db_event)
-    return db_event
\ No newline at end of file
+    await record_changes(db, db_event.owner_id, EVENT, [db_event.id])
+    await db.commit()
+    await db.refresh(db_event)
+    invalidate_series(db_event.id)
+    return db_event
+
+
+async def bulk_apply_events(db: AsyncSession, owner_id: str, operations: List[schemas.EventBulkOperation]) -> List[schemas.EventBulkResult]:
+    """
+    Applies mixed create/update/delete operations in a single transaction.
+
+    Each kind of operation is sent as one executemany-style statement:
+    creates first, then updates, then deletes. Operations that fail validation
+    or target an event the user does not own are reported and skipped; the
+    rest are still applied.
+
+    Args:
+        db: The SQLAlchemy database session.
+        owner_id: The user performing the operations.
+        operations: The operations, in request order.
+
+    Returns:
+        One result per operation, in request order.
+    """
+    results = [schemas.EventBulkResult(index=i, op=op.op, id=op.id, status_code=200) for i, op in enumerate(operations)]
+    creates, updates, deletes = [], [], []
+
+    for result, op in zip(results, operations):
+        try:
+            if op.op == "create":
+                creates.append((result, schemas.EventCreate.model_validate(op.data or {}).model_dump()))
+                result.status_code = 201
+                continue
+            if op.id is None:
+                raise ValueError("'id' is required for update and delete operations")
+            if op.op == "update":
+                updates.append((result, schemas.EventUpdate.model_validate(op.data or {}).model_dump(exclude_unset=True)))
+            else:
+                deletes.append(result)
+        except ValidationError as exc:
+            result.status_code = 422
+            result.error = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())
+        except ValueError as exc:
+            result.status_code, result.error = 422, str(exc)
+
+    # Ownership check for every referenced event in one query
+    referenced = {result.id for result, _ in updates} | {result.id for result in deletes}
+    stored = {row.id: row for row in (await db.execute(
+        select(models.Event.id, models.Event.owner_id, models.Event.start_datetime, models.Event.end_datetime)
+        .where(models.Event.id.in_(referenced))
+    )).all()} if referenced else {}
+
+    def allowed(result: schemas.EventBulkResult) -> bool:
+        if result.id not in stored:
+            result.status_code, result.error = 404, "Event not found"
+        elif stored[result.id].owner_id != owner_id:
+            result.status_code, result.error = 403, "Not authorized to modify this event"
+        return result.error is None
+
+    def within_span(result: schemas.EventBulkResult, fields: dict) -> bool:
+        row = stored[result.id]
+        try:
+            schemas.check_span(fields.get("start_datetime", row.start_datetime), fields.get("end_datetime", row.end_datetime))
+        except ValueError as exc:
+            result.status_code, result.error = 422, str(exc)
+        return result.error is None
+
+    updates = [(result, fields) for result, fields in updates if allowed(result) and within_span(result, fields)]
+    deletes = [result for result in deletes if allowed(result)]
+
+    if creates:
+        new_ids = (await db.scalars(
+            insert(models.Event).returning(models.Event.id, sort_by_parameter_order=True),
+            [{**fields, "owner_id": owner_id} for _, fields in creates],
+        )).all()
+        for (result, _), new_id in zip(creates, new_ids):
+            result.id = new_id
+        await record_changes(db, owner_id, EVENT, new_ids)
+    # Rows with different sets of changed fields are grouped into separate executemany batches
+    rows = [{"id": result.id, **fields} for result, fields in updates if fields]
+    if rows:
+        await db.execute(update(models.Event), rows)
+        await record_changes(db, owner_id, EVENT, [row["id"] for row in rows])
+        for row in rows:
+            invalidate_series(row["id"])
+    if deletes:
+        deleted_ids = [result.id for result in deletes]
+        await db.execute(delete(models.Event).where(models.Event.id.in_(deleted_ids)))
+        await record_changes(db, owner_id, EVENT, deleted_ids, op=DELETE)
+        await delete_series_occurrences(db, owner_id, deleted_ids)
+    await db.commit()
+    return results
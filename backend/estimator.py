@@ -0,0 +1,395 @@
+import asyncio
+import hashlib
+import os
+import json
+import logging
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+import LLM
+import admission
+import crud
+import heuristic
+import metrics
+import models
+from cache import TieredCache
+from database import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MODEL = "google/gemma-3-27b-it"
+# Bump whenever the prompt changes so stale cached estimates are not reused.
+PROMPT_VERSION = "1"
+NOT_DETECTED = "ASSIGNMENT NOT DETECTED"
+
+ESTIMATE_CACHE_TTL = float(os.getenv("ESTIMATE_CACHE_TTL", str(7 * 24 * 3600)))
+ESTIMATE_CACHE_MAX_ROWS = int(os.getenv("ESTIMATE_CACHE_MAX_ROWS", "50000"))
+# Documents longer than this many tokens are split into sections estimated in parallel.
+ESTIMATE_SECTION_TOKENS = int(os.getenv("ESTIMATE_SECTION_TOKENS", "3000"))
+# Text past this many tokens is dropped so one huge packet cannot run up the bill.
+ESTIMATE_MAX_TOKENS = int(os.getenv("ESTIMATE_MAX_TOKENS", "60000"))
+# Sections of one document sent to the model at once.
+ESTIMATE_SECTION_CONCURRENCY = int(os.getenv("ESTIMATE_SECTION_CONCURRENCY", "4"))
+# Rough characters per token for English text; avoids shipping a tokenizer.
+CHARS_PER_TOKEN = 4
+# "llm" always waits for the model, "local" only uses the heuristic estimator, and
+# "hybrid" asks the model but falls back to the local estimate when it is slow or down.
+ESTIMATE_MODE = os.getenv("ESTIMATE_MODE", "llm").lower()
+# Seconds the model gets in hybrid mode before the local estimate is returned instead.
+ESTIMATE_LATENCY_BUDGET = float(os.getenv("ESTIMATE_LATENCY_BUDGET", "3"))
+
+# Values of Assignment.estimate_source
+SOURCE_LLM = "llm"
+SOURCE_LOCAL = "local"
+
+SYSTEM_PROMPT = (
+    "You have an extremely important job. You will be passed in assignments "
+    "(CONVERTED TO TEXT AND USUALLY FOR SCHOOL) and YOUR TASK is to accurately "
+    "estimate how long the assigment will take a student in minutes. "
+    "YOUR OUTPUT FORMAT SHOULD JUST BE A NUMBER (in minutes). "
+    "If the media provided does not look like an assignment output "
+    "'ASSIGNMENT NOT DETECTED'. Assume an average high school pace. "
+    "Make sure your response does not contain any \\n characters."
+)
+
+SECTION_PROMPT = (
+    SYSTEM_PROMPT + " You are only given ONE SECTION of a longer assignment. "
+    "Estimate the minutes for the work in this section alone; do not count other sections. "
+    "If the section holds no work (for example a cover page or reference material) output 0."
+)
+
+cache = TieredCache("estimates", max_entries=2048, max_rows=ESTIMATE_CACHE_MAX_ROWS, ttl=ESTIMATE_CACHE_TTL)
+
+# Characters OCR commonly swaps in for plain punctuation
+_OCR_TRANSLATION = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "−": "-", "\u00a0": " ",
+})
+# Lines made only of punctuation, bullets or stray marks
+_NOISE_LINE = re.compile(r"^[\W_]{1,3}$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes OCR output so that trivially different scans of the same
+    assignment produce the same cache key.
+    """
+    text = unicodedata.normalize("NFKC", text or "").translate(_OCR_TRANSLATION)
+    lines = []
+    for line in text.splitlines():
+        line = "".join(ch for ch in line if ch.isprintable()).strip()
+        if line and not _NOISE_LINE.match(line):
+            lines.append(line)
+    return _WHITESPACE.sub(" ", " ".join(lines)).strip().lower()
+
+
+def cache_key(assignment_text: str, custom_instructions: str = "", model: str = MODEL, kind: str = "document") -> str:
+    parts = [PROMPT_VERSION, kind, model, normalize_text(assignment_text), normalize_text(custom_instructions)]
+    return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+
+
+# --- Token budgeting ---
+# "Page 3", "p. 3", "Pg 3 of 12"; only this part of a header or footer may differ between pages
+_PAGE_NUMBER = re.compile(r"\b(?:page|pg|p)\.?\s*\d+(?:\s*(?:of|/)\s*\d+)?\b")
+# A line holding nothing but a page number: "3", "- 3 -", "(3)", "3 / 12"
+_BARE_PAGE_NUMBER = re.compile(r"^[-(\[]?\s*\d+(?:\s*(?:of|/)\s*\d+)?\s*[-)\]]?$")
+# Pages with fewer content lines than this are all edge, so nothing is stripped from them
+_BOILERPLATE_MIN_LINES = 8
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _boilerplate_key(line: str) -> str:
+    # "Page 3 of 12" and "Page 4 of 12" are the same footer, "Problem 3" and "Problem 4" are not
+    line = _WHITESPACE.sub(" ", line).strip().lower()
+    if _BARE_PAGE_NUMBER.match(line):
+        return "#"
+    return _PAGE_NUMBER.sub("page #", line)
+
+
+def clean_text(text: str) -> str:
+    """
+    Removes OCR noise that costs tokens without describing work: lines made
+    of stray marks, consecutive duplicate lines, and headers or footers that
+    repeat across the pages of a document. Pages are separated by form feeds.
+    """
+    pages = []
+    for page in (text or "").split("\f"):
+        lines = []
+        for line in page.splitlines():
+            line = _WHITESPACE.sub(" ", "".join(ch for ch in line if ch.isprintable())).strip()
+            if _NOISE_LINE.match(line) or (lines and line and line == lines[-1]):
+                continue
+            lines.append(line)
+        if any(lines):
+            pages.append(lines)
+
+    # Only full pages are searched: on a short page every line is in the top or bottom three
+    full = [i for i, lines in enumerate(pages) if sum(1 for line in lines if line) >= _BOILERPLATE_MIN_LINES]
+    if len(full) > 1:
+        # A line seen in the top or bottom three lines of most pages is a running header or footer
+        edges = Counter()
+        for i in full:
+            content = [line for line in pages[i] if line]
+            edges.update({_boilerplate_key(line) for line in content[:3] + content[-3:]})
+        boilerplate = {key for key, count in edges.items() if count >= max(2, len(full) // 2 + 1)}
+        for i in full[1:]:
+            lines = pages[i]
+            content = [j for j, line in enumerate(lines) if line]
+            edge = set(content[:3] + content[-3:])
+            # The first occurrence stays, so a title printed as a header is still seen once
+            pages[i] = [line for j, line in enumerate(lines) if not (j in edge and _boilerplate_key(line) in boilerplate)]
+
+    return "\n\n".join("\n".join(lines).strip() for lines in pages).strip()
+
+
+def split_sections(text: str, max_tokens: int = ESTIMATE_SECTION_TOKENS) -> List[str]:
+    """
+    Splits text into sections of at most `max_tokens`, breaking between
+    paragraphs where possible, then between lines, then mid-line.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.splitlines():
+            pieces.extend(line[i:i + max_chars] for i in range(0, len(line), max_chars))
+
+    sections, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 2 + len(piece) > max_chars:
+            sections.append(current)
+            current = ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current.strip():
+        sections.append(current)
+    return sections
+
+
+def parse_estimate(response: str) -> Optional[str]:
+    """
+    Reduces a model response to a cacheable outcome: the number of minutes
+    as a string, or NOT_DETECTED. Returns None for anything else.
+    """
+    response = (response or "").strip()
+    if NOT_DETECTED in response.upper():
+        return NOT_DETECTED
+    try:
+        return str(int(response))
+    except ValueError:
+        return None
+
+
+async def _complete(system_prompt: str, assignment_text: str, custom_instructions: str) -> str:
+    user_message = {
+        "role": "user",
+        "content": (
+            "ASSIGNMENT:\n"
+            f"{assignment_text}\n\n"
+            "CUSTOM INSTRUCTIONS:\n"
+            f"{custom_instructions or 'None'}"
+        )
+    }
+    with metrics.stage("llm"):
+        return await LLM.client.chat(
+            model=MODEL,
+            messages=[{"role": "system", "content": system_prompt}, user_message]
+        )
+
+
+async def _estimate_section(section: str, custom_instructions: str) -> str:
+    """Estimates one section; parsed outcomes are cached so shared sections of revised documents are reused."""
+    key = cache_key(section, custom_instructions, kind="section")
+    cached = await cache.get(key)
+    if cached is not None:
+        return cached
+    response = await _complete(SECTION_PROMPT, section, custom_instructions)
+    outcome = parse_estimate(response)
+    if outcome is None:
+        return response
+    await cache.set(key, outcome)
+    return outcome
+
+
+def prompt_tokens(sections: List[str], custom_instructions: str) -> int:
+    """Admission cost of estimating `sections`: the prompt tokens sent, one request per section."""
+    system = SYSTEM_PROMPT if len(sections) <= 1 else SECTION_PROMPT
+    overhead = estimate_tokens(system) + estimate_tokens(custom_instructions or "")
+    return sum(estimate_tokens(section) + overhead for section in sections or [""])
+
+
+def _combine(outcomes: List[str]) -> str:
+    """Sums section estimates; sections without work count as zero. Returns the first unparsable response, if any."""
+    total = 0
+    for outcome in outcomes:
+        if outcome == NOT_DETECTED:
+            continue
+        try:
+            total += max(0, int(outcome))
+        except ValueError:
+            return outcome
+    return str(total) if total > 0 else NOT_DETECTED
+
+
+async def estimate_assignment_time(assignment_text: str, custom_instructions: str = "",
+                                   owner_id: Optional[str] = None, shed: bool = True) -> str:
+    """
+    Asks the model how long an assignment will take, in minutes.
+    Parsed results are cached, so repeated assignments cost no tokens.
+    Cache misses go through `admission.llm`, charged to `owner_id` by
+    prompt tokens, and raise admission.Shed when it refuses them.
+
+    The text is cleaned of OCR noise and repeated headers and footers and
+    trimmed to ESTIMATE_MAX_TOKENS. Documents longer than one section are
+    split, each section is estimated concurrently with the same custom
+    instructions, and the section estimates are summed.
+    """
+    key = cache_key(assignment_text, custom_instructions)
+    with metrics.stage("estimate_cache_lookup"):
+        cached = await cache.get(key)
+    if cached is not None:
+        return cached
+
+    with metrics.stage("estimate_prepare"):
+        text = clean_text(assignment_text)[:ESTIMATE_MAX_TOKENS * CHARS_PER_TOKEN]
+        sections = split_sections(text)
+
+    async with admission.llm.admit(owner_id, prompt_tokens(sections, custom_instructions), shed=shed):
+        if len(sections) <= 1:
+            response = await _complete(SYSTEM_PROMPT, text, custom_instructions)
+            outcome = parse_estimate(response)
+            if outcome is None:
+                return response
+        else:
+            slots = asyncio.Semaphore(ESTIMATE_SECTION_CONCURRENCY)
+
+            async def estimate(index: int, section: str) -> str:
+                async with slots:
+                    return await _estimate_section(f"[Section {index + 1} of {len(sections)}]\n{section}", custom_instructions)
+
+            outcome = _combine(await asyncio.gather(*(estimate(i, section) for i, section in enumerate(sections))))
+            if parse_estimate(outcome) is None:
+                return outcome
+
+    await cache.set(key, outcome)
+    return outcome
+
+
+# --- Local and hybrid estimates ---
+@dataclass
+class Estimate:
+    # Minutes as a string, NOT_DETECTED, or an unparsable model response
+    outcome: str
+    source: str
+    features: Dict[str, float] = field(default_factory=dict)
+    # Model call still running after a hybrid estimate fell back to the local one
+    refinement: Optional[asyncio.Task] = None
+
+    def features_json(self) -> str:
+        return json.dumps(self.features, separators=(",", ":"))
+
+
+# Background model calls and refinements, kept referenced until they finish
+_pending: Set[asyncio.Task] = set()
+
+
+def _track(task: asyncio.Task):
+    _pending.add(task)
+    task.add_done_callback(_settle)
+
+
+def _settle(task: asyncio.Task):
+    _pending.discard(task)
+    # Retrieved here so a failed call nobody waited for is not reported as unhandled
+    if not task.cancelled() and task.exception() is not None and not isinstance(task.exception(), (LLM.LLMError, admission.Shed)):
+        logger.error("Background estimate failed", exc_info=task.exception())
+
+
+def local_estimate(assignment_text: str, subject: str = "") -> Estimate:
+    minutes, features = heuristic.model.estimate(assignment_text, subject)
+    return Estimate(str(minutes) if minutes is not None else NOT_DETECTED, SOURCE_LOCAL, features)
+
+
+async def estimate(assignment_text: str, custom_instructions: str = "", subject: str = "", mode: str = ESTIMATE_MODE,
+                   owner_id: Optional[str] = None, shed: bool = True) -> Estimate:
+    """
+    Estimates an assignment in the configured ESTIMATE_MODE.
+
+    In hybrid mode the model gets ESTIMATE_LATENCY_BUDGET seconds; past that
+    the local estimate is returned and the model call keeps running as
+    `refinement`, so its answer is still cached and can replace the local
+    estimate later (see `refine_later`). Model errors, shed model calls and
+    answers that do not parse also fall back to the local estimate. Raises LLM.LLMError and
+    admission.Shed only in llm mode.
+    """
+    with metrics.stage("estimate_local"):
+        local = local_estimate(assignment_text, subject)
+    if mode == SOURCE_LOCAL:
+        metrics.estimates_total.inc(source=SOURCE_LOCAL)
+        return local
+    if mode != "hybrid":
+        outcome = await estimate_assignment_time(assignment_text, custom_instructions, owner_id, shed)
+        metrics.estimates_total.inc(source=SOURCE_LLM)
+        return Estimate(outcome, SOURCE_LLM, local.features)
+
+    task = asyncio.create_task(estimate_assignment_time(assignment_text, custom_instructions, owner_id, shed))
+    _track(task)
+    # Too little text for the local estimator to judge; only the model can say
+    timeout = None if local.outcome == NOT_DETECTED else ESTIMATE_LATENCY_BUDGET
+    await asyncio.wait({task}, timeout=timeout)
+    if not task.done():
+        local.refinement = task
+        metrics.estimates_total.inc(source=SOURCE_LOCAL)
+        return local
+    if isinstance(task.exception(), (LLM.LLMError, admission.Shed)) or parse_estimate(task.result()) is None:
+        metrics.estimates_total.inc(source=SOURCE_LOCAL)
+        return local
+    metrics.estimates_total.inc(source=SOURCE_LLM)
+    return Estimate(task.result(), SOURCE_LLM, local.features)
+
+
+async def _refine(estimate: Estimate, assignment_id: int):
+    try:
+        minutes = int(await estimate.refinement)
+    except (LLM.LLMError, admission.Shed, ValueError):
+        # Unavailable, shed, not an assignment after all, or unparsable: the local estimate stands
+        return
+    async with SessionLocal() as db:
+        assignment = await db.get(models.Assignment, assignment_id)
+        # Left alone if it was deleted, or edited since the local estimate was stored
+        if assignment is None or assignment.estimate_source != SOURCE_LOCAL or str(assignment.estimated_minutes) != estimate.outcome:
+            return
+        assignment.estimated_minutes = minutes
+        assignment.estimate_source = SOURCE_LLM
+        await crud.record_changes(db, assignment.owner_id, crud.ASSIGNMENT, [assignment_id])
+        await db.commit()
+    metrics.estimates_total.inc(source="refined")
+
+
+def refine_later(estimate: Estimate, assignment_id: int):
+    """Replaces the local estimate stored on an assignment with the model's once it arrives."""
+    if estimate.refinement is not None:
+        _track(asyncio.create_task(_refine(estimate, assignment_id)))
+
+
+async def shutdown():
+    """Cancels outstanding refinements; their assignments keep the local estimate."""
+    for task in list(_pending):
+        task.cancel()
+    await asyncio.gather(*_pending, return_exceptions=True)
+
+
+def stats() -> dict:
+    return {"pending_refinements": len(_pending), **heuristic.model.stats()}
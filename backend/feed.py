@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "memory" notifies the subscribers of this process only. "changelog" also polls the
+# shared change log, so a change committed by one worker reaches clients of every worker.
+FEED_BACKEND = os.getenv("FEED_BACKEND", "memory").lower()
+# Seconds between change-log polls with the changelog backend.
+FEED_POLL_INTERVAL = float(os.getenv("FEED_POLL_INTERVAL", "1"))
+# Seconds between keep-alive comments on an idle stream, so proxies keep it open.
+FEED_KEEPALIVE = float(os.getenv("FEED_KEEPALIVE", "15"))
+
+# Session.info key collecting the owners whose collections a transaction changed
+_PENDING = "feed_owners"
+
+
+class MemoryHub:
+    """
+    In-process pub/sub of "this user's data changed" notifications.
+
+    A notification carries no payload: each subscriber is an asyncio.Event
+    that is set, and the stream serving it reads the delta from the change
+    log. Several commits before the stream wakes up cost one read.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[asyncio.Event]] = {}
+        self.published = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, owner_id: str) -> asyncio.Event:
+        signal = asyncio.Event()
+        self._subscribers.setdefault(owner_id, []).append(signal)
+        return signal
+
+    def unsubscribe(self, owner_id: str, signal: asyncio.Event):
+        subscribers = self._subscribers.get(owner_id, [])
+        if signal in subscribers:
+            subscribers.remove(signal)
+        if not subscribers:
+            self._subscribers.pop(owner_id, None)
+
+    def publish(self, owner_id: str):
+        self.published += 1
+        for signal in self._subscribers.get(owner_id, []):
+            signal.set()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(signals) for signals in self._subscribers.values()),
+            "users": len(self._subscribers),
+            "published": self.published,
+        }
+
+
+class ChangeLogHub(MemoryHub):
+    """
+    MemoryHub that also watches the `changes` table, which every worker
+    writes to, so multi-worker deployments need no extra broker. One indexed
+    query per poll interval per process, however many clients are connected.
+    """
+
+    def __init__(self, interval: float = FEED_POLL_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._last_seq = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        async with SessionLocal() as db:
+            self._last_seq = (await db.scalar(select(func.max(models.Change.seq)))) or 0
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                async with SessionLocal() as db:
+                    rows = (await db.execute(
+                        select(models.Change.owner_id, func.max(models.Change.seq))
+                        .where(models.Change.seq > self._last_seq)
+                        .group_by(models.Change.owner_id)
+                    )).all()
+            except Exception:
+                logger.exception("Polling the change log failed")
+                continue
+            for owner_id, seq in rows:
+                self._last_seq = max(self._last_seq, seq)
+                # Changes made by this process were already published; a repeat costs one empty read
+                if owner_id in self._subscribers:
+                    self.publish(owner_id)
+
+
+hub = ChangeLogHub() if FEED_BACKEND == "changelog" else MemoryHub()
+
+
+# --- Publishing on commit ---
+def changed(db, owner_id: str):
+    """Notifies the owner's subscribers once `db` commits; nothing is sent if it rolls back."""
+    db.info.setdefault(_PENDING, set()).add(owner_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    for owner_id in session.info.pop(_PENDING, ()):
+        hub.publish(owner_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+import models
+from database import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# The model is refitted from stored assignments this often, in seconds.
+ESTIMATE_CALIBRATION_INTERVAL = float(os.getenv("ESTIMATE_CALIBRATION_INTERVAL", "3600"))
+# Below this many labelled assignments the default coefficients are used as they are.
+ESTIMATE_CALIBRATION_MIN_ROWS = int(os.getenv("ESTIMATE_CALIBRATION_MIN_ROWS", "20"))
+# Most recent labelled assignments used per fit.
+ESTIMATE_CALIBRATION_MAX_ROWS = int(os.getenv("ESTIMATE_CALIBRATION_MAX_ROWS", "5000"))
+# How strongly the fit is pulled towards the default coefficients, in assignments' worth of evidence.
+ESTIMATE_CALIBRATION_PRIOR = float(os.getenv("ESTIMATE_CALIBRATION_PRIOR", "10"))
+
+MIN_MINUTES = 5
+MAX_MINUTES = 600
+# Fewer words than this is not an assignment
+MIN_WORDS = 5
+# "Read pages 1-400" is a typo or a whole book; either way it is not one sitting
+MAX_READING_PAGES = 100
+
+# --- Features ---
+_WORD = re.compile(r"[A-Za-z0-9]+(?:['’][A-Za-z]+)?")
+# "1.", "2)", "a.", "(b)", "Q3", "Question 4" at the start of a line
+_NUMBERED_ITEM = re.compile(r"^\s*(?:\(?(?:\d{1,3}|[a-hA-H])[.)]|q(?:uestion)?\s*\d{1,3}\b)", re.IGNORECASE)
+# "questions 1-12", "problems 3 - 9", "exercises 4 to 10"
+_ITEM_RANGE = re.compile(r"\b(?:questions?|problems?|exercises?|#)\s*(\d{1,3})\s*(?:-|to|through)\s*(\d{1,3})\b", re.IGNORECASE)
+# "pages 210-232", "pp. 12-20", "chapter 4 (pages 80 to 95)"
+_PAGE_RANGE = re.compile(r"\b(?:pages?|pp?\.)\s*(\d{1,4})\s*(?:-|to|through)\s*(\d{1,4})\b", re.IGNORECASE)
+# "500 words", "300-500 words", "at least 750 words"
+_WORD_TARGET = re.compile(r"\b(\d{2,4})(?:\s*(?:-|to)\s*(\d{2,4}))?\s*words?\b", re.IGNORECASE)
+
+# Keywords marking the kind of work asked for; each kind adds a fixed amount of time
+TASK_KEYWORDS = {
+    "writing": ("essay", "write", "paragraph", "summary", "summarize", "report", "reflection", "response", "thesis"),
+    "reading": ("read", "reading", "chapter", "article", "annotate"),
+    "problems": ("solve", "calculate", "compute", "simplify", "show all work", "show your work", "evaluate", "graph"),
+    "lab": ("lab", "experiment", "hypothesis", "procedure", "data table"),
+    "project": ("project", "presentation", "poster", "slides", "research", "portfolio"),
+    "drawing": ("draw", "diagram", "sketch", "label", "illustrate", "map"),
+}
+SUBJECT_KEYWORDS = {
+    "math": ("math", "algebra", "geometry", "calculus", "statistics", "precalc", "trig"),
+    "science": ("science", "biology", "chemistry", "physics", "earth", "environmental", "anatomy"),
+    "english": ("english", "literature", "writing", "language arts", "ela", "composition"),
+    "history": ("history", "social studies", "government", "economics", "civics", "geography", "psychology"),
+    "languages": ("spanish", "french", "german", "latin", "chinese", "japanese", "italian"),
+}
+_TASK_PATTERNS = {
+    kind: re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")\b", re.IGNORECASE)
+    for kind, words in TASK_KEYWORDS.items()
+}
+
+# Minutes per unit of each feature for an average high school pace, used until
+# enough assignments are stored to calibrate against
+DEFAULT_COEFFICIENTS = {
+    "intercept": 10.0,
+    "questions": 4.0,
+    "words_100": 1.5,
+    "pages": 3.0,
+    "reading_pages": 3.0,
+    "target_words_100": 5.0,
+    **{f"task_{kind}": weight for kind, weight in (
+        ("writing", 20.0), ("reading", 5.0), ("problems", 10.0), ("lab", 20.0), ("project", 45.0), ("drawing", 5.0),
+    )},
+    **{f"subject_{name}": 0.0 for name in SUBJECT_KEYWORDS},
+}
+FEATURES = tuple(DEFAULT_COEFFICIENTS)
+
+
+def subject_group(subject: str) -> Optional[str]:
+    subject = (subject or "").lower()
+    for name, words in SUBJECT_KEYWORDS.items():
+        if any(word in subject for word in words):
+            return name
+    return None
+
+
+def _ranges_total(pattern: re.Pattern, text: str, limit: int) -> int:
+    total = 0
+    for match in pattern.finditer(text):
+        first, last = int(match.group(1)), int(match.group(2))
+        if first <= last:
+            total += min(limit, last - first + 1)
+    return total
+
+
+def extract_features(text: str, subject: str = "") -> Dict[str, float]:
+    """
+    Describes an assignment by counts that track the work it asks for:
+    questions (numbered items, question marks and ranges like "questions 1-12"),
+    words, pages (form-feed separated), pages to read, words to write, and
+    which kinds of task and which subject it is.
+    """
+    text = text or ""
+    words = len(_WORD.findall(text))
+    lines = text.splitlines()
+    numbered = sum(1 for line in lines if _NUMBERED_ITEM.match(line))
+    asked = sum(1 for line in lines if line.rstrip().endswith("?") and not _NUMBERED_ITEM.match(line))
+    ranged = _ranges_total(_ITEM_RANGE, text, MAX_READING_PAGES)
+    target_words = max(
+        (int(match.group(2) or match.group(1)) for match in _WORD_TARGET.finditer(text)), default=0
+    )
+
+    features = {
+        "questions": float(numbered + asked + ranged),
+        "words_100": words / 100,
+        "pages": float(text.count("\f") + 1 if text.strip() else 0),
+        "reading_pages": float(min(MAX_READING_PAGES, _ranges_total(_PAGE_RANGE, text, MAX_READING_PAGES))),
+        "target_words_100": target_words / 100,
+    }
+    for kind, pattern in _TASK_PATTERNS.items():
+        features[f"task_{kind}"] = 1.0 if pattern.search(text) else 0.0
+    group = subject_group(subject)
+    for name in SUBJECT_KEYWORDS:
+        features[f"subject_{name}"] = 1.0 if name == group else 0.0
+    features["words"] = float(words)
+    return features
+
+
+# --- Calibration ---
+def _solve(matrix: List[List[float]], vector: List[float]) -> List[float]:
+    """Solves a small dense linear system by Gaussian elimination with partial pivoting."""
+    n = len(vector)
+    rows = [row[:] + [value] for row, value in zip(matrix, vector)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        if abs(rows[col][col]) < 1e-12:
+            raise ValueError("Singular system")
+        for r in range(col + 1, n):
+            factor = rows[r][col] / rows[col][col]
+            if factor:
+                for c in range(col, n + 1):
+                    rows[r][c] -= factor * rows[col][c]
+    solution = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        solution[r] = (rows[r][n] - sum(rows[r][c] * solution[c] for c in range(r + 1, n))) / rows[r][r]
+    return solution
+
+
+def fit(samples: List[Tuple[Dict[str, float], float]], prior: Dict[str, float] = DEFAULT_COEFFICIENTS,
+        strength: float = ESTIMATE_CALIBRATION_PRIOR) -> Dict[str, float]:
+    """
+    Least-squares fit of minutes against the features, shrunk towards `prior`.
+
+    The pull on each coefficient equals `strength` assignments' worth of that
+    feature's typical value, so features that rarely occur in the data (or never
+    do) stay close to their defaults instead of being fitted to noise.
+    """
+    names = list(prior)
+    n = len(names)
+    xtx = [[0.0] * n for _ in range(n)]
+    xty = [0.0] * n
+    for features, minutes in samples:
+        x = [1.0 if name == "intercept" else features.get(name, 0.0) for name in names]
+        for i in range(n):
+            if x[i]:
+                xty[i] += x[i] * minutes
+                row = xtx[i]
+                for j in range(n):
+                    row[j] += x[i] * x[j]
+    count = max(1, len(samples))
+    for i, name in enumerate(names):
+        # Mean square of the feature, floored so an absent feature is pinned to its prior
+        penalty = strength * max(xtx[i][i] / count, 1e-3)
+        xtx[i][i] += penalty
+        xty[i] += penalty * prior[name]
+    return dict(zip(names, _solve(xtx, xty)))
+
+
+class HeuristicEstimator:
+    """
+    Estimates minutes locally as a linear function of `extract_features`.
+
+    Starts from DEFAULT_COEFFICIENTS and is refitted in the background from
+    assignments whose estimate came from the model (`estimate_source == "llm"`),
+    so it learns to agree with the LLM without ever calling it.
+    """
+
+    def __init__(self, interval: float = ESTIMATE_CALIBRATION_INTERVAL):
+        self.interval = interval
+        self.coefficients = dict(DEFAULT_COEFFICIENTS)
+        self.samples = 0
+        self.mean_abs_error: Optional[float] = None
+        self.calibrated_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def predict(self, features: Dict[str, float]) -> int:
+        minutes = sum(
+            weight * (1.0 if name == "intercept" else features.get(name, 0.0))
+            for name, weight in self.coefficients.items()
+        )
+        # Rounded to five minutes; finer steps would claim precision the model does not have
+        return int(min(MAX_MINUTES, max(MIN_MINUTES, 5 * round(minutes / 5))))
+
+    def estimate(self, text: str, subject: str = "") -> Tuple[Optional[int], Dict[str, float]]:
+        """Returns the minutes (None if the text is too short to be an assignment) and the features used."""
+        features = extract_features(text, subject)
+        if features["words"] < MIN_WORDS:
+            return None, features
+        return self.predict(features), features
+
+    async def calibrate(self):
+        async with SessionLocal() as db:
+            rows = (await db.execute(
+                select(models.Assignment.estimate_features, models.Assignment.estimated_minutes)
+                .where(
+                    models.Assignment.estimate_source == "llm",
+                    models.Assignment.estimate_features.is_not(None),
+                    models.Assignment.estimated_minutes > 0,
+                )
+                .order_by(models.Assignment.id.desc())
+                .limit(ESTIMATE_CALIBRATION_MAX_ROWS)
+            )).all()
+        samples = [(json.loads(features), float(minutes)) for features, minutes in rows]
+        if len(samples) < ESTIMATE_CALIBRATION_MIN_ROWS:
+            return
+        coefficients = await asyncio.to_thread(fit, samples)
+        self.coefficients = coefficients
+        self.samples = len(samples)
+        self.mean_abs_error = sum(abs(self.predict(f) - m) for f, m in samples) / len(samples)
+        self.calibrated_at = time.time()
+        logger.info("Calibrated the local estimator on %d assignments (mean error %.1f min)", self.samples, self.mean_abs_error)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.calibrate()
+            except Exception:
+                logger.exception("Calibrating the local estimator failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "calibration_samples": self.samples,
+            "calibration_mean_abs_error_minutes": self.mean_abs_error or 0.0,
+            "calibrated_at_seconds": self.calibrated_at or 0.0,
+        }
+
+
+model = HeuristicEstimator()
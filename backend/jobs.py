@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select, update
+from starlette.concurrency import run_in_threadpool
+
+import LLM
+import crud
+import estimator
+import metrics
+import models
+import ocr
+import uploads
+from database import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Uploads beyond this many waiting jobs are rejected until the queue drains.
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Uploaded files are kept here until their job finishes, so pending jobs survive a restart.
+JOB_UPLOAD_DIR = os.getenv("JOB_UPLOAD_DIR", "./uploads")
+# Seconds between sweeps for jobs no process is working on: left queued by a
+# stopped process, or left running by one that crashed.
+JOB_RECOVER_INTERVAL = float(os.getenv("JOB_RECOVER_INTERVAL", "60"))
+# A running job not updated for this many seconds is taken to belong to a crashed process.
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "900"))
+# Seconds between touches of a running job's updated_at, so a long OCR run or a wait
+# for admission is not mistaken for a crash. Must stay well below JOB_STALE_AFTER.
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "60"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+def job_event(job: models.Job) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "stage": job.stage,
+        "assignment_id": job.assignment_id,
+        "error": job.error,
+    }
+
+
+class JobQueue:
+    """
+    Bounded queue of assignment ingestion jobs drained by a fixed pool of
+    worker tasks. Job state lives in the `jobs` table; progress is also pushed
+    to in-process subscribers for streaming.
+
+    Several server processes may queue the same job; a worker only runs a job
+    after claiming it in the table, which exactly one process can do.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_size: int = JOB_QUEUE_SIZE, upload_dir: str = JOB_UPLOAD_DIR):
+        self.workers = workers
+        self.max_size = max_size
+        self.upload_dir = upload_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        # Written to the jobs this process claims
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Ids in the in-memory queue, so a recovery sweep does not queue them twice
+        self._queued: Set[str] = set()
+
+    # --- Lifecycle ---
+    async def start(self):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._recover_periodically()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Interrupted jobs go back to the queue right away instead of waiting to turn stale
+        async with SessionLocal() as db:
+            await db.execute(
+                update(models.Job)
+                .where(models.Job.worker == self.worker_id, models.Job.status == RUNNING)
+                .values(status=QUEUED, stage=None, worker=None)
+            )
+            await db.commit()
+
+    async def _recover(self):
+        """
+        Queues the jobs waiting in the table that are not in this process's
+        queue, after returning running jobs that stopped making progress
+        JOB_STALE_AFTER seconds ago to the queue.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+        async with SessionLocal() as db:
+            await db.execute(
+                update(models.Job)
+                .where(models.Job.status == RUNNING, models.Job.updated_at < cutoff)
+                .values(status=QUEUED, stage=None, worker=None)
+            )
+            await db.commit()
+            job_ids = (await db.scalars(
+                select(models.Job.id).where(models.Job.status == QUEUED).order_by(models.Job.created_at)
+            )).all()
+        job_ids = [job_id for job_id in job_ids if job_id not in self._queued]
+        if job_ids:
+            logger.info("Recovering %d pending ingestion jobs", len(job_ids))
+        for job_id in job_ids:
+            self._queued.add(job_id)
+            await self._queue.put(job_id)
+
+    async def _recover_periodically(self):
+        while True:
+            try:
+                await self._recover()
+            except Exception:
+                logger.exception("Recovering ingestion jobs failed")
+            await asyncio.sleep(JOB_RECOVER_INTERVAL)
+
+    # --- Submission ---
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "capacity": self.max_size,
+            "workers": self.workers,
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+        }
+
+    def has_capacity(self) -> bool:
+        return self._queue is not None and not self._queue.full()
+
+    def file_path(self, job_id: str) -> str:
+        return os.path.join(self.upload_dir, job_id)
+
+    async def submit(
+        self,
+        owner_id: str,
+        title: str,
+        subject: str,
+        upload: uploads.StoredUpload,
+        custom_instructions: Optional[str] = None,
+    ) -> models.Job:
+        """Queues a spooled upload; the file is moved into the upload directory under the job's id."""
+        if not self.has_capacity():
+            upload.remove()
+            raise QueueFull()
+        job_id = uuid.uuid4().hex
+
+        await run_in_threadpool(shutil.move, upload.path, self.file_path(job_id))
+        async with SessionLocal() as db:
+            job = models.Job(
+                id=job_id,
+                owner_id=owner_id,
+                status=QUEUED,
+                title=title,
+                subject=subject,
+                content_type=upload.content_type,
+                custom_instructions=custom_instructions,
+            )
+            db.add(job)
+            await db.commit()
+            await db.refresh(job)
+        try:
+            self._queue.put_nowait(job_id)
+            self._queued.add(job_id)
+        except asyncio.QueueFull:
+            # Filled up while the file was being moved. The client is told to retry,
+            # so nothing may be left behind for a restart to run a second time.
+            async with SessionLocal() as db:
+                await db.execute(delete(models.Job).where(models.Job.id == job_id))
+                await db.commit()
+            await run_in_threadpool(os.remove, self.file_path(job_id))
+            raise QueueFull()
+        return job
+
+    # --- Progress subscriptions ---
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id, [])
+        if queue in subscribers:
+            subscribers.remove(queue)
+        if not subscribers:
+            self._subscribers.pop(job_id, None)
+
+    async def _update(self, job_id: str, **fields) -> models.Job:
+        async with SessionLocal() as db:
+            job = await db.get(models.Job, job_id)
+            for key, value in fields.items():
+                setattr(job, key, value)
+            await db.commit()
+            await db.refresh(job)
+        event = job_event(job)
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait(event)
+        return job
+
+    # --- Processing ---
+    async def _claim(self, job_id: str) -> Optional[models.Job]:
+        """Marks a queued job as running in this process; None if another process got it first or it is gone."""
+        async with SessionLocal() as db:
+            result = await db.execute(
+                update(models.Job)
+                .where(models.Job.id == job_id, models.Job.status == QUEUED)
+                .values(status=RUNNING, stage="ocr", worker=self.worker_id)
+            )
+            await db.commit()
+        if result.rowcount != 1:
+            return None
+        # Publishes the new state to the job's subscribers
+        return await self._update(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                job = await self._claim(job_id)
+                if job is not None:
+                    await self._process(job)
+            except Exception:
+                # The worker must outlive any one job, e.g. a locked database while claiming
+                logger.exception("Ingestion worker failed on job %s", job_id)
+                await self._abandon(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _abandon(self, job_id: str):
+        """Fails a job this process claimed but could not finish or report on."""
+        try:
+            async with SessionLocal() as db:
+                await db.execute(
+                    update(models.Job)
+                    .where(models.Job.id == job_id, models.Job.worker == self.worker_id, models.Job.status == RUNNING)
+                    .values(status=FAILED, stage=None, error="Internal error while processing the upload.")
+                )
+                await db.commit()
+            path = self.file_path(job_id)
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception:
+            logger.exception("Could not mark ingestion job %s as failed", job_id)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                async with SessionLocal() as db:
+                    await db.execute(
+                        update(models.Job)
+                        .where(models.Job.id == job_id, models.Job.worker == self.worker_id, models.Job.status == RUNNING)
+                        .values(updated_at=func.now())
+                    )
+                    await db.commit()
+            except Exception:
+                logger.exception("Heartbeat of ingestion job %s failed", job_id)
+
+    async def _process(self, job: models.Job):
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            await self._run(job)
+        except asyncio.CancelledError:
+            # Shutting down: keep the file so the job is recovered on the next start
+            raise
+        except Exception:
+            logger.exception("Ingestion job %s crashed", job.id)
+            await self._update(job.id, status=FAILED, error="Internal error while processing the upload.")
+        finally:
+            heartbeat.cancel()
+        path = self.file_path(job.id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    async def _run(self, job: models.Job):
+        job_id = job.id
+        path = self.file_path(job_id)
+        digest = await run_in_threadpool(uploads.sha256_file, path)
+        # Accepted jobs wait for capacity rather than being shed; the queue bound limits them instead
+        assignment_text = await ocr.engine.extract_text(path, job.content_type, digest, owner_id=job.owner_id, shed=False)
+
+        await self._update(job_id, stage="estimate")
+        try:
+            estimate = await estimator.estimate(
+                assignment_text, job.custom_instructions or "", job.subject, owner_id=job.owner_id, shed=False
+            )
+        except LLM.LLMError:
+            await self._update(job_id, status=FAILED, error="The time estimation service is unavailable. Please try again later.")
+            return
+        try:
+            estimated_minutes = int(estimate.outcome)
+        except ValueError:
+            await self._update(job_id, status=FAILED, error="Could not estimate time for the assignment. The file might not be a valid assignment.")
+            return
+
+        await self._update(job_id, stage="save")
+
+        with metrics.stage("db_commit"):
+            async with SessionLocal() as db:
+                assignment = models.Assignment(
+                    title=job.title,
+                    subject=job.subject,
+                    estimated_minutes=estimated_minutes,
+                    estimate_source=estimate.source,
+                    estimate_features=estimate.features_json(),
+                    source_text=assignment_text,
+                    owner_id=job.owner_id,
+                )
+                db.add(assignment)
+                await db.flush()
+                await crud.record_changes(db, job.owner_id, crud.ASSIGNMENT, [assignment.id])
+                await db.commit()
+        estimator.refine_later(estimate, assignment.id)
+
+        await self._update(job_id, status=SUCCEEDED, stage=None, assignment_id=assignment.id)
+
+
+queue = JobQueue()
@@ -1,3 +1,9 @@
+import time
+# Cold-start timing starts here, before the framework and app modules are imported
+_import_started = time.perf_counter()
+
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
@@ -7,21 +13,76 @@ from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 from dotenv import load_dotenv
 
 from routes import router as api_app
-from database import engine, Base
+from database import engine, Base, pool_stats
+from migrations import run_migrations
+import admission
+import cache
+import estimator
+import feed
+import heuristic
+import ocr
+import LLM
+import jobs
+import metrics
+import uploads
+
+logger = logging.getLogger(__name__)
+_import_seconds = time.perf_counter() - _import_started
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Create the database tables and bring existing ones up to date
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
+    await jobs.queue.start()
+    # Fits the local estimator to stored assignments now and then periodically
+    await heuristic.model.start()
+    await feed.hub.start()
+    # OCR worker processes and the LLM connection pool are created on first use
+    app.state.startup = {
+        "import_seconds": round(_import_seconds, 4),
+        "lifespan_seconds": round(time.perf_counter() - started, 4),
+    }
+    logger.info(
+        "Cold start: imports %.0f ms, startup %.0f ms",
+        _import_seconds * 1000, app.state.startup["lifespan_seconds"] * 1000,
+    )
+    yield
+    # Stop the ingestion workers, the OCR worker processes and pooled LLM connections on shutdown
+    await jobs.queue.stop()
+    await feed.hub.stop()
+    await heuristic.model.stop()
+    await estimator.shutdown()
+    ocr.engine.shutdown()
+    await LLM.client.aclose()
+    await engine.dispose()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 load_dotenv()
 
+# Oversized uploads are refused before the form parser spools them
+app.add_middleware(uploads.UploadLimitMiddleware)
+
+# Counters, gauges and pool stats served on /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.register_collector("syncora_cache", ("cache", "tier"), cache.stats)
+metrics.register_collector("syncora_db_pool", (), pool_stats)
+metrics.register_collector("syncora_llm", (), lambda: LLM.client.stats())
+metrics.register_collector("syncora_jobs", (), jobs.queue.stats)
+metrics.register_collector("syncora_estimator", (), estimator.stats)
+metrics.register_collector("syncora_feed", (), feed.hub.stats)
+metrics.register_collector("syncora_admission", ("resource",), admission.stats)
+
 # Add the middleware to trust the proxy headers from Caddy
 app.add_middleware(
     ProxyHeadersMiddleware,
     trusted_hosts="*"
 )
 
-# Create the database tables on startup
-Base.metadata.create_all(bind=engine)
-
 # Load the secret key from environment variables for security
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
@@ -47,6 +108,11 @@ app.mount("/frontend", StaticFiles(directory=frontend_path, html=True), name="fr
 async def root():
     return RedirectResponse(url="/frontend/index.html")
 
+@app.get("/health")
+async def health():
+    """Liveness probe; also reports how long this worker took to start."""
+    return {"status": "ok", "startup": getattr(app.state, "startup", None)}
+
 if __name__ == "__main__":
     import uvicorn
     # Run as a standard HTTP server. Caddy will handle HTTPS.
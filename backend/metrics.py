@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Adds a Server-Timing header with the duration of each pipeline stage to every response.
+METRICS_TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "false").lower() in ("1", "true", "yes")
+
+# Seconds; spans a cached lookup up to a long multi-page OCR or LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Every metric registers itself here so /metrics can render it
+registry: Dict[str, "Metric"] = {}
+# Callables returning nested stats dicts, rendered as gauges on each scrape
+collectors: List[Tuple[str, Tuple[str, ...], Callable[[], dict]]] = []
+
+# Stage durations of the current request, collected for the Server-Timing header
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """
+    Base class of the metric types. Values are kept per label combination and
+    updated under a lock, so recording costs a dict lookup and an addition.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        registry[name] = self
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # One counter per bucket plus +Inf, then the running sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                samples.append((f"{self.name}_bucket", {**labels, "le": le}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+# --- Pipeline metrics ---
+request_seconds = Histogram(
+    "syncora_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+requests_in_flight = Gauge("syncora_requests_in_flight", "HTTP requests currently being served.")
+stage_seconds = Histogram(
+    "syncora_stage_duration_seconds", "Duration of each assignment pipeline stage.", ("stage",)
+)
+stages_in_flight = Gauge("syncora_stages_in_flight", "Pipeline stages currently running.", ("stage",))
+estimates_total = Counter(
+    "syncora_estimates_total", "Time estimates by source; \"refined\" counts local estimates later replaced by the model.", ("source",)
+)
+# No per-user labels: user ids would leak on /metrics and add a series per user
+admission_cost_total = Counter(
+    "syncora_admission_cost_total", "Cost admitted per resource: OCR pages at 200 dpi, LLM prompt tokens.", ("resource",)
+)
+admission_shed_total = Counter(
+    "syncora_admission_shed_total", "Requests refused with 429, by resource and reason (user, queue or timeout).", ("resource", "reason")
+)
+admission_wait_seconds = Histogram(
+    "syncora_admission_wait_seconds", "Time admitted requests waited for their bucket and the global budget.", ("resource",)
+)
+
+
+def observe_stage(name: str, seconds: float):
+    """Records a stage duration measured elsewhere, e.g. inside an OCR worker process."""
+    stage_seconds.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as pipeline stage `name`."""
+    started = time.perf_counter()
+    stages_in_flight.inc(stage=name)
+    try:
+        yield
+    finally:
+        stages_in_flight.dec(stage=name)
+        observe_stage(name, time.perf_counter() - started)
+
+
+# --- Collected stats ---
+def register_collector(prefix: str, labelnames: Tuple[str, ...], collect: Callable[[], dict]):
+    """
+    Exposes the numbers in `collect()` as gauges named `<prefix>_<key>`.
+    Nesting levels of the returned dict become the labels in `labelnames`,
+    e.g. {"ocr": {"memory": {"hits": 3}}} with ("cache", "tier") becomes
+    `<prefix>_hits{cache="ocr",tier="memory"} 3`.
+    """
+    collectors.append((prefix, labelnames, collect))
+
+
+def _flatten(prefix: str, labelnames: Tuple[str, ...], stats: dict, labels: Dict[str, str], out: list):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            if len(labels) < len(labelnames):
+                _flatten(prefix, labelnames, value, {**labels, labelnames[len(labels)]: key}, out)
+            else:
+                _flatten(f"{prefix}_{key}", labelnames, value, labels, out)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out.append((f"{prefix}_{key}", labels, value))
+
+
+def render() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(registry.values()):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    gauges: Dict[str, list] = {}
+    for prefix, labelnames, collect in collectors:
+        samples = []
+        _flatten(prefix, labelnames, collect(), {}, samples)
+        for name, labels, value in samples:
+            gauges.setdefault(name, []).append((labels, value))
+    for name, samples in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Middleware ---
+class MetricsMiddleware:
+    """
+    Records request latency per route template (so /events/1 and /events/2
+    share one series) and the number of requests in flight. With METRICS_TIMING_HEADERS set, responses
+    carry a Server-Timing header listing the stages that ran.
+    """
+
+    def __init__(self, app, timing_headers: bool = METRICS_TIMING_HEADERS):
+        self.app = app
+        self.timing_headers = timing_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        status = 500
+        requests_in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.timing_headers:
+                    total = (time.perf_counter() - started) * 1000
+                    value = ", ".join(
+                        [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings]
+                        + [f"total;dur={total:.1f}"]
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            requests_in_flight.dec()
+            # The router stores the matched route in the scope; unmatched paths share one series
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            request_seconds.observe(time.perf_counter() - started, method=scope["method"], route=route, status=status)
@@ -0,0 +1,85 @@
+from sqlalchemy import inspect
+
+import models
+import search
+
+# `Base.metadata.create_all` only creates missing tables, so anything added to
+# an existing table (indexes, columns) has to be applied here as well.
+# Every step must be idempotent: it runs on every startup.
+
+
+def _add_missing_columns(conn, model, names):
+    """Adds the named model columns to the existing table if they are missing."""
+    table = model.__table__
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            column = table.columns[name]
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}")
+
+
+def _events_owner_start_index(conn):
+    for index in models.Event.__table__.indexes:
+        if index.name == "ix_events_owner_start":
+            index.create(conn, checkfirst=True)
+
+
+def _scheduling_columns(conn):
+    _add_missing_columns(conn, models.Assignment, ["priority", "due_datetime"])
+    _add_missing_columns(conn, models.Event, ["assignment_id"])
+
+
+def _estimate_columns(conn):
+    _add_missing_columns(conn, models.Assignment, ["estimate_source", "estimate_features"])
+
+
+def _source_text_column(conn):
+    _add_missing_columns(conn, models.Assignment, ["source_text"])
+
+
+def _recurrence_columns(conn):
+    _add_missing_columns(conn, models.Event, ["rrule", "exdates", "series_id", "original_start"])
+
+
+def _job_worker_column(conn):
+    _add_missing_columns(conn, models.Job, ["worker"])
+
+
+def _changes_autoincrement(conn):
+    """Rebuilds an SQLite change log created without AUTOINCREMENT, keeping its sequence numbers."""
+    if conn.dialect.name != "sqlite":
+        return
+    table_sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'changes'").scalar()
+    if table_sql is None or "AUTOINCREMENT" in table_sql.upper():
+        return
+    table = models.Change.__table__
+    for index in table.indexes:
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    conn.exec_driver_sql("ALTER TABLE changes RENAME TO changes_old")
+    table.create(conn)
+    columns = ", ".join(column.name for column in table.columns)
+    conn.exec_driver_sql(f"INSERT INTO changes ({columns}) SELECT {columns} FROM changes_old")
+    conn.exec_driver_sql("DROP TABLE changes_old")
+
+
+MIGRATIONS = [
+    _events_owner_start_index,
+    _scheduling_columns,
+    _estimate_columns,
+    _recurrence_columns,
+    _changes_autoincrement,
+    _source_text_column,
+    search.create_index,
+    _job_worker_column,
+]
+
+
+def _run(conn):
+    for migration in MIGRATIONS:
+        migration(conn)
+
+
+async def run_migrations(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(_run)
@@ -1,11 +1,31 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Enum
+import json
+from datetime import datetime
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, DateTime, Enum, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 
 from database import Base
 from schemas import EventType
 
 
+class DateTimeList(TypeDecorator):
+    """A list of naive datetimes stored as a JSON array of ISO strings."""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return json.dumps(sorted(v.isoformat() for v in value))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return [datetime.fromisoformat(v) for v in json.loads(value)]
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -30,12 +50,23 @@ class Event(Base):
     description = Column(String, nullable=True)
     estimated_minutes = Column(Integer, nullable=True)
     status = Column(String, nullable=True)
+    # Set on work sessions placed by the scheduler
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=True)
+    # Recurring series: start/end are the first occurrence, expanded by the RRULE minus exdates
+    rrule = Column(String, nullable=True)
+    exdates = Column(DateTimeList, nullable=True)
+    # Set on an edited occurrence of a series: the series and the start it replaces
+    series_id = Column(Integer, ForeignKey("events.id"), nullable=True)
+    original_start = Column(DateTime, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     owner_id = Column(String, ForeignKey("users.id"))
     owner = relationship("User", back_populates="events")
 
+    # Serves per-user calendar windows and keyset pagination on start_datetime
+    __table_args__ = (Index("ix_events_owner_start", "owner_id", "start_datetime"),)
+
 
 
 class Assignment(Base):
@@ -45,8 +76,70 @@ class Assignment(Base):
     title = Column(String, index=True, nullable=False)
     subject = Column(String, nullable=True)
     estimated_minutes = Column(Integer, nullable=True)
+    priority = Column(Integer, nullable=True)
+    due_datetime = Column(DateTime, nullable=True)
+    # Where estimated_minutes came from: "llm", "local" (heuristic, possibly refined later) or NULL if entered by hand
+    estimate_source = Column(String, nullable=True)
+    # JSON features of the assignment text, used to calibrate the local estimator
+    estimate_features = Column(Text, nullable=True)
+    # OCR text of the uploaded file, kept for full-text search
+    source_text = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     owner_id = Column(String, ForeignKey("users.id"))
     owner = relationship("User", back_populates="assignments")
+
+
+class CacheEntry(Base):
+    __tablename__ = "cache_entries"
+
+    namespace = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    accessed_at = Column(DateTime, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=True)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False, index=True)
+    stage = Column(String, nullable=True)
+    title = Column(String, nullable=False)
+    subject = Column(String, nullable=True)
+    content_type = Column(String, nullable=False)
+    custom_instructions = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    # Server process that claimed the job while it runs
+    worker = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    owner_id = Column(String, ForeignKey("users.id"), index=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=True)
+
+
+class Change(Base):
+    """
+    Change log behind delta sync and collection ETags. Only the latest change
+    per row is kept; deleted rows stay as tombstones (op == "delete").
+    """
+    __tablename__ = "changes"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    owner_id = Column(String, nullable=False)
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_changes_owner_entity_seq", "owner_id", "entity", "seq"),
+        Index("ix_changes_entity_row", "entity", "entity_id"),
+        # Without AUTOINCREMENT SQLite reuses the highest seq once its row is replaced,
+        # and a client already at that cursor would never see the new change
+        {"sqlite_autoincrement": True},
+    )
@@ -0,0 +1,295 @@
+import asyncio
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import admission
+import metrics
+from cache import TieredCache
+
+load_dotenv()
+
+# Number of worker processes used for OCR. Defaults to one per core.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or (os.cpu_count() or 1)
+# Resolution PDF pages are rendered at before OCR.
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+# Pages past this limit are ignored.
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "50"))
+# How many pages a worker holds in memory at once while rendering.
+OCR_PAGE_WINDOW = int(os.getenv("OCR_PAGE_WINDOW", "1"))
+# A page whose embedded text layer is shorter than this is OCRed instead.
+OCR_TEXT_LAYER_MIN_CHARS = int(os.getenv("OCR_TEXT_LAYER_MIN_CHARS", "20"))
+# Size of the in-memory tier of the OCR result cache, in characters of text.
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Number of OCR results kept in the database tier.
+OCR_CACHE_MAX_ROWS = int(os.getenv("OCR_CACHE_MAX_ROWS", "10000"))
+
+# Clean-up applied to each image before Tesseract, in pipeline order; "none" disables it.
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "downscale,grayscale,binarize,deskew,crop")
+# Pages are scaled down to this resolution before OCR; body text stays legible well below 300 dpi.
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "200"))
+OCR_MAX_SKEW_DEGREES = float(os.getenv("OCR_MAX_SKEW_DEGREES", "5"))
+# Tesseract settings per input type. Photos get automatic page segmentation;
+# rendered PDF pages are clean single-column documents.
+OCR_TESSERACT_CONFIG_IMAGE = os.getenv("OCR_TESSERACT_CONFIG_IMAGE", "--oem 1 --psm 3")
+OCR_TESSERACT_CONFIG_PDF = os.getenv("OCR_TESSERACT_CONFIG_PDF", "--oem 1 --psm 4")
+
+IMAGE_TYPES = ("image/jpeg", "image/png")
+PDF_TYPE = "application/pdf"
+# Page objects in an uncompressed PDF; "/Type /Pages" is the page tree
+_PDF_PAGE = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+# Assumed page size when the page objects are hidden in compressed object streams
+PDF_BYTES_PER_PAGE = 100 * 1024
+# Admission cost is counted in letter pages at this resolution
+COST_BASE_DPI = 200
+
+
+@dataclass(frozen=True)
+class PreprocessOptions:
+    steps: Tuple[str, ...] = tuple(
+        step.strip() for step in OCR_PREPROCESS.split(",") if step.strip() and step.strip() != "none"
+    )
+    target_dpi: int = OCR_TARGET_DPI
+    max_skew_degrees: float = OCR_MAX_SKEW_DEGREES
+    crop_margin_inches: float = 0.1
+
+
+# --- Worker functions (run inside the process pool) ---
+# Pillow, pytesseract and pdf2image are imported inside the workers only, so
+# importing this module (and booting the web server) stays cheap. Workers
+# time their own stages and return the durations alongside the text.
+def _tesseract(image, dpi: float, config: str, options: PreprocessOptions, timings: Dict[str, float]) -> str:
+    """Preprocesses one page image and OCRs it, adding both durations to `timings`."""
+    import pytesseract
+    import preprocess
+
+    started = time.perf_counter()
+    if options.steps:
+        image, dpi = preprocess.preprocess(image, dpi, options)
+    preprocessed = time.perf_counter()
+    text = pytesseract.image_to_string(image, config=f"{config} --dpi {round(dpi)}")
+    timings["preprocess"] = timings.get("preprocess", 0.0) + preprocessed - started
+    timings["tesseract"] = timings.get("tesseract", 0.0) + time.perf_counter() - preprocessed
+    return text
+
+
+def _ocr_image(path: str, options: PreprocessOptions = PreprocessOptions(),
+               config: str = OCR_TESSERACT_CONFIG_IMAGE) -> Tuple[str, Dict[str, float]]:
+    import preprocess
+    from PIL import Image, ImageOps
+
+    started = time.perf_counter()
+    # Phone photos are often stored sideways with an EXIF orientation tag
+    image = Image.open(path)
+    dpi = preprocess.estimate_dpi(image)
+    if "downscale" in options.steps:
+        dpi = preprocess.draft(image, dpi, options.target_dpi)
+    image = ImageOps.exif_transpose(image)
+    timings = {"image_decode": time.perf_counter() - started}
+    text = _tesseract(image, dpi, config, options, timings)
+    return text, timings
+
+
+def _read_pdf(path: str, max_pages: int) -> List[Optional[str]]:
+    """
+    Returns the embedded text of each page to process, up to `max_pages`.
+    Pages without a usable text layer are None and still need OCR.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:  # Text-layer extraction is optional
+        PdfReader = None
+    if PdfReader is not None:
+        try:
+            reader = PdfReader(path)
+            page_count = min(len(reader.pages), max_pages)
+            texts = []
+            for i in range(page_count):
+                text = reader.pages[i].extract_text() or ""
+                texts.append(text if len(text.strip()) >= OCR_TEXT_LAYER_MIN_CHARS else None)
+            return texts
+        except Exception:
+            pass  # Fall back to rasterizing every page
+    from pdf2image import pdfinfo_from_path
+
+    page_count = min(int(pdfinfo_from_path(path)["Pages"]), max_pages)
+    return [None] * page_count
+
+
+def _page_runs(pages: List[int], window: int) -> List[Tuple[int, int]]:
+    """Groups sorted page numbers into consecutive (first, last) runs of at most `window` pages."""
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][1] + 1 and page - runs[-1][0] < window:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
+
+
+def _ocr_pdf_pages(path: str, pages: List[int], dpi: int, window: int,
+                   options: PreprocessOptions = PreprocessOptions(),
+                   config: str = OCR_TESSERACT_CONFIG_PDF) -> Tuple[List[str], Dict[str, float]]:
+    """Renders and OCRs `pages` a window at a time, so only `window` images are alive at once."""
+    from pdf2image import convert_from_path
+
+    texts = []
+    timings = {"pdf_rasterize": 0.0}
+    for first, last in _page_runs(pages, window):
+        started = time.perf_counter()
+        # Render straight to grayscale when preprocessing would discard the color anyway
+        images = convert_from_path(
+            path, dpi=dpi, first_page=first, last_page=last, grayscale=bool(options.steps),
+        )
+        timings["pdf_rasterize"] += time.perf_counter() - started
+        for img in images:
+            texts.append(_tesseract(img, dpi, config, options, timings))
+            img.close()
+        del images
+    return texts, timings
+
+
+def _split(items: list, parts: int) -> List[list]:
+    """Splits `items` into at most `parts` contiguous, similarly sized slices."""
+    parts = max(1, min(parts, len(items)))
+    size, extra = divmod(len(items), parts)
+    slices = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(items[start:end])
+        start = end
+    return slices
+
+
+def count_pdf_pages(path: str, max_pages: int) -> int:
+    """
+    Estimates a PDF's page count from its page objects without parsing it,
+    reading one chunk at a time; falls back to the file size when the objects
+    are compressed. Runs in a thread: it is cheap next to OCR, not free.
+    """
+    pages = 0
+    tail = b""
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            buffer = tail + chunk
+            # Matches within the carried-over tail were counted with the previous chunk
+            pages += sum(1 for match in _PDF_PAGE.finditer(buffer) if match.end() > len(tail))
+            tail = buffer[-32:]
+        size = f.tell()
+    if not pages:
+        pages = 1 + size // PDF_BYTES_PER_PAGE
+    return max(1, min(pages, max_pages))
+
+
+# --- Engine ---
+class OCREngine:
+    """
+    Runs Tesseract and PDF rasterization in a process pool so the event loop
+    never blocks on OCR. Pages with an embedded text layer are read directly;
+    the rest are split across the workers and rendered one window at a time.
+    Every page image is cleaned up by `preprocess` before Tesseract sees it.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        dpi: int = OCR_DPI,
+        max_pages: int = OCR_MAX_PAGES,
+        page_window: int = OCR_PAGE_WINDOW,
+        preprocess: PreprocessOptions = PreprocessOptions(),
+    ):
+        self.max_workers = max_workers or OCR_WORKERS
+        self.dpi = dpi
+        self.max_pages = max_pages
+        self.page_window = max(1, page_window)
+        self.preprocess = preprocess
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    async def ocr_image(self, path: str) -> str:
+        text, timings = await self._run(_ocr_image, path, self.preprocess)
+        for name, seconds in timings.items():
+            metrics.observe_stage(name, seconds)
+        return text
+
+    async def ocr_pdf(self, path: str) -> str:
+        with metrics.stage("pdf_text_layer"):
+            texts = await self._run(_read_pdf, path, self.max_pages)
+        missing = [i + 1 for i, text in enumerate(texts) if text is None]
+        if missing:
+            chunks = _split(missing, self.max_workers)
+            results = await asyncio.gather(*(
+                self._run(_ocr_pdf_pages, path, chunk, self.dpi, self.page_window, self.preprocess)
+                for chunk in chunks
+            ))
+            for chunk, (chunk_texts, timings) in zip(chunks, results):
+                for page, text in zip(chunk, chunk_texts):
+                    texts[page - 1] = text
+                for name, seconds in timings.items():
+                    metrics.observe_stage(name, seconds)
+        # Form feeds mark page breaks, as in Tesseract's own output
+        return "\f".join(text.rstrip("\f") for text in texts)
+
+    async def cost(self, path: str, content_type: str) -> float:
+        """Admission cost of OCRing a file: pages times (DPI / COST_BASE_DPI)², since Tesseract's time follows the pixel count."""
+        if content_type == PDF_TYPE:
+            pages = await asyncio.to_thread(count_pdf_pages, path, self.max_pages)
+            dpi = self.dpi
+        else:
+            pages = 1
+            dpi = self.preprocess.target_dpi if "downscale" in self.preprocess.steps else self.dpi
+        return pages * (dpi / COST_BASE_DPI) ** 2
+
+    def cache_key(self, digest: str, content_type: str) -> str:
+        """SHA-256 of the upload plus every setting that changes the extracted text."""
+        config = OCR_TESSERACT_CONFIG_PDF if content_type == PDF_TYPE else OCR_TESSERACT_CONFIG_IMAGE
+        settings = f"{content_type}:{self.dpi}:{self.max_pages}:{OCR_TEXT_LAYER_MIN_CHARS}:{self.preprocess}:{config}"
+        return f"{digest}:{settings}"
+
+    async def extract_text(self, path: str, content_type: str, digest: str,
+                           owner_id: Optional[str] = None, shed: bool = True) -> str:
+        """
+        OCRs the image or PDF at `path`, serving repeated uploads from the
+        result cache. Workers read the file themselves, so its bytes are
+        never copied through the event loop or the pool's pipes.
+
+        Cache misses go through `admission.ocr`, charged to `owner_id`, and
+        raise admission.Shed when it refuses them (unless `shed` is False).
+        """
+        key = self.cache_key(digest, content_type)
+        with metrics.stage("ocr_cache_lookup"):
+            text = await cache.get(key)
+        if text is not None:
+            return text
+        cost = await self.cost(path, content_type)
+        async with admission.ocr.admit(owner_id, cost, shed=shed):
+            with metrics.stage("ocr"):
+                if content_type == PDF_TYPE:
+                    text = await self.ocr_pdf(path)
+                else:
+                    text = await self.ocr_image(path)
+        await cache.set(key, text)
+        return text
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cache = TieredCache("ocr", max_entries=4096, max_bytes=OCR_CACHE_MAX_BYTES, max_rows=OCR_CACHE_MAX_ROWS)
+engine = OCREngine()
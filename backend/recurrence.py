@@ -0,0 +1,233 @@
+import calendar
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upper bound on the occurrences one series yields for one window, so a daily
+# rule over a century-wide window cannot stall a request.
+RECURRENCE_MAX_OCCURRENCES = int(os.getenv("RECURRENCE_MAX_OCCURRENCES", "5000"))
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+# A rule that matches nothing (say, the 31st of every February) stops after this many empty periods
+_MAX_EMPTY_PERIODS = 1000
+
+
+# --- Rules ---
+@dataclass(frozen=True)
+class Rule:
+    """
+    The supported subset of an RFC 5545 RRULE: FREQ, INTERVAL, COUNT, UNTIL,
+    BYDAY (with ordinals such as 2TU or -1FR in monthly and yearly rules),
+    BYMONTHDAY and BYMONTH. Occurrences keep the time of day of the first one.
+    """
+
+    freq: str
+    interval: int = 1
+    count: Optional[int] = None
+    until: Optional[datetime] = None
+    # (ordinal, weekday) pairs; ordinal 0 means every such weekday in the period
+    by_day: Tuple[Tuple[int, int], ...] = ()
+    by_month_day: Tuple[int, ...] = ()
+    by_month: Tuple[int, ...] = ()
+
+
+def _int(value: str, name: str, low: int, high: int) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if not (low <= abs(number) <= high) or (number < 0 and name not in ("BYMONTHDAY", "BYDAY")):
+        raise ValueError(f"{name} is out of range")
+    return number
+
+
+def _until(value: str) -> datetime:
+    # UTC "Z" suffix or not, naive datetimes are stored throughout
+    value = value.rstrip("Z")
+    for layout in ("%Y%m%dT%H%M%S", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, layout)
+        except ValueError:
+            pass
+    raise ValueError("UNTIL must be a date (YYYYMMDD) or date-time (YYYYMMDDTHHMMSS)")
+
+
+def parse_rule(text: str) -> Rule:
+    """
+    Parses an RRULE such as "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20250601".
+    A leading "RRULE:" is accepted. Raises ValueError naming the bad part.
+    """
+    text = (text or "").strip()
+    if text.upper().startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+    parts = {}
+    for part in filter(None, text.upper().split(";")):
+        name, _, value = part.partition("=")
+        if not value:
+            raise ValueError(f"Expected NAME=VALUE, got '{part}'")
+        parts[name] = value
+
+    freq = parts.pop("FREQ", None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+    interval = _int(parts.pop("INTERVAL", "1"), "INTERVAL", 1, 1000)
+    count = _int(parts.pop("COUNT"), "COUNT", 1, 100000) if "COUNT" in parts else None
+    until = _until(parts.pop("UNTIL")) if "UNTIL" in parts else None
+    if count is not None and until is not None:
+        raise ValueError("COUNT and UNTIL cannot both be set")
+
+    by_day = []
+    for item in filter(None, parts.pop("BYDAY", "").split(",")):
+        ordinal, weekday = item[:-2], item[-2:]
+        if weekday not in WEEKDAYS:
+            raise ValueError(f"Unknown weekday '{weekday}' in BYDAY")
+        ordinal = _int(ordinal, "BYDAY", 1, 53) if ordinal not in ("", "+") else 0
+        if ordinal and freq not in ("MONTHLY", "YEARLY"):
+            raise ValueError("BYDAY ordinals are only allowed in MONTHLY and YEARLY rules")
+        by_day.append((ordinal, WEEKDAYS.index(weekday)))
+    by_month_day = [_int(v, "BYMONTHDAY", 1, 31) for v in filter(None, parts.pop("BYMONTHDAY", "").split(","))]
+    by_month = [_int(v, "BYMONTH", 1, 12) for v in filter(None, parts.pop("BYMONTH", "").split(","))]
+    if freq == "YEARLY" and any(ordinal for ordinal, _ in by_day) and not by_month:
+        raise ValueError("BYDAY ordinals in YEARLY rules need BYMONTH")
+    # WKST only matters for weekly rules with INTERVAL > 1 and BYDAY; Monday is assumed
+    parts.pop("WKST", None)
+    if parts:
+        raise ValueError(f"Unsupported RRULE parts: {', '.join(sorted(parts))}")
+    return Rule(freq, interval, count, until, tuple(by_day), tuple(by_month_day), tuple(by_month))
+
+
+# --- Expansion ---
+def _month_days(year: int, month: int, rule: Rule, default_day: int) -> List[int]:
+    """Days of one month selected by BYMONTHDAY and BYDAY (both must match when both are given)."""
+    length = calendar.monthrange(year, month)[1]
+    days = None
+    if rule.by_month_day:
+        days = {d if d > 0 else length + d + 1 for d in rule.by_month_day}
+    if rule.by_day:
+        weekday_of_first = calendar.monthrange(year, month)[0]
+        matched = set()
+        for ordinal, weekday in rule.by_day:
+            first = 1 + (weekday - weekday_of_first) % 7
+            candidates = list(range(first, length + 1, 7))
+            if ordinal == 0:
+                matched.update(candidates)
+            elif abs(ordinal) <= len(candidates):
+                matched.add(candidates[ordinal - 1 if ordinal > 0 else ordinal])
+        days = matched if days is None else days & matched
+    if days is None:
+        days = {default_day}
+    return sorted(d for d in days if 1 <= d <= length)
+
+
+def _add_months(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def _period_days(rule: Rule, first: date, period: int) -> List[date]:
+    """Candidate days of the `period`-th period (counted in INTERVAL steps) after the first occurrence's."""
+    step = period * rule.interval
+    if rule.freq == "DAILY":
+        days = [first + timedelta(days=step)]
+    elif rule.freq == "WEEKLY":
+        monday = first - timedelta(days=first.weekday()) + timedelta(weeks=step)
+        weekdays = sorted({weekday for _, weekday in rule.by_day}) or [first.weekday()]
+        days = [monday + timedelta(days=weekday) for weekday in weekdays]
+    elif rule.freq == "MONTHLY":
+        year, month = _add_months(first.year, first.month, step)
+        days = [date(year, month, d) for d in _month_days(year, month, rule, first.day)]
+    else:
+        year = first.year + step
+        if not 1 <= year <= 9999:
+            return []
+        months = rule.by_month or (first.month,)
+        days = [date(year, month, d) for month in sorted(months) for d in _month_days(year, month, rule, first.day)]
+
+    # BY* parts that do not expand the period only filter it
+    if rule.by_month and rule.freq in ("DAILY", "WEEKLY", "MONTHLY"):
+        days = [d for d in days if d.month in rule.by_month]
+    if rule.freq == "DAILY":
+        if rule.by_day:
+            days = [d for d in days if d.weekday() in {weekday for _, weekday in rule.by_day}]
+        if rule.by_month_day:
+            length = calendar.monthrange(days[0].year, days[0].month)[1] if days else 0
+            days = [d for d in days if d.day in {m if m > 0 else length + m + 1 for m in rule.by_month_day}]
+    return days
+
+
+def _first_period(rule: Rule, first: date, until: date) -> int:
+    """Index of the last period that starts on or before `until`, used to skip straight to a window."""
+    if rule.freq == "DAILY":
+        elapsed = (until - first).days
+    elif rule.freq == "WEEKLY":
+        elapsed = ((until - timedelta(days=until.weekday())) - (first - timedelta(days=first.weekday()))).days // 7
+    elif rule.freq == "MONTHLY":
+        elapsed = (until.year - first.year) * 12 + until.month - first.month
+    else:
+        elapsed = until.year - first.year
+    return max(0, elapsed // rule.interval)
+
+
+def iter_starts(dtstart: datetime, rule: Rule, after: Optional[datetime] = None) -> Iterator[datetime]:
+    """
+    Yields the start of every occurrence in order, lazily; infinite unless the
+    rule has COUNT or UNTIL. Passing `after` skips whole periods before it when
+    the rule has no COUNT (counted rules have to be walked from the start).
+    Occurrences before `after` may still be yielded.
+    """
+    first = dtstart.date()
+    period = 0
+    if after is not None and rule.count is None and after.date() > first:
+        period = _first_period(rule, first, after.date())
+    emitted = empty = 0
+    while empty < _MAX_EMPTY_PERIODS:
+        try:
+            days = _period_days(rule, first, period)
+        except (OverflowError, ValueError):
+            return  # Past year 9999
+        period += 1
+        empty = 0 if days else empty + 1
+        for day in days:
+            start = datetime.combine(day, dtstart.time())
+            if start < dtstart:
+                continue
+            if rule.until is not None and start > rule.until:
+                return
+            yield start
+            emitted += 1
+            if rule.count is not None and emitted >= rule.count:
+                return
+
+
+def occurrences(
+    dtstart: datetime,
+    dtend: datetime,
+    rule: Rule,
+    start: datetime,
+    end: datetime,
+    exdates: Iterable[datetime] = (),
+) -> Iterator[Tuple[datetime, datetime]]:
+    """Yields (start, end) of the occurrences overlapping [start, end), skipping `exdates`."""
+    duration = dtend - dtstart
+    excluded = set(exdates)
+    yielded = 0
+    for occurrence in iter_starts(dtstart, rule, after=start - duration):
+        if occurrence >= end or yielded >= RECURRENCE_MAX_OCCURRENCES:
+            return
+        if occurrence + duration > start and occurrence not in excluded:
+            yielded += 1
+            yield occurrence, occurrence + duration
+
+
+def is_occurrence(dtstart: datetime, rule: Rule, moment: datetime) -> bool:
+    for occurrence in iter_starts(dtstart, rule, after=moment):
+        if occurrence >= moment:
+            return occurrence == moment
+    return False
+
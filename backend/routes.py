@@ -1,27 +1,36 @@
-from typing import List
+from typing import List, Tuple
+import asyncio
+import hashlib
+import hmac
+import json
 import os
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException, Depends, Request, File, UploadFile, Query, Form
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response, File, UploadFile, Query, Form
+from fastapi.responses import RedirectResponse, StreamingResponse
 from starlette.config import Config
 from authlib.integrations.starlette_client import OAuth
 from jose import jwt, JWTError
 from fastapi.security import OAuth2PasswordBearer
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
-import pytesseract
-from PIL import Image
-import io
-from pdf2image import convert_from_bytes
-import requests
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import LLM
 from typing import Optional
+import admission
 import models
 import schemas
 import crud
-from database import SessionLocal
-import schemas
-import httpx
+import auth_cache
+import ocr
+import cache
+import estimator
+import feed
+import jobs
+import metrics
+import scheduler
+import search
+import uploads
+from database import SessionLocal, get_db
 
 
 # Load environment variables
@@ -44,48 +53,57 @@ JWT_SECRET = os.getenv("APP_JWT_SECRET")
 JWT_ALG = "HS256"
 JWT_EXP_MIN = 60 * 24  # 24 hours
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Maximum number of operations accepted by POST /events/bulk
+EVENTS_BULK_MAX_OPERATIONS = int(os.getenv("EVENTS_BULK_MAX_OPERATIONS", "5000"))
+# Maximum number of LLM estimates a single batch upload runs at once
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+# Recurring events count as busy time this many days past a scheduling window, so nearby windows reuse the planner
+SCHEDULE_RECURRENCE_DAYS = int(os.getenv("SCHEDULE_RECURRENCE_DAYS", "30"))
+# Bearer token that /metrics and /cache/stats require, e.g. Prometheus' `authorization` credentials.
+# They report on every user's load, so without it both are disabled.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-# --- Database Dependency ---
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # --- User CRUD Functions ---
-def get_user_by_google_sub(db: Session, google_sub: str):
-    return db.query(models.User).filter(models.User.google_sub == google_sub).first()
+async def get_user_by_google_sub(db: AsyncSession, google_sub: str):
+    return await db.scalar(select(models.User).where(models.User.google_sub == google_sub))
 
-def get_user_by_id(db: Session, user_id: str):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(db: AsyncSession, user_id: str):
+    return await db.get(models.User, user_id)
 
-def create_user(db: Session, email: str, google_sub: str):
+async def create_user(db: AsyncSession, email: str, google_sub: str):
     db_user = models.User(id=f"user_{google_sub}", email=email, google_sub=google_sub)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    auth_cache.invalidate_user(db_user.id)
     return db_user
 
 # --- Authentication Dependencies ---
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG], options={"verify_exp": True})
-        user_id: str = payload.get("user_id")
-        if user_id is None:
+    payload = auth_cache.get_token_payload(token, JWT_SECRET)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG], options={"verify_exp": True})
+        except JWTError:
             raise credentials_exception
-    except JWTError:
+        auth_cache.set_token_payload(token, payload, JWT_SECRET)
+    user_id: str = payload.get("user_id")
+    if user_id is None:
         raise credentials_exception
-    
-    user = get_user_by_id(db, user_id)
+
+    user = auth_cache.get_user(user_id)
     if user is None:
-        raise credentials_exception
+        user = await get_user_by_id(db, user_id)
+        if user is None:
+            raise credentials_exception
+        auth_cache.set_user(user)
     return user
 
 # --- Routes ---
@@ -96,7 +114,7 @@ async def google_login(request: Request):
 
 
 @router.get("/auth/google/callback")
-async def google_callback(request: Request, db: Session = Depends(get_db)):
+async def google_callback(request: Request, db: AsyncSession = Depends(get_db)):
     token = await oauth.google.authorize_access_token(request)
     userinfo = token.get('userinfo')
     if not userinfo:
@@ -104,9 +122,9 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
         
     google_sub = userinfo["sub"]
 
-    user = get_user_by_google_sub(db, google_sub=google_sub)
+    user = await get_user_by_google_sub(db, google_sub=google_sub)
     if not user:
-        user = create_user(
+        user = await create_user(
             db=db,
             email=userinfo.get("email"),
             google_sub=google_sub
@@ -122,24 +140,148 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
 async def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
+async def collection_etag(request: Request, db: AsyncSession, owner_id: str, entity: str) -> str:
+    """
+    Weak ETag for a user's collection: the latest change-log sequence number
+    plus the query string, so different windows/pages get different tags.
+    """
+    version = await crud.collection_version(db, owner_id, entity)
+    query = hashlib.sha1(request.url.query.encode()).hexdigest()[:12]
+    return f'W/"{entity}-{version}-{query}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
 @router.get("/events", response_model=List[schemas.Event])
-async def list_events(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(models.Event).filter(models.Event.owner_id == current_user.id).all()
+async def list_events(
+    request: Request,
+    response: Response,
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    limit: Optional[int] = Query(default=None, ge=1, le=1000),
+    cursor: Optional[str] = Query(default=None),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Lists the user's events, optionally only those overlapping [start, end).
+    With a limit, the cursor for the next page is sent in the X-Next-Cursor header.
+    Answers 304 if the collection has not changed since the client's ETag.
+    """
+    etag = await collection_etag(request, db, current_user.id, crud.EVENT)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    start, end = schemas.naive_utc(start), schemas.naive_utc(end)
+
+    after = None
+    if cursor:
+        try:
+            after = crud.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    events = await crud.list_events(
+        db, current_user.id, start=start, end=end,
+        limit=limit + 1 if limit else None, after=after
+    )
+    if limit and len(events) > limit:
+        events = events[:limit]
+        response.headers["X-Next-Cursor"] = crud.encode_cursor(events[-1])
+    return events
+
+@router.get("/sync", response_model=schemas.SyncResponse)
+async def sync(cursor: int = Query(default=0, ge=0), current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    Returns events and assignments changed since `cursor` plus tombstones for
+    deleted ones. Pass the returned cursor on the next call; 0 gets everything,
+    as a snapshot with `reset` set.
+    """
+    return await crud.sync_changes(db, current_user.id, cursor)
+
+@router.get("/sync/stream")
+async def sync_stream(
+    request: Request,
+    cursor: Optional[int] = Query(default=None, ge=0),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Streams the user's changes as Server-Sent Events. Every event is a delta
+    shaped like GET /sync, sent whenever an event or assignment of the user
+    changes, with the new cursor as its id. Starts after `cursor` or the
+    Last-Event-ID header, so a reconnecting client misses nothing; without
+    either, only changes from now on are sent.
+    """
+    if cursor is None:
+        try:
+            cursor = int(request.headers.get("last-event-id", ""))
+        except ValueError:
+            cursor = None
+    # The stream may stay open for hours; it must not hold a pooled connection
+    await db.close()
+    owner_id = current_user.id
+    # Subscribe before the first read so no change is missed in between
+    signal = feed.hub.subscribe(owner_id)
+
+    async def event_stream():
+        nonlocal cursor
+        try:
+            if cursor is None:
+                async with SessionLocal() as session:
+                    cursor = await crud.collection_version(session, owner_id)
+                yield f"id: {cursor}\ndata: {json.dumps({'cursor': cursor})}\n\n"
+            while True:
+                signal.clear()
+                async with SessionLocal() as session:
+                    delta = await crud.sync_changes(session, owner_id, cursor)
+                    if delta["cursor"] != cursor:
+                        cursor = delta["cursor"]
+                        payload = schemas.SyncResponse.model_validate(delta).model_dump_json()
+                        yield f"id: {cursor}\ndata: {payload}\n\n"
+                while not signal.is_set():
+                    try:
+                        await asyncio.wait_for(signal.wait(), timeout=feed.FEED_KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+        finally:
+            feed.hub.unsubscribe(owner_id, signal)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.post("/events", response_model=schemas.Event)
-async def create_event(event_data: schemas.EventCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_event(event_data: schemas.EventCreate, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     new_event = models.Event(
         **event_data.model_dump(),
         owner_id=current_user.id
     )
     db.add(new_event)
-    db.commit()
-    db.refresh(new_event)
+    await db.flush()
+    await crud.record_changes(db, current_user.id, crud.EVENT, [new_event.id])
+    await db.commit()
+    await db.refresh(new_event)
+    if new_event.rrule:
+        scheduler.invalidate(current_user.id)
+    else:
+        scheduler.event_changed(current_user.id, new_event.id, new_event.start_datetime, new_event.end_datetime)
     return new_event
 
+@router.post("/events/bulk", response_model=schemas.EventBulkResponse)
+async def bulk_events(request: schemas.EventBulkRequest, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    Applies many event creates, updates and deletes in one transaction and
+    reports a status per operation.
+    """
+    if len(request.operations) > EVENTS_BULK_MAX_OPERATIONS:
+        raise HTTPException(status_code=413, detail=f"At most {EVENTS_BULK_MAX_OPERATIONS} operations per request.")
+    results = await crud.bulk_apply_events(db, current_user.id, request.operations)
+    scheduler.invalidate(current_user.id)
+    return {"results": results}
+
 @router.get("/events/{event_id}", response_model=schemas.Event)
-async def get_event(event_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+async def get_event(event_id: int, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    event = await db.get(models.Event, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     if event.owner_id != current_user.id:
@@ -147,28 +289,36 @@ async def get_event(event_id: int, current_user: models.User = Depends(get_curre
     return event
 
 @router.put("/events/{event_id}", response_model=schemas.Event)
-def update_single_event(
+async def update_single_event(
     event_id: int,
     event_update: schemas.EventUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update an existing event by its ID.
     """
     # First, retrieve the event from the database
-    db_event = crud.get_event(db, event_id=event_id)
+    db_event = await crud.get_event(db, event_id=event_id)
 
     if db_event is None:
         raise HTTPException(status_code=404, detail="Event not found")
+    was_recurring = db_event.rrule is not None
 
     # Now, pass the existing event and the update data to the CRUD function
-    updated_event = crud.update_event(db=db, db_event=db_event, update_data=event_update)
+    try:
+        updated_event = await crud.update_event(db=db, db_event=db_event, update_data=event_update)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    if was_recurring or updated_event.rrule:
+        scheduler.invalidate(updated_event.owner_id)
+    elif updated_event.assignment_id is None:
+        scheduler.event_changed(updated_event.owner_id, updated_event.id, updated_event.start_datetime, updated_event.end_datetime)
 
     return updated_event
 
 @router.delete("/events/{event_id}", response_model=dict)
-async def delete_event(event_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    event_to_delete = db.query(models.Event).filter(models.Event.id == event_id).first()
+async def delete_event(event_id: int, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    event_to_delete = await db.get(models.Event, event_id)
     
     if not event_to_delete:
         raise HTTPException(status_code=404, detail="Event not found")
@@ -176,106 +326,300 @@ async def delete_event(event_id: int, current_user: models.User = Depends(get_cu
     if event_to_delete.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this event")
     
-    db.delete(event_to_delete)
-    db.commit()
+    recurring = event_to_delete.rrule is not None
+    await db.delete(event_to_delete)
+    await crud.record_changes(db, current_user.id, crud.EVENT, [event_id], op=crud.DELETE)
+    if recurring:
+        await crud.delete_series_occurrences(db, current_user.id, [event_id])
+    await db.commit()
+    if recurring:
+        scheduler.invalidate(current_user.id)
+    else:
+        scheduler.event_changed(current_user.id, event_id)
     return {"detail": "Event deleted"}
 
+async def get_owned_series(event_id: int, current_user: models.User, db: AsyncSession) -> models.Event:
+    series = await db.get(models.Event, event_id)
+    if not series:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if series.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to modify this event")
+    if not series.rrule:
+        raise HTTPException(status_code=400, detail="The event does not recur")
+    return series
+
+@router.put("/events/{event_id}/occurrences/{original_start}", response_model=schemas.Event)
+async def update_occurrence(
+    event_id: int,
+    original_start: datetime,
+    event_update: schemas.EventUpdate,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Changes one occurrence of a recurring event, identified by the start the
+    rule gives it. The occurrence becomes an event of its own linked to the series.
+    """
+    series = await get_owned_series(event_id, current_user, db)
+    try:
+        occurrence = await crud.edit_occurrence(db, series, schemas.naive_utc(original_start), event_update)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    scheduler.invalidate(current_user.id)
+    return occurrence
+
+@router.delete("/events/{event_id}/occurrences/{original_start}", response_model=dict)
+async def delete_occurrence(
+    event_id: int,
+    original_start: datetime,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cancels one occurrence of a recurring event."""
+    series = await get_owned_series(event_id, current_user, db)
+    try:
+        await crud.edit_occurrence(db, series, schemas.naive_utc(original_start))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    scheduler.invalidate(current_user.id)
+    return {"detail": "Occurrence deleted"}
 
 
-async def ocr_from_file(file: UploadFile) -> str:
-    file_bytes = await file.read()
-    content_type = file.content_type.lower()
-
-    if content_type in ("image/jpeg", "image/png"):
-        image = Image.open(io.BytesIO(file_bytes))
-        return pytesseract.image_to_string(image)
-
-    if content_type == "application/pdf":
-        images = convert_from_bytes(file_bytes)
-        return "".join(pytesseract.image_to_string(img) for img in images)
-
-    raise HTTPException(
-        status_code=400,
-        detail="Invalid file format. Only JPEG, PNG, or PDF allowed."
+# --- Scheduling ---
+async def get_planner(db: AsyncSession, owner_id: str, start: datetime, end: datetime) -> scheduler.Planner:
+    """
+    Returns the user's cached planner, building its interval index on first use.
+    Recurring events are expanded as busy time up to SCHEDULE_RECURRENCE_DAYS
+    past `end`; the index is rebuilt when a window reaches beyond that, or
+    when the change log shows event writes this process did not apply.
+    """
+    planner = scheduler.planners.get(owner_id)
+    version = await crud.collection_version(db, owner_id, crud.EVENT)
+    if planner is not None and planner.version != version:
+        changed = set(await db.scalars(select(models.Change.entity_id).where(
+            models.Change.owner_id == owner_id, models.Change.entity == crud.EVENT, models.Change.seq > planner.version
+        )))
+        if not planner.catch_up(version, changed):
+            planner = None
+    if planner is None or not planner.covers(start, end):
+        rows = (await db.execute(
+            select(models.Event.id, models.Event.start_datetime, models.Event.end_datetime)
+            .where(models.Event.owner_id == owner_id, models.Event.assignment_id.is_(None), models.Event.rrule.is_(None))
+        )).all()
+        intervals = {event_id: (event_start, event_end) for event_id, event_start, event_end in rows}
+        horizon = (start, end + timedelta(days=SCHEDULE_RECURRENCE_DAYS))
+        series = await db.scalars(select(models.Event).where(
+            models.Event.owner_id == owner_id, models.Event.rrule.is_not(None), models.Event.start_datetime < horizon[1]
+        ))
+        # Occurrences get negative keys: they are never updated one by one, editing a series rebuilds the index
+        occurrences = [occurrence for s in series for occurrence in crud.expand_series(s, *horizon)]
+        intervals.update({-(i + 1): occurrence for i, occurrence in enumerate(occurrences)})
+        planner = scheduler.Planner(scheduler.IntervalIndex(intervals), horizon, version)
+        scheduler.planners.set(owner_id, planner)
+    return planner
+
+@router.post("/schedule", response_model=schemas.SchedulePlan)
+async def schedule_assignments(request: schemas.ScheduleRequest, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    Plans work sessions for the user's assignments in the free time between
+    their events, earliest due date first. With `commit`, the planned
+    sessions in the window are replaced by SCHOOL_TASK events.
+    """
+    start = request.start
+    if start is None:
+        # Round up to the next quarter hour so repeated calls reuse the cached plan
+        now = datetime.utcnow().replace(second=0, microsecond=0)
+        start = now + timedelta(minutes=-now.minute % 15)
+    end = request.end or start + timedelta(days=14)
+    if end <= start or request.max_session_minutes < request.min_session_minutes:
+        raise HTTPException(status_code=400, detail="Invalid scheduling window or session lengths.")
+    settings = scheduler.Settings(
+        start=start,
+        end=end,
+        day_start_hour=request.day_start_hour,
+        day_end_hour=request.day_end_hour,
+        min_session_minutes=request.min_session_minutes,
+        max_session_minutes=request.max_session_minutes,
+        break_minutes=request.break_minutes,
     )
 
-async def estimate_assignment_time(
-    assignment_text: str,
-    custom_instructions: str = ""
-) -> str:
-    system_message = {
-        "role": "system",
-        "content": (
-            "You have an extremely important job. You will be passed in assignments "
-            "(CONVERTED TO TEXT AND USUALLY FOR SCHOOL) and YOUR TASK is to accurately "
-            "estimate how long the assigment will take a student in minutes. "
-            "YOUR OUTPUT FORMAT SHOULD JUST BE A NUMBER (in minutes). "
-            "If the media provided does not look like an assignment output "
-            "'ASSIGNMENT NOT DETECTED'. Assume an average high school pace. "
-            "Make sure your response does not contain any \\n characters."
-        )
-    }
-
-    user_message = {
-        "role": "user",
-        "content": (
-            "ASSIGNMENT:\n"
-            f"{assignment_text}\n\n"
-            "CUSTOM INSTRUCTIONS:\n"
-            f"{custom_instructions or 'None'}"
+    # Minutes already worked in planned sessions before the window
+    done = {}
+    for assignment_id, session_start, session_end in await db.execute(
+        select(models.Event.assignment_id, models.Event.start_datetime, models.Event.end_datetime)
+        .where(models.Event.owner_id == current_user.id, models.Event.assignment_id.is_not(None), models.Event.end_datetime <= start)
+    ):
+        done[assignment_id] = done.get(assignment_id, 0) + int((session_end - session_start).total_seconds() // 60)
+    assignments = (await db.scalars(
+        select(models.Assignment).where(
+            models.Assignment.owner_id == current_user.id,
+            models.Assignment.estimated_minutes > 0,
         )
+    )).all()
+    tasks = [
+        scheduler.Task(a.id, a.title, a.subject, a.estimated_minutes - done.get(a.id, 0), a.priority, a.due_datetime)
+        for a in assignments
+        if a.estimated_minutes - done.get(a.id, 0) > 0 and (a.due_datetime is None or a.due_datetime > start)
+    ]
+    plan = (await get_planner(db, current_user.id, start, end)).plan(tasks, settings)
+
+    if request.commit:
+        replaced = (await db.scalars(
+            delete(models.Event).where(
+                models.Event.owner_id == current_user.id,
+                models.Event.assignment_id.is_not(None),
+                models.Event.start_datetime >= start,
+                models.Event.start_datetime < end,
+            ).returning(models.Event.id)
+        )).all()
+        await crud.record_changes(db, current_user.id, crud.EVENT, replaced, op=crud.DELETE)
+        if plan.sessions:
+            created = (await db.scalars(insert(models.Event).returning(models.Event.id, sort_by_parameter_order=True), [{
+                "title": session.title,
+                "subject": session.subject,
+                "start_datetime": session.start,
+                "end_datetime": session.end,
+                "event_type": schemas.EventType.SCHOOL_TASK,
+                "estimated_minutes": int((session.end - session.start).total_seconds() // 60),
+                "status": "planned",
+                "assignment_id": session.assignment_id,
+                "owner_id": current_user.id,
+            } for session in plan.sessions])).all()
+            await crud.record_changes(db, current_user.id, crud.EVENT, created)
+        await db.commit()
+
+    return {
+        "sessions": [
+            {"assignment_id": s.assignment_id, "title": s.title, "subject": s.subject, "start_datetime": s.start, "end_datetime": s.end}
+            for s in plan.sessions
+        ],
+        "unscheduled": [
+            {"assignment_id": assignment_id, "remaining_minutes": minutes}
+            for assignment_id, minutes in plan.unscheduled.items()
+        ],
     }
 
-    completion = LLM.client.chat.completions.create(
-        model="google/gemma-3-27b-it",
-        messages=[system_message, user_message]
+@router.get("/search", response_model=schemas.SearchResponse)
+async def search_documents(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[str] = Query(default=None, pattern="^(assignment|event)$"),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0, le=10000),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Full-text search over the user's assignments (title, subject and uploaded
+    text) and events (title, subject and description), best match first.
+    Every word must match; the last one may be a prefix.
+    """
+    results = await search.search(db, current_user.id, q, entity=type, limit=limit + 1, offset=offset)
+    next_offset = offset + limit if len(results) > limit else None
+    return {"results": results[:limit], "next_offset": next_offset}
+
+async def require_metrics_token(authorization: Optional[str] = Header(default=None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+
+@router.get("/cache/stats", dependencies=[Depends(require_metrics_token)])
+async def cache_stats():
+    return cache.stats()
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def too_busy(shed: admission.Shed) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many documents are being processed. Please try again shortly.",
+        headers={"Retry-After": str(shed.retry_after)},
     )
 
-    return completion.choices[0].message.content
+async def ocr_from_file(file: UploadFile, owner_id: str) -> str:
+    with metrics.stage("upload_spool"):
+        upload = await uploads.spool(file)
+    try:
+        return await ocr.engine.extract_text(upload.path, upload.content_type, upload.sha256, owner_id=owner_id)
+    except admission.Shed as shed:
+        raise too_busy(shed)
+    finally:
+        upload.remove()
+
+async def estimate_assignment(
+    assignment_text: str,
+    custom_instructions: str = "",
+    subject: str = "",
+    owner_id: Optional[str] = None
+) -> estimator.Estimate:
+    try:
+        return await estimator.estimate(assignment_text, custom_instructions, subject, owner_id=owner_id)
+    except LLM.LLMError:
+        raise HTTPException(status_code=502, detail="The time estimation service is unavailable. Please try again later.")
+    except admission.Shed as shed:
+        raise too_busy(shed)
 
 
 @router.post("/OCR")
-async def perform_ocr(file: UploadFile = File(...)):
-    text = await ocr_from_file(file)
+async def perform_ocr(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user)):
+    text = await ocr_from_file(file, current_user.id)
     return {"text": text}
 
 
 @router.post("/LLM")
 async def perform_llm(
     assignment_text: str,
-    custom_instructions: Optional[str] = Query(default="")
+    custom_instructions: Optional[str] = Query(default=""),
+    current_user: models.User = Depends(get_current_user)
 ):
-    response = await estimate_assignment_time(
+    estimate = await estimate_assignment(
         assignment_text,
-        custom_instructions
+        custom_instructions,
+        owner_id=current_user.id
     )
-    return {"response": response}
+    return {"response": estimate.outcome, "source": estimate.source}
 
 @router.post("/EstimateTime")
 async def estimate_time(
     file: UploadFile = File(...),
-    custom_instructions: Optional[str] = Query(default="")
+    custom_instructions: Optional[str] = Query(default=""),
+    current_user: models.User = Depends(get_current_user)
 ):
-    assignment_text = await ocr_from_file(file)
+    assignment_text = await ocr_from_file(file, current_user.id)
 
-    estimate = await estimate_assignment_time(
+    estimate = await estimate_assignment(
         assignment_text,
-        custom_instructions
+        custom_instructions,
+        owner_id=current_user.id
     )
 
-    return {"response": estimate}
+    return {"response": estimate.outcome, "source": estimate.source}
 
 
 #ASSIGNMENT FULL CREATIONS
+@router.get("/assignments", response_model=List[schemas.Assignment])
+async def list_assignments(request: Request, response: Response, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    etag = await collection_etag(request, db, current_user.id, crud.ASSIGNMENT)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return (await db.scalars(select(models.Assignment).where(models.Assignment.owner_id == current_user.id))).all()
+
 @router.post("/assignments", response_model=schemas.Assignment)
-async def create_assignment(assignment_data: schemas.CreateAssignment, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_assignment(assignment_data: schemas.CreateAssignment, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     new_assignment = models.Assignment(
         **assignment_data.model_dump(),
         owner_id=current_user.id
     )
     db.add(new_assignment)
-    db.commit()
-    db.refresh(new_assignment)
+    await db.flush()
+    await crud.record_changes(db, current_user.id, crud.ASSIGNMENT, [new_assignment.id])
+    await db.commit()
+    await db.refresh(new_assignment)
     return new_assignment
 
 @router.post("/assignments/upload", response_model=schemas.Assignment)
@@ -285,12 +629,12 @@ async def create_assignment_with_file(
     file: UploadFile = File(...),
     custom_instructions: Optional[str] = Form(None),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    assignment_text = await ocr_from_file(file)
-    estimated_time_str = await estimate_assignment_time(assignment_text, custom_instructions or "")
+    assignment_text = await ocr_from_file(file, current_user.id)
+    estimate = await estimate_assignment(assignment_text, custom_instructions or "", subject, current_user.id)
     try:
-        estimated_minutes = int(estimated_time_str)
+        estimated_minutes = int(estimate.outcome)
     except ValueError:
         raise HTTPException(status_code=400, detail="Could not estimate time for the assignment. The file might not be a valid assignment.")
 
@@ -298,9 +642,163 @@ async def create_assignment_with_file(
         title=title,
         subject=subject,
         estimated_minutes=estimated_minutes,
+        estimate_source=estimate.source,
+        estimate_features=estimate.features_json(),
+        source_text=assignment_text,
         owner_id=current_user.id
     )
-    db.add(new_assignment)
-    db.commit()
-    db.refresh(new_assignment)
+    with metrics.stage("db_commit"):
+        db.add(new_assignment)
+        await db.flush()
+        await crud.record_changes(db, current_user.id, crud.ASSIGNMENT, [new_assignment.id])
+        await db.commit()
+        await db.refresh(new_assignment)
+    estimator.refine_later(estimate, new_assignment.id)
     return new_assignment
+
+@router.post("/assignments/upload/batch", response_model=schemas.BatchUploadResponse)
+async def create_assignments_with_files(
+    subject: str = Form(...),
+    files: List[UploadFile] = File(...),
+    titles: Optional[List[str]] = Form(None),
+    custom_instructions: Optional[str] = Form(None),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Creates one assignment per uploaded file. Each file runs through OCR and
+    estimation independently, so OCR of one file overlaps the LLM call of
+    another, and a bad file only fails its own entry. All successful
+    assignments are inserted in a single transaction.
+    """
+    if titles and len(titles) != len(files):
+        raise HTTPException(status_code=400, detail="Provide one title per file, or none at all.")
+    llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def process(file: UploadFile) -> Tuple[str, estimator.Estimate]:
+        assignment_text = await ocr_from_file(file, current_user.id)
+        async with llm_slots:
+            estimate = await estimate_assignment(assignment_text, custom_instructions or "", subject, current_user.id)
+        try:
+            int(estimate.outcome)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Could not estimate time for the assignment. The file might not be a valid assignment.")
+        return assignment_text, estimate
+
+    outcomes = await asyncio.gather(*(process(file) for file in files), return_exceptions=True)
+
+    rows = []
+    estimates = []
+    results = []
+    for index, (file, outcome) in enumerate(zip(files, outcomes)):
+        result = schemas.BatchUploadResult(filename=file.filename or f"file {index + 1}")
+        if isinstance(outcome, HTTPException):
+            result.error = outcome.detail
+        elif isinstance(outcome, Exception):
+            result.error = "Internal error while processing the file."
+        else:
+            assignment_text, estimate = outcome
+            rows.append({
+                "title": titles[index] if titles else os.path.splitext(file.filename or "")[0] or "Untitled",
+                "subject": subject,
+                "estimated_minutes": int(estimate.outcome),
+                "estimate_source": estimate.source,
+                "estimate_features": estimate.features_json(),
+                "source_text": assignment_text,
+                "owner_id": current_user.id,
+            })
+            estimates.append(estimate)
+        results.append(result)
+
+    if rows:
+        created = iter((await db.scalars(
+            insert(models.Assignment).returning(models.Assignment, sort_by_parameter_order=True), rows
+        )).all())
+        for result in results:
+            if result.error is None:
+                result.assignment = schemas.Assignment.model_validate(next(created))
+        created_ids = [result.assignment.id for result in results if result.assignment]
+        await crud.record_changes(db, current_user.id, crud.ASSIGNMENT, created_ids)
+        await db.commit()
+        for estimate, assignment_id in zip(estimates, created_ids):
+            estimator.refine_later(estimate, assignment_id)
+    return {"results": results}
+
+
+# --- Background ingestion jobs ---
+@router.post("/assignments/jobs", response_model=schemas.Job, status_code=202)
+async def create_assignment_job(
+    title: str = Form(...),
+    subject: str = Form(...),
+    file: UploadFile = File(...),
+    custom_instructions: Optional[str] = Form(None),
+    current_user: models.User = Depends(get_current_user)
+):
+    if not jobs.queue.has_capacity():
+        raise HTTPException(status_code=503, detail="Too many uploads are being processed. Please try again shortly.", headers={"Retry-After": "30"})
+
+    # Spooled straight into the job directory, so submitting is a rename
+    upload = await uploads.spool(file, directory=jobs.queue.upload_dir)
+    try:
+        return await jobs.queue.submit(
+            owner_id=current_user.id,
+            title=title,
+            subject=subject,
+            upload=upload,
+            custom_instructions=custom_instructions,
+        )
+    except jobs.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many uploads are being processed. Please try again shortly.", headers={"Retry-After": "30"})
+
+async def get_owned_job(job_id: str, current_user: models.User, db: AsyncSession) -> models.Job:
+    job = await db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to view this job")
+    return job
+
+@router.get("/assignments/jobs/{job_id}", response_model=schemas.Job)
+async def get_assignment_job(job_id: str, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return await get_owned_job(job_id, current_user, db)
+
+@router.get("/assignments/jobs/{job_id}/events")
+async def stream_assignment_job(job_id: str, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    Streams the job's progress as Server-Sent Events, one event per stage,
+    until the job succeeds or fails.
+    """
+    # Subscribe before reading the current state so no update is missed in between
+    updates = jobs.queue.subscribe(job_id)
+    try:
+        job = await get_owned_job(job_id, current_user, db)
+    except HTTPException:
+        jobs.queue.unsubscribe(job_id, updates)
+        raise
+    first_event = jobs.job_event(job)
+    # The stream may stay open for minutes; it must not hold a pooled connection
+    await db.close()
+
+    async def event_stream():
+        try:
+            event = first_event
+            while True:
+                yield f"data: {json.dumps(event)}\n\n"
+                if event["status"] in jobs.FINISHED:
+                    return
+                previous, event = event, None
+                while event is None:
+                    try:
+                        event = await asyncio.wait_for(updates.get(), timeout=15)
+                    except asyncio.TimeoutError:
+                        # Jobs run by another worker process are not pushed here; read the row instead
+                        async with SessionLocal() as session:
+                            job = await session.get(models.Job, job_id)
+                        if job is not None and jobs.job_event(job) != previous:
+                            event = jobs.job_event(job)
+                        else:
+                            yield ": keep-alive\n\n"
+        finally:
+            jobs.queue.unsubscribe(job_id, updates)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,250 @@
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from cache import LRUCache
+
+
+# --- Interval index ---
+class IntervalIndex:
+    """
+    Busy intervals of one user, kept sorted by start time.
+
+    Lookups bisect to the first interval that can overlap the query window
+    (nothing starts earlier than `start - longest interval`), so finding the
+    free time in a window costs O(log n + k) instead of checking every pair.
+    Inserting or removing a single interval keeps the index up to date
+    without a reload.
+    """
+
+    def __init__(self, intervals: Dict[int, Tuple[datetime, datetime]] = None):
+        self._by_id: Dict[int, Tuple[datetime, datetime]] = {}
+        self._sorted: List[Tuple[datetime, datetime, int]] = []
+        self._max_span = timedelta(0)
+        for key, (start, end) in (intervals or {}).items():
+            self._by_id[key] = (start, end)
+            self._max_span = max(self._max_span, end - start)
+        self._sorted = sorted((start, end, key) for key, (start, end) in self._by_id.items())
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def get(self, key: int) -> Optional[Tuple[datetime, datetime]]:
+        return self._by_id.get(key)
+
+    def upsert(self, key: int, start: datetime, end: datetime):
+        self.remove(key)
+        self._by_id[key] = (start, end)
+        insort(self._sorted, (start, end, key))
+        # Only ever grows; a stale upper bound just widens the scan slightly
+        self._max_span = max(self._max_span, end - start)
+
+    def remove(self, key: int):
+        interval = self._by_id.pop(key, None)
+        if interval is not None:
+            i = bisect_left(self._sorted, (interval[0], interval[1], key))
+            del self._sorted[i]
+
+    def overlapping(self, start: datetime, end: datetime) -> Iterator[Tuple[datetime, datetime]]:
+        """Yields the intervals overlapping [start, end) in start order."""
+        i = bisect_left(self._sorted, (start - self._max_span,))
+        stop = bisect_right(self._sorted, (end,))
+        for s, e, _ in self._sorted[i:stop]:
+            if e > start and s < end:
+                yield s, e
+
+    def free_slots(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Returns the gaps in [start, end) not covered by any interval."""
+        slots = []
+        cursor = start
+        for s, e in self.overlapping(start, end):
+            if s > cursor:
+                slots.append((cursor, s))
+            cursor = max(cursor, e)
+            if cursor >= end:
+                break
+        if cursor < end:
+            slots.append((cursor, end))
+        return slots
+
+
+# --- Planning ---
+@dataclass(frozen=True)
+class Task:
+    assignment_id: int
+    title: str
+    subject: Optional[str]
+    minutes: int
+    priority: Optional[int] = None  # 1 is the most important
+    due: Optional[datetime] = None
+
+
+@dataclass(frozen=True)
+class Session:
+    assignment_id: int
+    title: str
+    subject: Optional[str]
+    start: datetime
+    end: datetime
+
+
+@dataclass(frozen=True)
+class Settings:
+    start: datetime
+    end: datetime
+    day_start_hour: int = 8
+    day_end_hour: int = 22
+    min_session_minutes: int = 25
+    max_session_minutes: int = 90
+    break_minutes: int = 10
+
+
+@dataclass
+class Plan:
+    sessions: List[Session] = field(default_factory=list)
+    # assignment_id -> minutes that did not fit before the due date or window end
+    unscheduled: Dict[int, int] = field(default_factory=dict)
+
+
+def _task_order(task: Task):
+    return (task.due or datetime.max, task.priority or 6, task.assignment_id)
+
+
+def _working_windows(settings: Settings, start: datetime) -> Iterator[Tuple[datetime, datetime]]:
+    day = start.date()
+    while True:
+        window_start = max(datetime.combine(day, time(settings.day_start_hour)), start)
+        window_end = min(datetime.combine(day, time(0)) + timedelta(hours=settings.day_end_hour), settings.end)
+        if window_start >= settings.end:
+            return
+        if window_start < window_end:
+            yield window_start, window_end
+        day += timedelta(days=1)
+
+
+def plan(index: IntervalIndex, tasks: List[Task], settings: Settings,
+         keep: List[Session] = (), start: Optional[datetime] = None) -> Plan:
+    """
+    Packs work sessions for `tasks` into the free time of `index`, earliest
+    due date first, then by priority.
+
+    `keep` holds sessions already placed before `start`; their minutes count
+    toward their tasks and planning resumes from `start`.
+    """
+    start = max(start or settings.start, settings.start)
+    remaining = {task.assignment_id: task.minutes for task in tasks}
+    for session in keep:
+        remaining[session.assignment_id] = remaining.get(session.assignment_id, 0) - int(
+            (session.end - session.start).total_seconds() // 60
+        )
+    queue = sorted((task for task in tasks if remaining[task.assignment_id] > 0), key=_task_order)
+    result = Plan(sessions=list(keep))
+    min_session = timedelta(minutes=settings.min_session_minutes)
+    gap = timedelta(minutes=settings.break_minutes)
+
+    for window_start, window_end in _working_windows(settings, start):
+        if not queue:
+            break
+        for slot_start, slot_end in index.free_slots(window_start, window_end):
+            cursor = slot_start
+            while queue and slot_end - cursor >= min_session:
+                # Drop tasks whose due date has already passed
+                while queue and queue[0].due is not None and queue[0].due - cursor < min_session:
+                    task = queue.pop(0)
+                    result.unscheduled[task.assignment_id] = remaining[task.assignment_id]
+                if not queue:
+                    break
+                task = queue[0]
+                session_end = min(
+                    slot_end,
+                    cursor + timedelta(minutes=min(remaining[task.assignment_id], settings.max_session_minutes)),
+                    task.due or datetime.max,
+                )
+                result.sessions.append(Session(task.assignment_id, task.title, task.subject, cursor, session_end))
+                remaining[task.assignment_id] -= int((session_end - cursor).total_seconds() // 60)
+                if remaining[task.assignment_id] <= 0:
+                    queue.pop(0)
+                cursor = session_end + gap
+
+    for task in queue:
+        result.unscheduled[task.assignment_id] = remaining[task.assignment_id]
+    return result
+
+
+class Planner:
+    """
+    Per-user planning state: the busy-interval index plus the last plan.
+    When a single busy interval changes, only the sessions from that point
+    onwards are re-placed.
+    """
+
+    def __init__(self, index: IntervalIndex, horizon: Optional[Tuple[datetime, datetime]] = None, version: int = 0):
+        self.index = index
+        # Window the index is complete for; recurring events are only expanded within it
+        self.horizon = horizon
+        # Change-log seq of the user's events the index is up to date with
+        self.version = version
+        # Events written in this process since `version` and already applied with busy_changed
+        self.applied: Set[int] = set()
+        self._last: Optional[Tuple[tuple, Settings, Plan]] = None
+        self._dirty_from: Optional[datetime] = None
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        return self.horizon is None or (self.horizon[0] <= start and end <= self.horizon[1])
+
+    def catch_up(self, version: int, changed: Set[int]) -> bool:
+        """
+        Moves the planner to `version` if the events changed since its own
+        version were all applied here. Returns False when it must be rebuilt.
+        """
+        if not changed <= self.applied:
+            return False
+        self.version = version
+        self.applied.clear()
+        return True
+
+    def busy_changed(self, key: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """Updates one busy interval; pass no times to remove it."""
+        previous = self.index.get(key)
+        if start is None:
+            self.index.remove(key)
+        else:
+            self.index.upsert(key, start, end)
+        # The plan is still valid up to the earliest of the old and new start
+        times = [t for t in (start, previous[0] if previous else None) if t is not None]
+        if times:
+            self._dirty_from = min(times + ([self._dirty_from] if self._dirty_from else []))
+
+    def plan(self, tasks: List[Task], settings: Settings) -> Plan:
+        signature = tuple(sorted((t.assignment_id, t.minutes, t.priority, t.due) for t in tasks))
+        if self._last is not None and self._last[:2] == (signature, settings):
+            previous = self._last[2]
+            if self._dirty_from is None:
+                return previous
+            keep = [s for s in previous.sessions if s.end <= self._dirty_from]
+            # Resume right after the kept sessions, as a full plan would, so free time before the change is still used
+            resume = keep[-1].end + timedelta(minutes=settings.break_minutes) if keep else settings.start
+            result = plan(self.index, tasks, settings, keep=keep, start=resume)
+        else:
+            result = plan(self.index, tasks, settings)
+        self._last = (signature, settings, result)
+        self._dirty_from = None
+        return result
+
+
+# Planners of recently active users. Writes from other processes are caught by
+# comparing each planner's version with the change log before it is used.
+planners = LRUCache("planners", max_entries=1024)
+
+
+def event_changed(owner_id: str, event_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Keeps a cached planner in sync with a single event write; pass no times for a delete."""
+    planner = planners.get(owner_id)
+    if planner is not None:
+        planner.busy_changed(event_id, start, end)
+        planner.applied.add(event_id)
+
+
+def invalidate(owner_id: str):
+    planners.delete(owner_id)
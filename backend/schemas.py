@@ -1,8 +1,11 @@
-from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, Field, EmailStr
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Literal, Optional, List
+from pydantic import BaseModel, Field, EmailStr, field_validator, model_validator
 from enum import Enum
 
+import recurrence
+
 
 class EventType(str, Enum):
     SCHOOL_TASK = "school_task"
@@ -10,6 +13,44 @@ class EventType(str, Enum):
 
 
 
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Converts an aware datetime to naive UTC, the form every stored time is in,
+    so "2025-03-01T09:00Z" and "2025-03-01T10:00+01:00" compare equal to the
+    generated occurrence starts. Naive values are taken to be UTC already.
+    """
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _naive_utc_list(values: Optional[List[datetime]]) -> Optional[List[datetime]]:
+    return [naive_utc(value) for value in values] if values is not None else None
+
+
+# Longest an event may last. Windowed event queries only look this far back for
+# events overlapping the window, which bounds their index range scan.
+EVENTS_MAX_SPAN_DAYS = int(os.getenv("EVENTS_MAX_SPAN_DAYS", "31"))
+
+
+def check_span(start: Optional[datetime], end: Optional[datetime]):
+    """Raises ValueError if an event from `start` to `end` lasts longer than EVENTS_MAX_SPAN_DAYS."""
+    if start is not None and end is not None and end - start > timedelta(days=EVENTS_MAX_SPAN_DAYS):
+        raise ValueError(f"An event may last at most {EVENTS_MAX_SPAN_DAYS} days")
+
+
+def _check_span(event):
+    check_span(event.start_datetime, event.end_datetime)
+    return event
+
+
+def _check_rrule(value: Optional[str]) -> Optional[str]:
+    if value:
+        recurrence.parse_rule(value)
+        return value.strip()
+    return None
+
+
 # Model for creating an event, owner_id will be added by the backend
 class EventBase(BaseModel):
     title: str
@@ -21,9 +62,18 @@ class EventBase(BaseModel):
     description: Optional[str] = None
     estimated_minutes: Optional[int] = None
     status: Optional[str] = None
+    # RFC 5545 recurrence rule, e.g. "FREQ=WEEKLY;BYDAY=MO,WE"; start/end are then the first occurrence
+    rrule: Optional[str] = None
+    # Starts of occurrences removed from the series
+    exdates: Optional[List[datetime]] = None
+
+    _rrule = field_validator("rrule")(_check_rrule)
+    _times = field_validator("start_datetime", "end_datetime")(naive_utc)
+    _exdates = field_validator("exdates")(_naive_utc_list)
 
 class EventCreate(EventBase):
-    pass
+    # Only on input: events stored before the limit existed must still serialize
+    _span = model_validator(mode="after")(_check_span)
 
 # Model for updating an event, all fields are optional
 class EventUpdate(BaseModel):
@@ -35,22 +85,59 @@ class EventUpdate(BaseModel):
     description: Optional[str] = None
     estimated_minutes: Optional[int] = None
     status: Optional[str] = None
+    rrule: Optional[str] = None
+    exdates: Optional[List[datetime]] = None
+
+    _rrule = field_validator("rrule")(_check_rrule)
+    _times = field_validator("start_datetime", "end_datetime")(naive_utc)
+    _exdates = field_validator("exdates")(_naive_utc_list)
+    # Updates giving one end only are checked against the stored event in crud
+    _span = model_validator(mode="after")(_check_span)
 
 # Full Event Model including fields generated by the backend
 class Event(EventBase):
     id: int
     owner_id: str
+    assignment_id: Optional[int] = None
+    # Set on single occurrences of a recurring series: expanded ones carry the
+    # series' id, edited ones their own. `original_start` identifies the occurrence.
+    series_id: Optional[int] = None
+    original_start: Optional[datetime] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+# One operation of a bulk event request. `data` is validated as an
+# EventCreate or EventUpdate depending on `op`; deletes only need `id`.
+class EventBulkOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None
+    data: Optional[Dict[str, Any]] = None
+
+class EventBulkRequest(BaseModel):
+    operations: List[EventBulkOperation]
+
+class EventBulkResult(BaseModel):
+    index: int
+    op: str
+    id: Optional[int] = None
+    status_code: int
+    error: Optional[str] = None
+
+class EventBulkResponse(BaseModel):
+    results: List[EventBulkResult]
+
 
 class AssignmentBase(BaseModel):
     title: str
     subject: str
     estimated_minutes: int
+    priority: Optional[int] = Field(None, ge=1, le=5)
+    due_datetime: Optional[datetime] = None
+
+    _due = field_validator("due_datetime")(naive_utc)
 
 class CreateAssignment(AssignmentBase):
     pass
@@ -59,10 +146,15 @@ class UpdateAssignment(BaseModel):
     title: Optional[str]
     subject: Optional[str]
     estimated_minutes: Optional[int]
+    priority: Optional[int] = Field(None, ge=1, le=5)
+    due_datetime: Optional[datetime] = None
+
+    _due = field_validator("due_datetime")(naive_utc)
 
 class Assignment(AssignmentBase):
     id: int
     owner_id: str
+    estimate_source: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -70,6 +162,84 @@ class Assignment(AssignmentBase):
         from_attributes = True
 
 
+class SyncResponse(BaseModel):
+    cursor: int
+    # A full snapshot that replaces the client's state instead of a delta
+    reset: bool = False
+    events: List[Event]
+    assignments: List[Assignment]
+    deleted_events: List[int]
+    deleted_assignments: List[int]
+
+
+class ScheduleRequest(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    day_start_hour: int = Field(8, ge=0, le=23)
+    day_end_hour: int = Field(22, ge=1, le=24)
+    min_session_minutes: int = Field(25, ge=5)
+    max_session_minutes: int = Field(90, ge=5)
+    break_minutes: int = Field(10, ge=0)
+    # Replace the planned work sessions in the window with this plan
+    commit: bool = False
+
+    _window = field_validator("start", "end")(naive_utc)
+
+    @model_validator(mode="after")
+    def _working_day(self):
+        if self.day_end_hour <= self.day_start_hour:
+            raise ValueError("day_end_hour must be later than day_start_hour")
+        return self
+
+class ScheduledSession(BaseModel):
+    assignment_id: int
+    title: str
+    subject: Optional[str] = None
+    start_datetime: datetime
+    end_datetime: datetime
+
+class UnscheduledAssignment(BaseModel):
+    assignment_id: int
+    remaining_minutes: int
+
+class SchedulePlan(BaseModel):
+    sessions: List[ScheduledSession]
+    unscheduled: List[UnscheduledAssignment]
+
+
+class SearchResult(BaseModel):
+    entity: Literal["assignment", "event"]
+    id: int
+    title: str
+    # Best matching passage of the body with the matched words in [brackets]
+    snippet: str
+    score: float
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    next_offset: Optional[int] = None
+
+
+class BatchUploadResult(BaseModel):
+    filename: str
+    assignment: Optional[Assignment] = None
+    error: Optional[str] = None
 
+class BatchUploadResponse(BaseModel):
+    results: List[BatchUploadResult]
 
 
+class Job(BaseModel):
+    id: str
+    owner_id: str
+    status: str
+    stage: Optional[str] = None
+    title: str
+    subject: Optional[str] = None
+    assignment_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
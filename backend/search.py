@@ -0,0 +1,153 @@
+import re
+from typing import List, Optional
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+# Rowids interleave the two sources so a trigger can find a document without scanning the index
+ASSIGNMENT_ROWID = "{id} * 2"
+EVENT_ROWID = "{id} * 2 + 1"
+# Column weights for bm25(): a match in the title counts ten times one in the body; owner_id is only a filter
+RANK = "bm25(search_index, 0.0, 10.0, 1.0)"
+SNIPPET_TOKENS = 12
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+# --- Index ---
+def _sync_triggers(table: str, entity: str, rowid: str, title: str, body: str, columns: str) -> List[str]:
+    def row(prefix: str) -> str:
+        return (
+            f"INSERT INTO search_index (rowid, owner_id, title, body, entity, entity_id) VALUES "
+            f"({rowid.format(id=prefix + '.id')}, {prefix}.owner_id, {title.format(row=prefix)}, "
+            f"{body.format(row=prefix)}, '{entity}', {prefix}.id);"
+        )
+
+    delete = f"DELETE FROM search_index WHERE rowid = {rowid.format(id='old.id')};"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN {row('new')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {columns} ON {table} BEGIN {delete} {row('new')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END",
+    ]
+
+
+_ASSIGNMENT = dict(
+    table="assignments", entity="assignment", rowid=ASSIGNMENT_ROWID,
+    title="{row}.title", body="coalesce({row}.subject, '') || char(10) || coalesce({row}.source_text, '')",
+    columns="title, subject, source_text, owner_id",
+)
+_EVENT = dict(
+    table="events", entity="event", rowid=EVENT_ROWID,
+    title="{row}.title", body="coalesce({row}.subject, '') || char(10) || coalesce({row}.description, '')",
+    columns="title, subject, description, owner_id",
+)
+
+
+def create_index(conn):
+    """
+    Creates the SQLite FTS5 index over assignment titles, subjects and source
+    text and event titles, subjects and descriptions, plus the triggers that
+    keep it in step with every insert, update and delete, however the row was
+    written. A new index is filled from the existing rows. Idempotent.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    exists = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'search_index'").scalar()
+    # "_" joins owner ids such as user_123 into one token so the owner filter matches exactly.
+    # Prefix indexes keep search-as-you-type queries ("mit*") from scanning every matching term.
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "owner_id, title, body, entity UNINDEXED, entity_id UNINDEXED, "
+        "tokenize = \"porter unicode61 remove_diacritics 2 tokenchars '_'\", prefix = '2 3 4')"
+    )
+    for source in (_ASSIGNMENT, _EVENT):
+        for statement in _sync_triggers(**source):
+            conn.exec_driver_sql(statement)
+        if not exists:
+            conn.exec_driver_sql(
+                f"INSERT INTO search_index (rowid, owner_id, title, body, entity, entity_id) "
+                f"SELECT {source['rowid'].format(id='id')}, owner_id, {source['title'].format(row=source['table'])}, "
+                f"{source['body'].format(row=source['table'])}, '{source['entity']}', id FROM {source['table']}"
+            )
+
+
+# --- Queries ---
+def match_expression(owner_id: str, query: str) -> Optional[str]:
+    """
+    Turns free text into an FTS5 query restricted to one owner: every word
+    must match, the last one also as a prefix so results appear while typing.
+    Quoting each word keeps FTS5 operators in user input from being parsed.
+    Returns None if the text has no words.
+    """
+    terms = _TERM.findall(query)
+    if not terms:
+        return None
+    words = " ".join(f'"{term}"' for term in terms) + "*"
+    owner = owner_id.replace('"', '""')
+    return f'owner_id : "{owner}" AND ({words})'
+
+
+async def search(
+    db: AsyncSession,
+    owner_id: str,
+    query: str,
+    entity: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> List[dict]:
+    """
+    Ranks a user's assignments and events against `query`, best first.
+
+    Args:
+        db: The SQLAlchemy database session.
+        owner_id: The user whose documents to search.
+        query: Free text; every word has to match.
+        entity: Only "assignment" or "event" results, if given.
+        limit: Maximum number of results.
+        offset: Results to skip, for paging.
+
+    Returns:
+        Dicts with entity, id, title, snippet and score (lower is better).
+    """
+    if db.bind.dialect.name != "sqlite":
+        return await _search_unindexed(db, owner_id, query, entity, limit, offset)
+    match = match_expression(owner_id, query)
+    if match is None:
+        return []
+    rows = await db.execute(
+        text(
+            "SELECT entity, entity_id, title, "
+            f"snippet(search_index, 2, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet, {RANK} AS score "
+            "FROM search_index WHERE search_index MATCH :match"
+            + (" AND entity = :entity" if entity else "")
+            + " ORDER BY score LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "entity": entity, "limit": limit, "offset": offset},
+    )
+    return [
+        {"entity": row.entity, "id": row.entity_id, "title": row.title, "snippet": row.snippet.strip(), "score": row.score}
+        for row in rows
+    ]
+
+
+async def _search_unindexed(db: AsyncSession, owner_id: str, query: str, entity: Optional[str], limit: int, offset: int) -> List[dict]:
+    """Substring search for databases without FTS5, newest first; no ranking."""
+    terms = _TERM.findall(query)
+    if not terms:
+        return []
+    sources = [
+        ("assignment", models.Assignment, (models.Assignment.title, models.Assignment.subject, models.Assignment.source_text)),
+        ("event", models.Event, (models.Event.title, models.Event.subject, models.Event.description)),
+    ]
+    results = []
+    for name, model, columns in sources:
+        if entity and entity != name:
+            continue
+        conditions = [or_(*(column.ilike(f"%{term}%") for column in columns)) for term in terms]
+        rows = await db.execute(
+            select(model.id, model.title).where(model.owner_id == owner_id, *conditions)
+            .order_by(model.id.desc()).limit(offset + limit)
+        )
+        results += [{"entity": name, "id": row.id, "title": row.title, "snippet": "", "score": 0.0} for row in rows]
+    return results[offset:offset + limit]
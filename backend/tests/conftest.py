@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# The app reads its settings at import time, so the test database is chosen before anything is imported
+_DATA_DIR = tempfile.mkdtemp(prefix="syncora-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_DATA_DIR, 'test.db')}"
+os.environ["JOB_UPLOAD_DIR"] = os.path.join(_DATA_DIR, "uploads")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("APP_JWT_SECRET", "test-jwt-secret")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+import models
+import routes
+from database import Base, SessionLocal, engine
+from migrations import run_migrations
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(engine)
+        await engine.dispose()
+
+    asyncio.run(create())
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    async with SessionLocal() as session:
+        yield session
+    # Pooled connections belong to this test's event loop
+    await engine.dispose()
+
+
+@pytest.fixture
+async def user(db):
+    sub = uuid.uuid4().hex
+    user = models.User(id=f"user_{sub}", email=f"{sub}@example.com", google_sub=sub)
+    db.add(user)
+    await db.commit()
+    return user
+
+
+@pytest.fixture
+async def client(user):
+    """The API router, signed in as `user`."""
+    app = FastAPI()
+    app.include_router(routes.router)
+    app.dependency_overrides[routes.get_current_user] = lambda: user
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
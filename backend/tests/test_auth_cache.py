@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+import auth_cache
+import routes
+
+pytestmark = pytest.mark.anyio
+
+
+def make_token(user_id: str, expires_in: float = 3600, secret: str = None) -> str:
+    payload = {"user_id": user_id, "exp": int(time.time() + expires_in)}
+    return jwt.encode(payload, secret or routes.JWT_SECRET, algorithm=routes.JWT_ALG)
+
+
+async def test_repeat_requests_are_served_from_the_cache(db, user):
+    token = make_token(user.id)
+    token_hits, user_hits = auth_cache.tokens.hits, auth_cache.users.hits
+    assert (await routes.get_current_user(token=token, db=db)).id == user.id
+    assert (await routes.get_current_user(token=token, db=db)).id == user.id
+    assert auth_cache.tokens.hits == token_hits + 1
+    assert auth_cache.users.hits == user_hits + 1
+
+
+async def test_token_entry_expires_with_the_token(db, user):
+    token = make_token(user.id, expires_in=1)
+    await routes.get_current_user(token=token, db=db)
+    assert auth_cache.get_token_payload(token, routes.JWT_SECRET) is not None
+    # jwt.decode compares whole seconds
+    await asyncio.sleep(2.1)
+    assert auth_cache.get_token_payload(token, routes.JWT_SECRET) is None
+    with pytest.raises(HTTPException) as error:
+        await routes.get_current_user(token=token, db=db)
+    assert error.value.status_code == 401
+
+
+async def test_user_entry_expires_after_ttl(db, user, monkeypatch):
+    monkeypatch.setattr(auth_cache.users, "ttl", 0.05)
+    auth_cache.set_user(user)
+    assert auth_cache.get_user(user.id) is user
+    await asyncio.sleep(0.1)
+    assert auth_cache.get_user(user.id) is None
+
+
+async def test_deleted_user_is_rejected_at_once(db, user):
+    token = make_token(user.id)
+    await routes.get_current_user(token=token, db=db)
+    await db.delete(user)
+    await db.commit()
+    assert auth_cache.get_user(user.id) is None
+    with pytest.raises(HTTPException) as error:
+        await routes.get_current_user(token=token, db=db)
+    assert error.value.status_code == 401
+
+
+async def test_changed_user_is_reloaded(db, user):
+    token = make_token(user.id)
+    await routes.get_current_user(token=token, db=db)
+    user.email = f"new-{user.email}"
+    await db.commit()
+    assert (await routes.get_current_user(token=token, db=db)).email == user.email
+
+
+async def test_changed_secret_rejects_cached_tokens(db, user, monkeypatch):
+    token = make_token(user.id)
+    await routes.get_current_user(token=token, db=db)
+    monkeypatch.setattr(routes, "JWT_SECRET", "rotated-secret")
+    with pytest.raises(HTTPException) as error:
+        await routes.get_current_user(token=token, db=db)
+    assert error.value.status_code == 401
+
+
+async def test_invalidated_token_is_verified_again(db, user):
+    token = make_token(user.id)
+    await routes.get_current_user(token=token, db=db)
+    auth_cache.invalidate_token(token, routes.JWT_SECRET)
+    assert auth_cache.get_token_payload(token, routes.JWT_SECRET) is None
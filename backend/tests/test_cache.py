@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, func, select, update
+
+import cache
+import models
+from database import engine
+
+pytestmark = pytest.mark.anyio
+
+
+async def accessed_at(db, store, key):
+    entry = await db.get(models.CacheEntry, (store.namespace, key), populate_existing=True)
+    return entry.accessed_at
+
+
+async def test_hits_only_write_access_time_once_it_is_stale(db):
+    store = cache.PersistentCache("test-touch")
+    await store.set("key", "value")
+    stored = await accessed_at(db, store, "key")
+
+    updates = []
+
+    def count_updates(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE cache_entries"):
+            updates.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_updates)
+    try:
+        assert await store.get("key") == "value"
+        assert await store.get("key") == "value"
+        assert updates == []
+        assert await accessed_at(db, store, "key") == stored
+
+        stale = datetime.utcnow() - timedelta(seconds=cache.CACHE_TOUCH_INTERVAL + 60)
+        await db.execute(update(models.CacheEntry).where(models.CacheEntry.namespace == store.namespace).values(accessed_at=stale))
+        await db.commit()
+        updates.clear()
+        assert await store.get("key") == "value"
+        assert len(updates) == 1
+        assert await accessed_at(db, store, "key") > stale
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count_updates)
+    assert store.stats()["hits"] == 3
+
+
+async def test_writes_do_not_count_the_namespace_every_time(db):
+    store = cache.PersistentCache("test-prune", max_rows=100)
+    counts = []
+
+    def count_selects(conn, cursor, statement, *args):
+        if statement.startswith("SELECT count(*)") and "cache_entries" in statement:
+            counts.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_selects)
+    try:
+        for i in range(300):
+            await store.set(f"key-{i}", "value")
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count_selects)
+
+    rows = await db.scalar(select(func.count()).select_from(models.CacheEntry).where(models.CacheEntry.namespace == store.namespace))
+    assert rows <= store.max_rows
+    assert len(counts) <= 300 // store.batch + 1
+    assert await store.get("key-299") == "value"
+    assert await store.get("key-0") is None
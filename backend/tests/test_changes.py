@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy import create_engine, delete, select
+
+import crud
+import migrations
+import models
+
+pytestmark = pytest.mark.anyio
+
+EVENT = {
+    "title": "Lab",
+    "start_datetime": "2025-03-03T09:00:00Z",
+    "end_datetime": "2025-03-03T10:00:00Z",
+    "event_type": "general_event",
+}
+
+
+async def test_seq_stays_monotonic_after_newest_changes_are_deleted(db, user):
+    await crud.record_changes(db, user.id, crud.EVENT, [1, 2])
+    await db.commit()
+    latest = await crud.collection_version(db, user.id)
+
+    # Replacing the newest row deletes it before the new one is inserted
+    await crud.record_changes(db, user.id, crud.EVENT, [2], crud.DELETE)
+    await db.commit()
+    replaced = await crud.collection_version(db, user.id)
+    assert replaced > latest
+
+    await db.execute(delete(models.Change).where(models.Change.seq == replaced))
+    await crud.record_changes(db, user.id, crud.EVENT, [3])
+    await db.commit()
+    assert await crud.collection_version(db, user.id) > replaced
+
+
+async def test_client_at_newest_cursor_sees_the_delete(client):
+    event = (await client.post("/events", json=EVENT)).json()
+    cursor = (await client.get("/sync")).json()["cursor"]
+
+    assert (await client.delete(f"/events/{event['id']}")).status_code == 200
+
+    delta = (await client.get("/sync", params={"cursor": cursor})).json()
+    assert delta["cursor"] > cursor
+    assert delta["deleted_events"] == [event["id"]]
+
+
+def test_migration_rebuilds_change_log_with_autoincrement():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE changes (seq INTEGER PRIMARY KEY, owner_id VARCHAR NOT NULL, entity VARCHAR NOT NULL, "
+            "entity_id INTEGER NOT NULL, op VARCHAR NOT NULL, changed_at DATETIME)"
+        )
+        conn.exec_driver_sql("INSERT INTO changes (seq, owner_id, entity, entity_id, op) VALUES (7, 'u', 'event', 1, 'upsert')")
+        migrations._changes_autoincrement(conn)
+        migrations._changes_autoincrement(conn)
+
+        table_sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'changes'").scalar()
+        assert "AUTOINCREMENT" in table_sql.upper()
+        assert conn.execute(select(models.Change.seq, models.Change.entity_id)).all() == [(7, 1)]
+
+
+async def test_snapshots_are_marked_reset_and_deltas_are_not(client):
+    first = (await client.post("/events", json=EVENT)).json()
+    snapshot = (await client.get("/sync", params={"cursor": 0})).json()
+    assert snapshot["reset"] is True
+    assert [event["id"] for event in snapshot["events"]] == [first["id"]]
+
+    second = (await client.post("/events", json=EVENT)).json()
+    delta = (await client.get("/sync", params={"cursor": snapshot["cursor"]})).json()
+    assert delta["reset"] is False
+    assert [event["id"] for event in delta["events"]] == [second["id"]]
+
+
+async def test_cursor_past_the_change_log_gets_a_reset_snapshot(client):
+    event = (await client.post("/events", json=EVENT)).json()
+    latest = (await client.get("/sync")).json()["cursor"]
+
+    # e.g. a cursor kept by a client across a restore of an older database
+    stale = (await client.get("/sync", params={"cursor": latest + 100})).json()
+    assert stale["reset"] is True
+    assert stale["cursor"] == latest
+    assert [e["id"] for e in stale["events"]] == [event["id"]]
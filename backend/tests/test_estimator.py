@@ -0,0 +1,66 @@
+import pytest
+
+import estimator
+
+
+def page(number, total, questions):
+    lines = ["Chem 101 Worksheet", f"Problem {number}"]
+    lines += [f"{number}.{i} {question}" for i, question in enumerate(questions, 1)]
+    return "\n".join(lines + ["Show your work.", f"Page {number} of {total}"])
+
+
+def test_running_header_and_page_footer_are_stripped_but_numbered_problems_stay():
+    questions = ["Balance the equation.", "Name the products.", "Find the limiting reagent.", "Compute the yield."]
+    text = "\f".join(page(n, 3, questions) for n in range(1, 4))
+
+    lines = estimator.clean_text(text).splitlines()
+
+    assert [line for line in lines if line.startswith("Problem")] == ["Problem 1", "Problem 2", "Problem 3"]
+    assert lines.count("Chem 101 Worksheet") == 1
+    assert [line for line in lines if line.startswith("Page")] == ["Page 1 of 3"]
+    # Numbered lines next to the footer differ from page to page, so they are content
+    assert [line for line in lines if line.endswith("Compute the yield.")] == ["1.4 Compute the yield.", "2.4 Compute the yield.", "3.4 Compute the yield."]
+
+
+def test_bare_page_numbers_are_stripped():
+    questions = ["Read the passage.", "Summarize it.", "List three claims.", "Rebut one claim.", "Cite a source.", "Revise."]
+    text = "\f".join(
+        "\n".join(["English 9", *(f"Q{n}.{i} {question}" for i, question in enumerate(questions, 1)), f"- {n} -"])
+        for n in range(1, 4)
+    )
+
+    lines = estimator.clean_text(text).splitlines()
+
+    assert lines.count("English 9") == 1
+    assert [line for line in lines if line.startswith("-")] == ["- 1 -"]
+    assert sum(1 for line in lines if line.startswith("Q")) == 3 * len(questions)
+
+
+def test_short_pages_are_left_alone():
+    text = "\f".join(f"Problem {n}\nSolve for x.\nShow your work." for n in range(1, 4))
+
+    lines = estimator.clean_text(text).splitlines()
+
+    assert [line for line in lines if line.startswith("Problem")] == ["Problem 1", "Problem 2", "Problem 3"]
+    assert lines.count("Solve for x.") == 3
+
+
+async def hybrid_estimate(monkeypatch, response):
+    async def model(assignment_text, custom_instructions="", owner_id=None, shed=True):
+        return response
+
+    monkeypatch.setattr(estimator, "estimate_assignment_time", model)
+    monkeypatch.setattr(estimator, "local_estimate", lambda text, subject="": estimator.Estimate("40", estimator.SOURCE_LOCAL))
+    return await estimator.estimate("Worksheet", mode="hybrid")
+
+
+@pytest.mark.anyio
+async def test_hybrid_uses_a_timely_model_answer(monkeypatch):
+    result = await hybrid_estimate(monkeypatch, "55")
+    assert (result.outcome, result.source) == ("55", estimator.SOURCE_LLM)
+
+
+@pytest.mark.anyio
+async def test_hybrid_falls_back_when_the_model_answer_does_not_parse(monkeypatch):
+    result = await hybrid_estimate(monkeypatch, "Roughly an hour, depending on the student.")
+    assert (result.outcome, result.source) == ("40", estimator.SOURCE_LOCAL)
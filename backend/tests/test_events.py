@@ -0,0 +1,36 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+TRIP = {
+    "title": "Exchange trip",
+    "start_datetime": "2025-03-01T00:00:00Z",
+    "end_datetime": "2025-03-30T00:00:00Z",
+    "event_type": "general_event",
+}
+
+
+async def test_long_event_is_found_by_a_window_near_its_end(client):
+    created = await client.post("/events", json=TRIP)
+    assert created.status_code == 200
+
+    response = await client.get("/events", params={"start": "2025-03-28T00:00:00Z", "end": "2025-03-29T00:00:00Z"})
+    assert [event["id"] for event in response.json()] == [created.json()["id"]]
+
+
+async def test_events_longer_than_the_span_limit_are_rejected(client):
+    too_long = {**TRIP, "end_datetime": "2025-04-15T00:00:00Z"}
+    assert (await client.post("/events", json=too_long)).status_code == 422
+
+    event = (await client.post("/events", json=TRIP)).json()
+    # Only the end changes: checked against the stored start
+    stretched = await client.put(f"/events/{event['id']}", json={"end_datetime": "2025-04-15T00:00:00Z"})
+    assert stretched.status_code == 422
+    assert (await client.get(f"/events/{event['id']}")).json()["end_datetime"] == "2025-03-30T00:00:00"
+
+    bulk = await client.post("/events/bulk", json={"operations": [
+        {"op": "create", "data": too_long},
+        {"op": "update", "id": event["id"], "data": {"start_datetime": "2025-02-01T00:00:00Z"}},
+        {"op": "update", "id": event["id"], "data": {"title": "Trip"}},
+    ]})
+    assert [result["status_code"] for result in bulk.json()["results"]] == [422, 422, 200]
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import jobs
+import models
+import routes
+import uploads
+from database import SessionLocal, engine
+
+pytestmark = pytest.mark.anyio
+
+
+async def add_job(db, user, status=jobs.QUEUED) -> models.Job:
+    job = models.Job(id=uuid.uuid4().hex, owner_id=user.id, status=status, title="Worksheet", content_type="image/png")
+    db.add(job)
+    await db.commit()
+    return job
+
+
+async def test_progress_stream_releases_its_connection(db, user):
+    job = await add_job(db, user)
+    async with SessionLocal() as session:
+        response = await routes.stream_assignment_job(job.id, user, session)
+        first = await response.body_iterator.__anext__()
+        assert '"status": "queued"' in first
+        # Only the test's own session may hold a connection while the stream is open
+        assert engine.pool.checkedout() == 0
+        await response.body_iterator.aclose()
+
+
+async def spooled_upload(tmp_path) -> uploads.StoredUpload:
+    path = tmp_path / uuid.uuid4().hex
+    path.write_bytes(b"\x89PNG\r\n\x1a\n")
+    return uploads.StoredUpload(path=str(path), content_type="image/png", size=8, sha256="0" * 64)
+
+
+async def test_submit_rejected_after_persisting_leaves_nothing_behind(db, user, tmp_path, monkeypatch):
+    queue = jobs.JobQueue(workers=0, max_size=1, upload_dir=str(tmp_path / "jobs"))
+    await queue.start()
+    try:
+        # Another submission takes the last slot while this one's file is being moved
+        monkeypatch.setattr(queue._queue, "put_nowait", lambda job_id: (_ for _ in ()).throw(asyncio.QueueFull()))
+        with pytest.raises(jobs.QueueFull):
+            await queue.submit(user.id, "Worksheet", "Math", await spooled_upload(tmp_path))
+    finally:
+        await queue.stop()
+    assert (await db.scalars(select(models.Job).where(models.Job.owner_id == user.id))).all() == []
+    assert os.listdir(queue.upload_dir) == []
+
+
+async def test_each_job_runs_in_one_process_only(db, user, tmp_path, monkeypatch):
+    # Two server processes starting up against the same table
+    queues = [jobs.JobQueue(workers=2, upload_dir=str(tmp_path / "jobs")) for _ in range(2)]
+    job_ids = {(await add_job(db, user)).id for _ in range(6)}
+    runs = []
+
+    async def run(self, job):
+        runs.append((self.worker_id, job.id))
+        await self._update(job.id, status=jobs.SUCCEEDED, stage=None)
+
+    monkeypatch.setattr(jobs.JobQueue, "_run", run)
+    for queue in queues:
+        await queue.start()
+    try:
+        for _ in range(100):
+            if job_ids <= {job_id for _, job_id in runs}:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        for queue in queues:
+            await queue.stop()
+    mine = [job_id for _, job_id in runs if job_id in job_ids]
+    assert sorted(mine) == sorted(job_ids)
+
+
+async def test_recovery_requeues_only_stale_running_jobs(db, user, tmp_path):
+    stale = await add_job(db, user, status=jobs.RUNNING)
+    fresh = await add_job(db, user, status=jobs.RUNNING)
+    stale.updated_at = datetime.utcnow() - timedelta(seconds=jobs.JOB_STALE_AFTER + 60)
+    await db.commit()
+
+    queue = jobs.JobQueue(workers=0, upload_dir=str(tmp_path / "jobs"))
+    queue._queue = asyncio.Queue()
+    await queue._recover()
+    await db.refresh(stale)
+    await db.refresh(fresh)
+    assert stale.status == jobs.QUEUED and stale.id in queue._queued
+    assert fresh.status == jobs.RUNNING and fresh.id not in queue._queued
+
+
+async def test_worker_survives_a_failing_job(db, user, tmp_path, monkeypatch):
+    broken, healthy = await add_job(db, user), await add_job(db, user)
+    runs = []
+    process = jobs.JobQueue._process
+
+    async def flaky_process(self, job):
+        if job.id == broken.id:
+            raise RuntimeError("database is locked")
+        runs.append(job.id)
+        await process(self, job)
+
+    async def run(self, job):
+        await self._update(job.id, status=jobs.SUCCEEDED, stage=None)
+
+    monkeypatch.setattr(jobs.JobQueue, "_process", flaky_process)
+    monkeypatch.setattr(jobs.JobQueue, "_run", run)
+    queue = jobs.JobQueue(workers=1, upload_dir=str(tmp_path / "jobs"))
+    await queue.start()
+    try:
+        for _ in range(100):
+            await db.refresh(healthy)
+            if healthy.status == jobs.SUCCEEDED:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await queue.stop()
+    await db.refresh(broken)
+    assert [job_id for job_id in runs if job_id == broken.id or job_id == healthy.id] == [healthy.id]
+    assert healthy.status == jobs.SUCCEEDED
+    assert broken.status == jobs.FAILED
+
+
+async def test_long_running_job_is_not_taken_for_stale(db, user, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_STALE_AFTER", 2)
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_INTERVAL", 0.2)
+    job = await add_job(db, user)
+    runs = []
+
+    async def slow_run(self, queued):
+        if queued.id == job.id:
+            # e.g. a long PDF, or waiting for OCR capacity without being shed
+            runs.append(queued.id)
+            await asyncio.sleep(3.5)
+        await self._update(queued.id, status=jobs.SUCCEEDED, stage=None)
+
+    monkeypatch.setattr(jobs.JobQueue, "_run", slow_run)
+    queue = jobs.JobQueue(workers=2, upload_dir=str(tmp_path / "jobs"))
+    await queue.start()
+    try:
+        for _ in range(45):
+            await asyncio.sleep(0.1)
+            await queue._recover()
+        await db.refresh(job)
+    finally:
+        await queue.stop()
+    assert runs == [job.id]
+    assert job.status == jobs.SUCCEEDED
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import LLM
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "How long?"}]
+
+
+def completion(content="45"):
+    return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+
+def client_for(handler, **kwargs) -> LLM.LLMClient:
+    return LLM.LLMClient(base_url="http://llm.test", api_key="test", transport=httpx.MockTransport(handler), **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(LLM, "LLM_BACKOFF_BASE", 0.01)
+
+
+async def test_rate_limited_call_waits_for_retry_after():
+    calls = []
+
+    async def handler(request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.3"})
+        return completion()
+
+    client = client_for(handler)
+    assert await client.chat("model", MESSAGES) == "45"
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.3
+    assert client.retries == 1
+    await client.aclose()
+
+
+async def test_timed_out_call_is_retried():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ReadTimeout("timed out", request=request)
+        return completion("30")
+
+    client = client_for(handler)
+    assert await client.chat("model", MESSAGES, timeout=1) == "30"
+    assert len(calls) == 2
+    await client.aclose()
+
+
+async def test_backing_off_call_does_not_hold_a_slot():
+    rate_limited = []
+
+    async def handler(request):
+        if b'"slow"' in request.content and not rate_limited:
+            rate_limited.append(request)
+            return httpx.Response(429, headers={"Retry-After": "1"})
+        return completion()
+
+    client = client_for(handler, max_concurrency=1)
+    slow = asyncio.ensure_future(client.chat("slow", MESSAGES))
+    await asyncio.sleep(0.05)
+    started = time.monotonic()
+    # Gets the only slot while the other call sleeps off its Retry-After
+    assert await client.chat("fast", MESSAGES) == "45"
+    assert time.monotonic() - started < 0.5
+    assert await slow == "45"
+    await client.aclose()
+
+
+async def test_identical_prompts_share_one_upstream_call():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return completion()
+
+    client = client_for(handler)
+    results = await asyncio.gather(*(client.chat("model", MESSAGES) for _ in range(5)))
+    assert results == ["45"] * 5
+    assert len(calls) == 1 and client.coalesced == 4
+    await client.aclose()
@@ -0,0 +1,36 @@
+import pytest
+
+import admission
+import routes
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_metrics_need_the_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(routes, "METRICS_TOKEN", None)
+    assert (await client.get("/metrics")).status_code == 404
+    assert (await client.get("/cache/stats")).status_code == 404
+
+    monkeypatch.setattr(routes, "METRICS_TOKEN", "scrape-secret")
+    # Signed in as a user is not enough
+    assert (await client.get("/metrics")).status_code == 401
+    assert (await client.get("/cache/stats", headers={"Authorization": "Bearer wrong"})).status_code == 401
+
+    headers = {"Authorization": "Bearer scrape-secret"}
+    assert (await client.get("/metrics", headers=headers)).status_code == 200
+    assert (await client.get("/cache/stats", headers=headers)).status_code == 200
+
+
+async def test_admission_series_carry_no_user_ids(client, user, monkeypatch):
+    monkeypatch.setattr(routes, "METRICS_TOKEN", "scrape-secret")
+    limiter = admission.Limiter("metrics-test", budget=10, user_rate=1, user_burst=5, seconds_per_unit=0.01, max_wait=0.5)
+    async with limiter.admit(user.id, 2):
+        pass
+    with pytest.raises(admission.Shed):
+        async with limiter.admit(user.id, 50):
+            pass
+
+    body = (await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})).text
+    assert 'syncora_admission_cost_total{resource="metrics-test"} 2' in body
+    assert 'syncora_admission_shed_total{resource="metrics-test",reason="user"} 1' in body
+    assert user.id not in body
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pytest
+
+import schemas
+
+pytestmark = pytest.mark.anyio
+
+SERIES = {
+    "title": "Standup",
+    "start_datetime": "2025-03-03T09:00:00Z",
+    "end_datetime": "2025-03-03T09:15:00Z",
+    "event_type": "general_event",
+    "rrule": "FREQ=DAILY;COUNT=5",
+}
+
+
+def test_aware_times_become_naive_utc():
+    event = schemas.EventCreate(**{**SERIES, "end_datetime": "2025-03-03T10:15:00+01:00", "exdates": ["2025-03-04T10:00:00+01:00"]})
+    assert event.start_datetime == datetime(2025, 3, 3, 9, 0)
+    assert event.end_datetime == datetime(2025, 3, 3, 9, 15)
+    assert event.exdates == [datetime(2025, 3, 4, 9, 0)]
+    assert schemas.EventUpdate(start_datetime="2025-03-03T09:00:00-05:00").start_datetime == datetime(2025, 3, 3, 14, 0)
+
+
+async def test_window_with_utc_suffix_expands_series(client):
+    created = await client.post("/events", json={**SERIES, "exdates": ["2025-03-04T09:00:00Z"]})
+    assert created.status_code == 200
+
+    response = await client.get("/events", params={"start": "2025-03-01T00:00:00Z", "end": "2025-03-10T00:00:00Z"})
+    assert response.status_code == 200
+    starts = [event["start_datetime"] for event in response.json()]
+    # Day two is excluded by an exdate given with a "Z" suffix
+    assert starts == ["2025-03-03T09:00:00", "2025-03-05T09:00:00", "2025-03-06T09:00:00", "2025-03-07T09:00:00"]
+
+
+async def test_occurrence_routes_accept_utc_suffix(client):
+    series = (await client.post("/events", json=SERIES)).json()
+
+    edited = await client.put(
+        f"/events/{series['id']}/occurrences/2025-03-05T09:00:00Z", json={"title": "Retro"}
+    )
+    assert edited.status_code == 200
+    assert edited.json()["original_start"] == "2025-03-05T09:00:00"
+
+    # The same occurrence in another offset
+    deleted = await client.delete(f"/events/{series['id']}/occurrences/2025-03-06T10:00:00+01:00")
+    assert deleted.status_code == 200
+
+    response = await client.get("/events", params={"start": "2025-03-01T00:00:00Z", "end": "2025-03-10T00:00:00Z"})
+    titles = {event["start_datetime"]: event["title"] for event in response.json()}
+    assert titles["2025-03-05T09:00:00"] == "Retro"
+    assert "2025-03-06T09:00:00" not in titles
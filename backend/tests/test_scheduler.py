@@ -0,0 +1,120 @@
+from datetime import datetime
+
+import pytest
+
+import crud
+import models
+import scheduler
+
+pytestmark = pytest.mark.anyio
+
+WINDOW = {"start": "2025-03-03T08:00:00Z", "end": "2025-03-03T22:00:00Z"}
+
+
+def busy(start_hour, end_hour):
+    return {
+        "title": "Busy",
+        "start_datetime": f"2025-03-03T{start_hour:02}:00:00Z",
+        "end_datetime": f"2025-03-03T{end_hour:02}:00:00Z",
+        "event_type": "general_event",
+    }
+
+
+async def first_session(client):
+    response = await client.post("/schedule", json=WINDOW)
+    assert response.status_code == 200
+    return response.json()["sessions"][0]["start_datetime"]
+
+
+async def test_planner_is_rebuilt_after_event_writes_from_another_process(client, db, user):
+    db.add(models.Assignment(title="Essay", estimated_minutes=60, owner_id=user.id))
+    await db.commit()
+    assert await first_session(client) == "2025-03-03T08:00:00"
+    planner = scheduler.planners.get(user.id)
+
+    # Written through this process: applied to the cached planner in place
+    assert (await client.post("/events", json=busy(8, 12))).status_code == 200
+    assert await first_session(client) == "2025-03-03T12:00:00"
+    assert scheduler.planners.get(user.id) is planner
+
+    # Written by another worker: only the change log knows about it
+    event = models.Event(
+        title="Busy", start_datetime=datetime(2025, 3, 3, 12), end_datetime=datetime(2025, 3, 3, 18),
+        event_type="general_event", owner_id=user.id,
+    )
+    db.add(event)
+    await db.flush()
+    await crud.record_changes(db, user.id, crud.EVENT, [event.id])
+    await db.commit()
+
+    assert await first_session(client) == "2025-03-03T18:00:00"
+    assert scheduler.planners.get(user.id) is not planner
+
+
+def at(hour, minute=0, day=3):
+    return datetime(2025, 3, day, hour, minute)
+
+
+DAY = scheduler.Settings(start=at(8), end=at(22), break_minutes=10)
+
+
+def test_free_slots_skip_overlapping_busy_intervals():
+    index = scheduler.IntervalIndex({1: (at(9), at(10)), 2: (at(9, 30), at(11)), 3: (at(13), at(14))})
+    assert index.free_slots(at(8), at(15)) == [(at(8), at(9)), (at(11), at(13)), (at(14), at(15))]
+
+    index.remove(2)
+    index.upsert(3, at(12), at(12, 30))
+    assert index.free_slots(at(8), at(15)) == [(at(8), at(9)), (at(10), at(12)), (at(12, 30), at(15))]
+
+
+def test_sessions_fill_free_time_around_busy_intervals():
+    index = scheduler.IntervalIndex({1: (at(8, 30), at(12)), 2: (at(13), at(17))})
+    result = scheduler.plan(index, [scheduler.Task(1, "Essay", "English", 150)], DAY)
+
+    # 08:00-08:30 is free, then 12:00-13:00, then the evening in sessions of at most 90 minutes
+    assert [(s.start, s.end) for s in result.sessions] == [
+        (at(8), at(8, 30)), (at(12), at(13)), (at(17), at(18)),
+    ]
+    assert result.unscheduled == {}
+
+
+def test_earliest_deadline_goes_first_and_sessions_stop_at_the_deadline():
+    tasks = [
+        scheduler.Task(1, "Reading", None, 60, due=at(12, day=4)),
+        scheduler.Task(2, "Lab report", None, 120, due=at(9)),
+        scheduler.Task(3, "Project", None, 60, priority=1),
+    ]
+    result = scheduler.plan(scheduler.IntervalIndex(), tasks, DAY)
+
+    first = result.sessions[0]
+    assert (first.assignment_id, first.start, first.end) == (2, at(8), at(9))
+    # The lab report's remaining hour did not fit before it was due
+    assert result.unscheduled == {2: 60}
+    assert [s.assignment_id for s in result.sessions[1:]] == [1, 3]
+
+
+def test_replanning_after_a_busy_change_matches_a_full_plan():
+    busy = {1: (at(10), at(11)), 2: (at(15), at(16))}
+    tasks = [scheduler.Task(1, "Essay", None, 240), scheduler.Task(2, "Problem set", None, 120, due=at(12, day=4))]
+    planner = scheduler.Planner(scheduler.IntervalIndex(dict(busy)))
+    planner.plan(tasks, DAY)
+
+    planner.busy_changed(2, at(14), at(17))
+    busy[2] = (at(14), at(17))
+    assert planner.plan(tasks, DAY) == scheduler.plan(scheduler.IntervalIndex(busy), tasks, DAY)
+
+
+async def test_working_day_must_end_after_it_starts(client):
+    response = await client.post("/schedule", json={**WINDOW, "day_start_hour": 18, "day_end_hour": 9})
+    assert response.status_code == 422
+
+
+async def test_aware_due_dates_are_planned_in_utc(client):
+    created = await client.post("/assignments", json={
+        "title": "Quiz prep", "subject": "Math", "estimated_minutes": 60, "due_datetime": "2025-03-03T10:00:00+01:00",
+    })
+    assert created.json()["due_datetime"] == "2025-03-03T09:00:00"
+
+    sessions = (await client.post("/schedule", json=WINDOW)).json()["sessions"]
+    quiz = [s for s in sessions if s["assignment_id"] == created.json()["id"]]
+    assert [(s["start_datetime"], s["end_datetime"]) for s in quiz] == [("2025-03-03T08:00:00", "2025-03-03T09:00:00")]
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from ocr import PDF_TYPE
+
+load_dotenv()
+
+# Largest accepted file, in bytes.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+# Largest accepted multipart request body; batch uploads carry several files.
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(100 * 1024 * 1024)))
+# Uploads are copied to disk this many bytes at a time, which bounds the memory one upload holds.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Where spooled uploads are written; defaults to the system temp directory.
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+# File signatures of the accepted formats; the client's Content-Type is not trusted
+MAGIC_NUMBERS = (
+    (b"%PDF-", PDF_TYPE),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+)
+INVALID_FORMAT = "Invalid file format. Only JPEG, PNG, or PDF allowed."
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """Returns the content type matching the first bytes of a file, if it is an accepted format."""
+    for magic, content_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+    return None
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    content_type: str
+    size: int
+    sha256: str
+    filename: Optional[str] = None
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File is too large. The limit is {max_bytes / (1024 * 1024):g} MB.")
+
+
+async def spool(file: UploadFile, directory: Optional[str] = UPLOAD_TMP_DIR, max_bytes: int = UPLOAD_MAX_BYTES) -> StoredUpload:
+    """
+    Copies an upload to a file of its own in `directory`, one chunk at a time,
+    hashing it on the way. The format is taken from the file's magic bytes and
+    checked on the first chunk, so rejected files are never copied in full.
+
+    Raises:
+        HTTPException: 400 for unsupported formats, 413 past `max_bytes`.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    head = await file.read(UPLOAD_CHUNK_SIZE)
+    content_type = sniff(head)
+    if content_type is None:
+        raise HTTPException(status_code=400, detail=INVALID_FORMAT)
+
+    fd, path = tempfile.mkstemp(prefix="upload-", dir=directory)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(max_bytes)
+                digest.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        os.remove(path)
+        raise
+    return StoredUpload(path=path, content_type=content_type, size=size, sha256=digest.hexdigest(), filename=file.filename)
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects multipart bodies larger than `max_bytes` with 413 before the form
+    parser spools them: up front from Content-Length, or as soon as a chunked
+    body runs past the limit.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    # Ends parsing; whatever error response the app produces is replaced below
+                    raise ValueError("Request body too large")
+            return message
+
+        rejected = False
+
+        async def guarded_send(message):
+            nonlocal rejected
+            if not exceeded:
+                await send(message)
+            elif not rejected:
+                rejected = True
+                await self._reject(send)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except ValueError:
+            if not exceeded:
+                raise
+            if not rejected:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Request is too large. The limit is {self.max_bytes / (1024 * 1024):g} MB."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})